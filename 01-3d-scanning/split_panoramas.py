@@ -0,0 +1,88 @@
+"""
+Split Panoramas into Perspective Views for 3D Reconstruction
+=============================================================
+
+Turns a capture session of equirectangular panoramas into the pinhole
+photos that COLMAP, Polycam, Postshot or RealityCapture expect:
+
+  1. Cuts every panorama into views at each yaw × pitch combination,
+     sharing one sampling grid across all same-size panoramas
+  2. Splits several panoramas at once, writing each JPEG as soon as it is
+     encoded — one folder per view direction
+  3. Writes rig_config.json and cameras.txt with the exact intrinsics and
+     relative rotations of the views, for COLMAP's rig support (3.12+)
+
+If the run is interrupted, rerun the same command: panoramas whose views
+all exist are skipped.
+
+Usage
+-----
+  # 18 views per panorama: 6 yaws × 3 pitches at 90° FOV
+  python split_panoramas.py my_panoramas/ perspective_views/
+
+  # 3 wide views on the horizon (Polycam's 300-image limit)
+  python split_panoramas.py my_panoramas/ polycam_views/ --yaw 0 120 240 --pitch 0 --fov 120
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pano_utils.view_export import export_views, rig_perspectives
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Split equirectangular panoramas into perspective views with a COLMAP rig."
+    )
+    parser.add_argument("source", help="Directory of panoramas or manifest file")
+    parser.add_argument("output", help="Output directory (one folder per view)")
+    parser.add_argument(
+        "--yaw",
+        type=float,
+        nargs="+",
+        default=[0, 60, 120, 180, 240, 300],
+        help="Yaw angles in degrees, clockwise from the panorama center",
+    )
+    parser.add_argument(
+        "--pitch",
+        type=float,
+        nargs="+",
+        default=[30, 0, -30],
+        help="Pitch angles in degrees above the horizon",
+    )
+    parser.add_argument("--fov", type=float, default=90)
+    parser.add_argument("--size", type=int, default=1000, help="Width and height of each view")
+    parser.add_argument("--quality", type=int, default=90, help="JPEG quality")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--no-resume", action="store_true", help="Rewrite existing views")
+    args = parser.parse_args()
+
+    perspectives = rig_perspectives(args.yaw, args.pitch, args.fov, args.size)
+    print(f"{len(perspectives)} views per panorama, {args.workers} worker(s) → {args.output}")
+
+    def report(record):
+        print(f"  {record['image']} — {record['views']} views ({record['elapsed']:.1f}s)")
+
+    stats = export_views(
+        args.source,
+        args.output,
+        perspectives,
+        workers=args.workers,
+        quality=args.quality,
+        resume=not args.no_resume,
+        on_panorama=report,
+    )
+
+    print(
+        f"\nDone: {stats['images']} images from {stats['panoramas']} panoramas "
+        f"in {stats['seconds']:.1f}s ({stats['skipped']} already split), "
+        f"{stats['bytes'] / 1e6:.0f} MB"
+    )
+    print(f"COLMAP rig: {os.path.join(args.output, 'rig_config.json')}")
+
+
+if __name__ == "__main__":
+    main()
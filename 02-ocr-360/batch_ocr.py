@@ -0,0 +1,158 @@
+"""
+Batch OCR on Thousands of Panoramas
+====================================
+
+ocr_demo.py processes one panorama at a time. For a crawl of thousands of
+panoramas (e.g. downloaded with Chapter 4), this script:
+
+  1. Takes a directory of panoramas or a manifest (one path per line, or
+     JSONL lines with an "image" key)
+  2. Fans them out over a process pool — each worker loads the OCR engine once
+  3. Streams results into a single append-only JSONL file as they finish,
+     one line per panorama with its status
+
+If the run is interrupted, rerun the same command: panoramas that already
+have an "ok" line are skipped. A manifest next to the output records the
+image hash and the engine / view settings behind each line, so panoramas
+that changed on disk, or a run with another engine, engine version or
+--fov/--resolution/--overlap, are processed again.
+
+Usage
+-----
+  python batch_ocr.py assets/ --output assets/batch-ocr.jsonl
+  python batch_ocr.py manifest.txt --workers 8 --engine rapidocr
+
+Prerequisites
+-------------
+  macOS:         pip install "panoocr[macocr]"
+  Windows/Linux: pip install "panoocr[paddleocr]"
+"""
+
+import argparse
+import os
+import platform
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pano_utils.batch import find_panoramas, run_batch
+from pano_utils.manifest import pipeline_config
+
+ENGINES = {
+    "macocr": "MacOCREngine",
+    "paddleocr": "PaddleOCREngine",
+    "easyocr": "EasyOCREngine",
+    "rapidocr": "RapidOCREngine",
+}
+
+# Set once per worker process by init_worker().
+_pano_ocr = None
+_remap_cache = None
+
+
+def default_engine() -> str:
+    """MacOCR on macOS (Apple Vision Framework), PaddleOCR elsewhere."""
+    return "macocr" if platform.system() == "Darwin" else "paddleocr"
+
+
+def init_worker(engine_name, fov, resolution, overlap, remap_cache_dir):
+    """Load the OCR engine once for this worker process."""
+    global _pano_ocr, _remap_cache
+
+    import cv2
+    import panoocr.engines
+    from panoocr import PanoOCR
+    from panoocr.image.perspectives import generate_perspectives
+
+    from pano_utils.projection import RemapCache
+
+    # Parallelism comes from the process pool; keep OpenCV single-threaded.
+    cv2.setNumThreads(1)
+
+    engine = getattr(panoocr.engines, ENGINES[engine_name])()
+    perspectives = generate_perspectives(fov=fov, resolution=resolution, overlap=overlap)
+    _pano_ocr = PanoOCR(engine, perspectives=perspectives)
+    _remap_cache = RemapCache(cache_dir=remap_cache_dir)
+
+
+def run_config(engine_name, fov, resolution, overlap):
+    """Pipeline configuration of a run, for the reprocessing manifest."""
+    import panoocr.engines
+    from panoocr.image.perspectives import generate_perspectives
+
+    return pipeline_config(
+        getattr(panoocr.engines, ENGINES[engine_name]),
+        generate_perspectives(fov=fov, resolution=resolution, overlap=overlap),
+    )
+
+
+def process_image(image_path):
+    """Run OCR on one panorama and return the result as a dict."""
+    from pano_utils.pipeline import recognize_panorama
+
+    result = recognize_panorama(
+        _pano_ocr, image_path, cache=_remap_cache, show_progress=False, workers=1
+    )
+    return result.to_dict()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run PanoOCR on a directory or manifest of panoramas."
+    )
+    parser.add_argument("source", help="Directory of panoramas or manifest file")
+    parser.add_argument("--output", default="batch-ocr.jsonl", help="JSONL output")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default=default_engine())
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--fov", type=float, default=90)
+    parser.add_argument("--resolution", type=int, default=2000)
+    parser.add_argument("--overlap", type=float, default=0.5)
+    parser.add_argument(
+        "--remap-cache-dir",
+        default=os.environ.get("PANO_REMAP_CACHE_DIR"),
+        help="Share projection remap tables between workers through this directory",
+    )
+    parser.add_argument(
+        "--no-resume", action="store_true", help="Reprocess images already in --output"
+    )
+    args = parser.parse_args()
+
+    images = find_panoramas(args.source)
+    print(f"Found {len(images)} panoramas in {args.source}")
+    print(f"Using {args.engine} on {args.workers} worker(s) → {args.output}")
+
+    def report(record):
+        status = "ok   " if record["status"] == "ok" else "ERROR"
+        detail = (
+            f"{len(record['result']['results'])} detections"
+            if record["status"] == "ok"
+            else record["error"]
+        )
+        print(f"  [{status}] {record['image']} ({record['elapsed']:.1f}s) — {detail}")
+
+    counts = run_batch(
+        images,
+        args.output,
+        process_image,
+        init_worker=init_worker,
+        init_args=(
+            args.engine,
+            args.fov,
+            args.resolution,
+            args.overlap,
+            args.remap_cache_dir,
+        ),
+        workers=args.workers,
+        resume=not args.no_resume,
+        on_record=report,
+        config=run_config(args.engine, args.fov, args.resolution, args.overlap),
+    )
+
+    print(
+        f"\nDone: {counts['ok']} ok, {counts['error']} failed, "
+        f"{counts['skipped']} already up to date"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -24,10 +24,13 @@ Prerequisites
 
 import os
 import platform
+import sys
 
-from PIL import Image
 import matplotlib.pyplot as plt
 
+# Make the shared pano_utils helpers importable when run from this directory.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
 # ---------------------------------------------------------------------------
 # 1. Configuration
 # ---------------------------------------------------------------------------
@@ -36,11 +39,13 @@ PANORAMAS = [
     {
         "image": "assets/cambridge-central-square-pano.jpg",
         "json": "assets/cambridge-central-square-ocr.json",
+        "tiles": "assets/cambridge-central-square-tiles",
         "label": "Cambridge Central Square — Graffiti Alley & H-Mart",
     },
     {
         "image": "assets/bushwick-test-pano.jpg",
         "json": "assets/bushwick-test-ocr.json",
+        "tiles": "assets/bushwick-test-tiles",
         "label": "Bushwick, Brooklyn — Elevated Train & Storefronts",
     },
 ]
@@ -63,13 +68,47 @@ else:
 
 # ---------------------------------------------------------------------------
 # 3. Set up PanoOCR with 90° FOV, 2000px perspective views
+#    Views are projected through a remap-table cache: the spherical sampling
+#    grid for each view is built once per panorama size and reused for every
+#    panorama after that. Set PANO_REMAP_CACHE_DIR to keep the tables on disk
+#    between runs.
+#
+#    Set PRUNE = True to have a ViewPruner score every view on a small copy
+#    of the panorama first and skip the empty ones (sky, blank walls, bare
+#    ground) before the full-resolution projection and OCR. It is faster, but
+#    a small sign on a plain wall can score as empty and be missed, so the
+#    demo reads every view by default. The per-view scores are kept on
+#    pruner.scores; lower the threshold if views with faint text get skipped.
+#
+#    Each panorama is opened as a Panorama handle: the size comes from the
+#    file header, a pruner gets a draft-mode (reduced) decode, OCR decodes
+#    only the band of rows the views cover, and the plot reuses a 2048 px copy.
+#
+#    A Manifest remembers the image hash and the engine / view / pruner
+#    settings behind each saved JSON. On a rerun with nothing changed, the
+#    saved results are loaded instead of running OCR again.
 # ---------------------------------------------------------------------------
 
-from panoocr import PanoOCR
+from panoocr import OCRResult, PanoOCR
 from panoocr.image.perspectives import generate_perspectives
 
+from pano_utils.label_tiles import export_label_tiles
+from pano_utils.manifest import Manifest, pipeline_config
+from pano_utils.panorama import Panorama
+from pano_utils.pipeline import recognize_panorama
+from pano_utils.view_pruning import ViewPruner
+
 perspectives = generate_perspectives(fov=90, resolution=2000, overlap=0.5)
 pano_ocr = PanoOCR(engine, perspectives=perspectives)
+PRUNE = False
+pruner = ViewPruner(method="edges") if PRUNE else None
+
+manifest = Manifest("assets/.ocr-manifest.jsonl")
+config = pipeline_config(
+    engine,
+    perspectives,
+    pruner={"method": pruner.method, "threshold": pruner.threshold, "width": pruner.width} if pruner else None,
+)
 
 # ---------------------------------------------------------------------------
 # 4. Process each panorama
@@ -88,12 +127,26 @@ for pano in PANORAMAS:
         print(f"  Skipping — image not found: {image_path}")
         continue
 
-    # Load image
-    img = Image.open(image_path)
-    print(f"Image size: {img.size[0]} x {img.size[1]}")
-
-    # Run OCR
-    result = pano_ocr.recognize(image_path)
+    # Open image (reads the header only)
+    panorama = Panorama(image_path)
+    print(f"Image size: {panorama.width} x {panorama.height}")
+
+    # Run OCR, unless the saved results are from this image and these settings
+    if manifest.is_current(json_path, image_path, config):
+        result = OCRResult.load_json(json_path)
+        print(f"Up to date — loaded {json_path}")
+    else:
+        result = recognize_panorama(pano_ocr, panorama, pruner=pruner)
+        if pruner is not None:
+            print(f"Skipped {pruner.skipped} of {len(perspectives)} views as empty")
+        result.save_json(json_path)
+        manifest.record(json_path, image_path, config)
+        print(f"Results saved to {json_path}")
+
+    # Label tiles for the 3D preview (section 6), unless newer than the JSON
+    tiles_index = os.path.join(pano["tiles"], "index.json")
+    if not os.path.exists(tiles_index) or os.path.getmtime(tiles_index) < os.path.getmtime(json_path):
+        export_label_tiles(result, pano["tiles"])
     print(f"Found {len(result.results)} text detections")
 
     # Print top results
@@ -105,17 +158,13 @@ for pano in PANORAMAS:
         text_display = r.text[:28] + ".." if len(r.text) > 30 else r.text
         print(f"{text_display:<30} {r.yaw:>6.1f} {r.pitch:>6.1f} {r.confidence:>5.2f}")
 
-    # Save JSON
-    result.save_json(json_path)
-    print(f"\nResults saved to {json_path}")
-
     # Visualize
     yaws = [r.yaw for r in result.results]
     pitches = [r.pitch for r in result.results]
     confs = [r.confidence for r in result.results]
 
     fig, ax = plt.subplots(figsize=(16, 8))
-    ax.imshow(img, extent=[-180, 180, -90, 90], aspect="auto", alpha=0.5)
+    ax.imshow(panorama.resized(2048), extent=[-180, 180, -90, 90], aspect="auto", alpha=0.5)
     scatter = ax.scatter(yaws, pitches, c=confs, cmap="viridis", s=20, alpha=0.8)
     plt.colorbar(scatter, label="Confidence")
     ax.set_xlabel("Yaw (degrees)")
@@ -123,9 +172,31 @@ for pano in PANORAMAS:
     ax.set_title(f"OCR Detections — {label}")
     plt.tight_layout()
     plt.show()
+    print(f"Decoded {image_path} {panorama.decodes} time(s)")
 
 # ---------------------------------------------------------------------------
-# 5. Interactive 3D preview
+# 5. Coarse-to-fine OCR
+#    Most views are sky, road and blank wall. Read a 2048 px copy of the
+#    panorama first, then re-read only the regions where it found text at
+#    full resolution. For Street View, recognize_streetview() does the same
+#    with a zoom-2 download and only the zoom-4 tiles under the text.
+# ---------------------------------------------------------------------------
+
+from pano_utils.coarse_to_fine import ArrayTiles, recognize_coarse_to_fine
+
+image_path = PANORAMAS[0]["image"]
+if os.path.exists(image_path):
+    tiles = ArrayTiles(image_path)
+    fast_result, stats = recognize_coarse_to_fine(pano_ocr, tiles.downsample(2048), tiles)
+    ocr_pixels = stats["coarse_pixels"] + stats["fine_pixels"]
+    print(
+        f"\nCoarse-to-fine: {len(fast_result.results)} detections from "
+        f"{stats['regions']} text regions, OCR on {ocr_pixels:,} pixels "
+        f"({ocr_pixels / stats['exhaustive_pixels']:.0%} of the full run)"
+    )
+
+# ---------------------------------------------------------------------------
+# 6. Interactive 3D preview
 #    Open the preview tool to visualize OCR results on the panorama sphere:
 #
 #      cd preview
@@ -135,4 +206,11 @@ for pano in PANORAMAS:
 #    automatically from the assets/ directory.
 #
 #    You can also drag in different panorama images and JSON result files.
+#
+#    Section 4 also exports the results as level-of-detail label tiles
+#    (assets/*-tiles/), which the preview loads instead of the JSON: only
+#    the labels facing the camera at the current zoom are loaded, so it
+#    stays fast with thousands of detections. For other result files:
+#
+#      python -m pano_utils.label_tiles results.json results-tiles/
 # ---------------------------------------------------------------------------
@@ -0,0 +1,103 @@
+"""
+OCR on 360° Video and Interval Shots
+=====================================
+
+A walk recorded as 360° video, or with the camera's interval shooting mode
+(Chapter 0), is thousands of nearly identical frames. Instead of reading
+every frame, this script:
+
+  1. Streams frames from an equirectangular video (exported from Insta360
+     Studio) or a directory of frames, one at a time
+  2. Skips frames that barely differ from the last frame it read
+  3. Follows each detection from frame to frame on the sphere, and writes
+     every sign once, with the range of frames it was visible in
+
+Each line of the JSONL output is one sign:
+
+    {"key": "PIZZA", "first_frame": 30, "last_frame": 210, "first_time": 1.0,
+     "last_time": 7.0, "hits": 9, "yaw": 41.2, "pitch": 3.5, "detection": {...}}
+
+where "detection" is the best read of it, in the same format as ocr_demo.py.
+
+Usage
+-----
+  python stream_ocr.py walk.mp4 --every 15 --output walk-ocr.jsonl
+  python stream_ocr.py interval-frames/ --interval 2 --threshold 3
+
+Prerequisites
+-------------
+  macOS:         pip install "panoocr[macocr]"
+  Windows/Linux: pip install "panoocr[paddleocr]"
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from batch_ocr import ENGINES, default_engine
+from pano_utils.projection import RemapCache
+from pano_utils.streaming import FrameSkipper, OCRTracker, stream_ocr
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run PanoOCR on a 360° video or frame sequence, one result per sign."
+    )
+    parser.add_argument("source", help="Equirectangular video, frame directory or manifest")
+    parser.add_argument("--output", default="stream-ocr.jsonl", help="JSONL output, one sign per line")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default=default_engine())
+    parser.add_argument("--every", type=int, default=1, help="Consider every Nth frame")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between image frames")
+    parser.add_argument(
+        "--threshold", type=float, default=2.0, help="Skip frames that differ less than this (0-255)"
+    )
+    parser.add_argument("--match-angle", type=float, default=5.0, help="Degrees a sign may move per frame read")
+    parser.add_argument("--max-gap", type=int, default=3, help="Frames read before a lost sign is written")
+    parser.add_argument("--min-hits", type=int, default=1, help="Drop signs read in fewer frames")
+    parser.add_argument("--fov", type=float, default=90)
+    parser.add_argument("--resolution", type=int, default=2000)
+    parser.add_argument("--overlap", type=float, default=0.5)
+    args = parser.parse_args()
+
+    import panoocr.engines
+    from panoocr import PanoOCR
+    from panoocr.image.perspectives import generate_perspectives
+
+    engine = getattr(panoocr.engines, ENGINES[args.engine])()
+    perspectives = generate_perspectives(fov=args.fov, resolution=args.resolution, overlap=args.overlap)
+    pano_ocr = PanoOCR(engine, perspectives=perspectives)
+
+    skipper = FrameSkipper(threshold=args.threshold)
+    tracker = OCRTracker(match_angle=args.match_angle, max_gap=args.max_gap, min_hits=args.min_hits)
+    tracks = stream_ocr(
+        pano_ocr,
+        args.source,
+        every=args.every,
+        interval=args.interval,
+        skipper=skipper,
+        tracker=tracker,
+        cache=RemapCache(),
+    )
+
+    count = 0
+    with open(args.output, "w") as f:
+        for track in tracks:
+            f.write(json.dumps(track.to_dict()) + "\n")
+            f.flush()
+            count += 1
+            print(
+                f"  {track.key[:28]:<30} frames {track.first_frame}-{track.last_frame} "
+                f"({track.hits} reads) yaw {track.yaw:.1f} pitch {track.pitch:.1f}"
+            )
+
+    print(
+        f"\nDone: {count} signs from {skipper.processed} frames read "
+        f"({skipper.skipped} skipped as unchanged) → {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -22,11 +22,22 @@ Note: SAM 3 is large. GPU strongly recommended.
 """
 
 import os
+import sys
 
+import numpy as np
 from PIL import Image
 import matplotlib.pyplot as plt
 import panosam as ps
 
+# Make the shared pano_utils helpers importable when run from this directory.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pano_utils.manifest import Manifest, load_segmentation_json, pipeline_config
+from pano_utils.pipeline import segment_panorama
+from pano_utils.projection import project
+from pano_utils.rasterize import overlay_masks, rasterize_rle
+from pano_utils.sam_embeddings import EmbeddingCache
+
 # ---------------------------------------------------------------------------
 # 1. Configuration
 # ---------------------------------------------------------------------------
@@ -45,12 +56,14 @@ TEXT_PROMPT = "car"
 
 if not os.path.exists(SAMPLE_IMAGE):
     print("No sample image found. Downloading from Google Street View...")
-    from streetlevel import streetview
+    from pano_utils.gsv_cache import CachedStreetView
 
-    pano = streetview.find_panorama(42.3625, -71.0862)  # MIT Media Lab area
+    # Cached on disk, so deleting the sample doesn't mean downloading it again.
+    gsv = CachedStreetView()
+    pano = gsv.find_panorama(42.3625, -71.0862)  # MIT Media Lab area
     if pano:
         os.makedirs("assets", exist_ok=True)
-        streetview.download_panorama(pano, SAMPLE_IMAGE, zoom=4)
+        gsv.download_panorama(pano, SAMPLE_IMAGE, zoom=4)
         print(f"Downloaded panorama {pano.id}")
     else:
         raise FileNotFoundError(
@@ -80,16 +93,19 @@ plt.show()
 #      WIDEANGLE   90°    2500×2500     8
 #
 #    Custom perspectives: panosam.generate_perspectives()
+#
+#    Views are projected with pano_utils.projection, which caches each view's
+#    sampling grid so later panoramas of the same size skip rebuilding it.
 # ---------------------------------------------------------------------------
 
-pano_image = ps.PanoramaImage(panorama_id="sample", image=panorama)
+panorama_array = np.asarray(panorama.convert("RGB"))
 
 perspectives = ps.DEFAULT_IMAGE_PERSPECTIVES
 print(f"DEFAULT preset: {len(perspectives)} perspectives")
 for p in perspectives[:4]:
     print(
         f"  yaw={p.yaw_offset:6.1f}°, pitch={p.pitch_offset:5.1f}°, "
-        f"fov={p.horizontal_fov}°, res={p.width}×{p.height}"
+        f"fov={p.horizontal_fov}°, res={p.pixel_width}×{p.pixel_height}"
     )
 print(f"  ... and {len(perspectives) - 4} more")
 
@@ -98,8 +114,7 @@ sample_perspectives = perspectives[:6]
 
 fig, axes = plt.subplots(2, 3, figsize=(15, 10))
 for idx, p in enumerate(sample_perspectives):
-    persp_image = pano_image.generate_perspective_image(p)
-    pil_view = persp_image.get_perspective_image()
+    pil_view = Image.fromarray(project(panorama_array, p))
 
     ax = axes[idx // 3][idx % 3]
     ax.imshow(pil_view)
@@ -118,11 +133,26 @@ plt.show()
 #      3. Convert per-view masks to spherical coordinates
 #      4. Deduplicate overlapping detections across views
 #
+#    Each view's SAM 3 image embedding is kept in an on-disk cache
+#    (~/.cache/pano_utils/sam3-embeddings), so segmenting this panorama again
+#    with another prompt skips the expensive image encoder.
+#
+#    A Manifest remembers the image hash and the engine / view / prompt
+#    settings behind each saved JSON. On a rerun with nothing changed, the
+#    saved masks are loaded instead of segmenting again.
+#
 #    Prerequisites:
 #      - huggingface-cli login (accept the SAM 3 license)
 #      - GPU recommended
 # ---------------------------------------------------------------------------
 
+embeddings = EmbeddingCache()
+manifest = Manifest("assets/.segmentation-manifest.jsonl")
+output_path = "assets/segmentation_result.panosam.json"
+
+# WIDEANGLE preset: 8 views, fast. Use DEFAULT (16 views) for more coverage.
+VIEWS = ps.PerspectivePreset.WIDEANGLE
+
 print(f"\nSegmenting '{TEXT_PROMPT}' across the full panorama...")
 
 result = None
@@ -133,11 +163,30 @@ try:
     # Initialize the SAM3 engine (downloads model on first run)
     engine = SAM3Engine()
 
-    # WIDEANGLE preset: 8 views, fast. Use DEFAULT (16 views) for more coverage.
-    client = ps.PanoSAM(engine=engine, views=ps.PerspectivePreset.WIDEANGLE)
+    client = ps.PanoSAM(engine=engine, views=VIEWS)
+
+    # Everything that changes the masks, except the prompt
+    base_config = pipeline_config(
+        engine,
+        VIEWS,
+        ("transformers",),
+        options=client.default_options,
+        dedup=client.default_dedup,
+    )
 
-    # Segment — splits, runs SAM3, converts to spherical, and deduplicates
-    result = client.segment(panorama, prompt=TEXT_PROMPT)
+    # Segment — splits, runs SAM3, converts to spherical, and deduplicates —
+    # unless the saved results are from this image and these settings
+    config = {**base_config, "prompt": TEXT_PROMPT}
+    if manifest.is_current(output_path, SAMPLE_IMAGE, config):
+        result = load_segmentation_json(output_path)
+        print(f"Up to date — loaded {output_path}")
+    else:
+        result = segment_panorama(
+            client, panorama_array, prompt=TEXT_PROMPT, embedding_cache=embeddings
+        )
+        os.makedirs("assets", exist_ok=True)
+        result.save_json(output_path)
+        manifest.record(output_path, SAMPLE_IMAGE, config)
 
     print(f"Found {len(result.masks)} '{TEXT_PROMPT}' instance(s)\n")
     for i, mask in enumerate(result.masks):
@@ -159,10 +208,12 @@ except Exception as e:
 # 5. Visualize segmentation results
 #    PanoSAM returns masks in spherical coordinates (yaw/pitch degrees),
 #    so we can overlay them directly on the equirectangular panorama.
+#    overlay_masks rasterizes all masks in one pass, at any output width,
+#    and handles masks that cross the ±180° seam or surround a pole.
 # ---------------------------------------------------------------------------
 
 if result and len(result.masks) > 0:
-    viz = ps.visualize_sphere_masks(panorama, result.masks, alpha=0.5)
+    viz = overlay_masks(panorama, result.masks, alpha=0.5, width=4096)
 
     plt.figure(figsize=(20, 10))
     plt.imshow(viz)
@@ -184,25 +235,75 @@ else:
 # ---------------------------------------------------------------------------
 
 if result:
-    output_path = "assets/segmentation_result.panosam.json"
-    os.makedirs("assets", exist_ok=True)
-    result.save_json(output_path)
+    # Saved (and recorded in the manifest) in section 4
     print(f"\nSaved results to {output_path}")
     print("Open the PanoSAM preview tool and drag in this JSON + the panorama image:")
     print("  https://yz3440.github.io/panosam/")
 
+    # Pixel masks for training data or other tools: one COCO-style
+    # run-length encoding per mask at full panorama resolution.
+    rles = rasterize_rle(result.masks, width=panorama.width, height=panorama.height)
+    print(f"Encoded {len(rles)} mask(s) as RLE")
+
+# ---------------------------------------------------------------------------
+# 7. Several prompts at once
+#    Pass a list of prompts to segment them all in one pass: each view is
+#    projected and encoded once, and only SAM 3's lightweight decoder runs per
+#    prompt. The embeddings from section 4 come from the cache, so here not
+#    even one image-encoder pass is needed. Prompts whose saved results are
+#    up to date are loaded instead.
 # ---------------------------------------------------------------------------
-# 7. Multi-scale segmentation (optional)
+
+MORE_PROMPTS = ["sign", "tree", "window", "person"]
+
+if result is not None:
+    prompt_paths = {p: f"assets/segmentation_{p}.panosam.json" for p in MORE_PROMPTS}
+    configs = {p: {**base_config, "prompt": p} for p in MORE_PROMPTS}
+    stale = [
+        p for p in MORE_PROMPTS
+        if not manifest.is_current(prompt_paths[p], SAMPLE_IMAGE, configs[p])
+    ]
+    results = {}
+    if stale:
+        results = segment_panorama(
+            client, panorama_array, prompt=stale, embedding_cache=embeddings
+        )
+        for prompt, prompt_result in results.items():
+            prompt_result.save_json(prompt_paths[prompt])
+            manifest.record(prompt_paths[prompt], SAMPLE_IMAGE, configs[prompt])
+    print()
+    for prompt in MORE_PROMPTS:
+        if prompt in results:
+            prompt_result = results[prompt]
+        else:
+            prompt_result = load_segmentation_json(prompt_paths[prompt])
+        status = "" if prompt in results else "  (up to date)"
+        print(f"  {prompt:<8} {len(prompt_result.masks)} instance(s){status}")
+
+# ---------------------------------------------------------------------------
+# 8. Multi-scale segmentation (optional)
 #    For objects of varying sizes, combine multiple presets. PanoSAM merges
 #    and deduplicates masks across all scales automatically.
 #
+#    Running every view of every scale is slow, and most fine views see
+#    nothing. segment_coarse_to_fine() runs the widest preset first, then only
+#    the finer views that overlap something it found, including weak,
+#    low-confidence detections. It reports how many views were skipped.
+#
 #    Uncomment to run — this processes more views and takes longer.
 # ---------------------------------------------------------------------------
 
+# from pano_utils.coarse_to_fine import segment_coarse_to_fine
+#
 # multi_client = ps.PanoSAM(
 #     engine=engine,
 #     views=[ps.PerspectivePreset.ZOOMED_OUT, ps.PerspectivePreset.WIDEANGLE],
 # )
-# multi_result = multi_client.segment(panorama, prompt=TEXT_PROMPT)
-# print(f"Multi-scale: found {len(multi_result.masks)} '{TEXT_PROMPT}' instance(s)")
+# multi_result, stats = segment_coarse_to_fine(
+#     multi_client, panorama_array, prompt=TEXT_PROMPT, embedding_cache=embeddings
+# )
+# print(
+#     f"Multi-scale: found {len(multi_result.masks)} '{TEXT_PROMPT}' instance(s), "
+#     f"ran {stats['fine_views_run']} of {stats['fine_views']} fine views"
+# )
 # multi_result.save_json("assets/multi_scale_result.panosam.json")
@@ -0,0 +1,75 @@
+"""
+Crawl Street View Coverage for an Area
+=======================================
+
+Section 6 of gsv_demo.py fetches a single coverage tile. This script
+enumerates every panorama in a bounding box or polygon:
+
+  1. Lists the zoom-17 map tiles (~300 m across) that cover the area
+  2. Fetches their coverage concurrently, rate-limited and with retries
+  3. Stores each panorama once (IDs repeat across tiles) in an indexed
+     SQLite table, together with the navigation links between them
+
+Each finished tile is checkpointed in the same database. If the crawl is
+interrupted, rerun the same command and it continues where it stopped.
+
+Usage
+-----
+  # MIT campus and Kendall Square (south, west, north, east)
+  python crawl_coverage.py --bbox 42.355 -71.095 42.367 -71.080 --db assets/mit.sqlite
+
+  # Any GeoJSON polygon, e.g. a borough boundary
+  python crawl_coverage.py --polygon brooklyn.geojson --db assets/brooklyn.sqlite --rate 20
+
+Prerequisites
+-------------
+  pip install streetlevel aiohttp shapely tqdm
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pano_utils.gsv_crawl import CoverageDB, crawl, load_polygon, tiles_in_bbox, tiles_in_polygon
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enumerate Street View panoramas in an area.")
+    area = parser.add_mutually_exclusive_group(required=True)
+    area.add_argument(
+        "--bbox",
+        type=float,
+        nargs=4,
+        metavar=("SOUTH", "WEST", "NORTH", "EAST"),
+        help="Bounding box in degrees",
+    )
+    area.add_argument("--polygon", help="GeoJSON file with a Polygon")
+    parser.add_argument("--db", default="assets/coverage.sqlite", help="SQLite output")
+    parser.add_argument("--rate", type=float, default=10.0, help="Requests per second")
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    if args.bbox:
+        tiles = tiles_in_bbox(*args.bbox)
+    else:
+        tiles = tiles_in_polygon(load_polygon(args.polygon))
+    print(f"{len(tiles)} coverage tiles to crawl → {args.db}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.db)), exist_ok=True)
+    counts = crawl(tiles, args.db, rate=args.rate, concurrency=args.concurrency)
+
+    db = CoverageDB(args.db)
+    print(
+        f"\nFetched {counts['tiles']} tiles ({counts['skipped']} already done, "
+        f"{counts['failed']} failed): {counts['new_panoramas']} new panoramas, "
+        f"{db.count_panoramas()} in the database"
+    )
+    if counts["failed"]:
+        print("Rerun the same command to retry the failed tiles.")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
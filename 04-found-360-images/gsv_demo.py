@@ -13,12 +13,24 @@ Prerequisites
 """
 
 import os
-import time
+import sys
 
 from PIL import Image
 import matplotlib.pyplot as plt
 from streetlevel import streetview
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pano_utils.gsv_cache import CachedStreetView
+from pano_utils.gsv_history import streetview_captures, view_changes
+from pano_utils.gsv_route import walk_route
+from pano_utils.view_export import rig_perspectives
+
+# Metadata and image tiles are cached on disk (~/.cache/pano_utils/gsv, or
+# $PANO_GSV_CACHE_DIR), so rerunning this script downloads nothing twice.
+# CachedStreetView has the same functions as streetlevel's streetview module.
+gsv = CachedStreetView()
+
 # ---------------------------------------------------------------------------
 # 1. Find a panorama near MIT Media Lab
 #    find_panorama() returns the nearest GSV panorama to a lat/lon coordinate.
@@ -27,7 +39,7 @@ from streetlevel import streetview
 MIT_LAT = 42.3601
 MIT_LON = -71.0868
 
-pano = streetview.find_panorama(MIT_LAT, MIT_LON)
+pano = gsv.find_panorama(MIT_LAT, MIT_LON)
 
 if pano:
     print("Found panorama!")
@@ -47,7 +59,7 @@ else:
 os.makedirs("assets", exist_ok=True)
 output_path = f"assets/{pano.id}.jpg"
 
-streetview.download_panorama(pano, output_path, zoom=4)
+gsv.download_panorama(pano, output_path, zoom=4)
 print(f"Saved to {output_path}")
 
 img = Image.open(output_path)
@@ -66,7 +78,7 @@ plt.show()
 #    find_panorama_by_id().
 # ---------------------------------------------------------------------------
 
-full_pano = streetview.find_panorama_by_id(pano.id)
+full_pano = gsv.find_panorama_by_id(pano.id)
 
 print("\n=== Panorama Metadata ===")
 print(f"ID:        {full_pano.id}")
@@ -114,7 +126,7 @@ if full_pano.historical:
     oldest = full_pano.historical[-1]  # Usually the oldest is last
     oldest_path = f"assets/{oldest.id}.jpg"
 
-    streetview.download_panorama(oldest, oldest_path, zoom=3)
+    gsv.download_panorama(oldest, oldest_path, zoom=3)
 
     fig, axes = plt.subplots(1, 2, figsize=(20, 6))
 
@@ -129,13 +141,32 @@ if full_pano.historical:
     plt.suptitle("Same Location, Different Years", fontsize=15)
     plt.tight_layout()
     plt.show()
+
+    # What changed? Captures are taken facing different ways, so views are
+    # set by compass bearing and each capture's heading turns them into its
+    # own yaw. view_changes() compares them on small, low-zoom panoramas;
+    # only the views that score high are worth running OCR on again.
+    captures = streetview_captures(full_pano, gsv)
+    if len(captures) >= 2:
+        views = rig_perspectives(yaws=range(0, 360, 45), pitches=(0,))
+        first, last = captures[0], captures[-1]
+        scores = view_changes(first.coarse(), first.heading, last.coarse(), last.heading, views)
+        print(f"\nChange between {first.date} and {last.date}, by bearing:")
+        for view, score in zip(views, scores):
+            flag = "  ← changed" if score > 0.6 else ""
+            print(f"  {view.yaw_offset:5.0f}°  {score:.2f}{flag}")
+
+        # To follow a whole street, read only the changed views of every
+        # capture, and resume later when Google adds new imagery:
+        #   track_history(OCRViews(pano_ocr), panos, "assets/history.jsonl")
 else:
     print("\nNo historical imagery available at this location.")
 
 # ---------------------------------------------------------------------------
 # 6. Coverage tiles — find all panoramas in an area
 #    Instead of searching point-by-point, fetch all panoramas within a map
-#    tile. This is how large-scale collection projects work.
+#    tile. This is how large-scale collection projects work: to enumerate a
+#    whole neighborhood or borough, see crawl_coverage.py.
 # ---------------------------------------------------------------------------
 
 tile_panos = streetview.get_coverage_tile_by_latlon(MIT_LAT, MIT_LON)
@@ -168,7 +199,14 @@ plt.show()
 
 # ---------------------------------------------------------------------------
 # 7. Batch download along a path
-#    Download panoramas along a walk from MIT Media Lab to Kendall Square.
+#    Download the panoramas along a walk from MIT Media Lab to Kendall Square.
+#    Instead of looking up the nearest panorama at each waypoint — which
+#    skips everything between them — walk_route() follows the panoramas'
+#    navigation links from one waypoint to the next, so you get every
+#    panorama along the street, in order, each once. Images for each leg
+#    download concurrently while the next leg is being walked; a token bucket
+#    caps the request rate (rate=10 requests/second here) to stay polite to
+#    Google's servers, and rerunning skips what's already downloaded.
 # ---------------------------------------------------------------------------
 
 route_points = [
@@ -179,30 +217,32 @@ route_points = [
     (42.3636, -71.0853),  # Kendall Square
 ]
 
-os.makedirs("assets/route", exist_ok=True)
 route_panos = []
 
-for i, (lat, lon) in enumerate(route_points):
-    p = streetview.find_panorama(lat, lon)
-    if p:
-        path = f"assets/route/{i:02d}_{p.id}.jpg"
-        streetview.download_panorama(p, path, zoom=3)
-        route_panos.append((p, path))
-        print(f"[{i}] Downloaded {p.id} ({p.date}) — {p.lat:.5f}, {p.lon:.5f}")
-        time.sleep(0.5)  # Be polite to Google's servers
-    else:
-        print(f"[{i}] No panorama found near ({lat}, {lon})")
+try:
+    for i, (p, path, error) in enumerate(
+        walk_route(route_points, "assets/route", zoom=3, rate=10, cache=gsv.cache)
+    ):
+        if path:
+            route_panos.append((p, path))
+            print(f"[{i:02d}] Downloaded {p.id} ({p.date}) — {p.lat:.5f}, {p.lon:.5f}")
+        else:
+            print(f"[{i:02d}] Failed to download {p.id}: {error}")
+except LookupError as e:
+    # No panorama near the first waypoint: there is nowhere to start walking.
+    print(f"\nCan't walk the route: {e}")
 
 print(f"\nDownloaded {len(route_panos)} panoramas along the route.")
 
-# Display the route panoramas
+# Display a few evenly spaced panoramas from the route
 if route_panos:
-    n = len(route_panos)
+    stops = route_panos[:: max(1, len(route_panos) // 5)][:5]
+    n = len(stops)
     fig, axes = plt.subplots(n, 1, figsize=(16, 4 * n))
     if n == 1:
         axes = [axes]
 
-    for i, (p, path) in enumerate(route_panos):
+    for i, (p, path) in enumerate(stops):
         route_img = Image.open(path)
         axes[i].imshow(route_img)
         axes[i].set_title(
@@ -0,0 +1,128 @@
+"""
+Deduplication Scaling Benchmark
+================================
+
+Times pano_utils.dedup (spherical KD-tree index) against PanoOCR's built-in
+pairwise deduplication on synthetic detections, from hundreds to hundreds of
+thousands of detections.
+
+Detections are scattered over the sphere — including across the ±180° yaw
+seam and up to the poles — and each one is seen from 1-3 overlapping views
+with a little positional jitter, like a real multi-view OCR run. Past 1,000
+detections the boxes shrink so the sphere stays about as crowded as a real
+panorama, rather than every box overlapping dozens of others.
+
+PanoOCR's pairwise path runs a GeoPandas overlay per pair, so it is only
+timed up to --baseline-max detections.
+
+Usage
+-----
+  python benchmarks/dedup_scaling.py
+  python benchmarks/dedup_scaling.py --sizes 1000 100000 --json dedup.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from panoocr import SphereOCRDuplicationDetectionEngine, SphereOCRResult
+
+from pano_utils.dedup import deduplicate_ocr_results
+
+WORDS = ["PIZZA", "DELI", "OPEN", "SALE", "HOTEL", "BANK", "PARKING", "EXIT"]
+
+
+def synthetic_detections(n, seed=0):
+    """Generate ~n detections: unique signs, each seen from 1-3 views."""
+    rng = np.random.default_rng(seed)
+    detections = []
+    sign = 0
+    scale = min(1.0, np.sqrt(1000 / n))
+    while len(detections) < n:
+        yaw = rng.uniform(-180, 180)
+        # Uniform on the sphere, so the poles get their share of signs.
+        pitch = np.degrees(np.arcsin(rng.uniform(-1, 1)))
+        width = rng.uniform(0.5, 10) * scale
+        height = width * rng.uniform(0.2, 0.5)
+        text = f"{WORDS[sign % len(WORDS)]} {sign}"
+
+        for _ in range(rng.integers(1, 4)):
+            jittered_yaw = (yaw + rng.normal(0, 0.1 * width) + 180) % 360 - 180
+            jittered_pitch = float(np.clip(pitch + rng.normal(0, 0.1 * height), -90, 90))
+            detections.append(
+                SphereOCRResult(
+                    text=text,
+                    confidence=float(rng.uniform(0.5, 1.0)),
+                    yaw=float(jittered_yaw),
+                    pitch=jittered_pitch,
+                    width=float(width),
+                    height=float(height),
+                    engine="synthetic",
+                )
+            )
+        sign += 1
+    return detections[:n], sign
+
+
+def time_call(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detection deduplication.")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[100, 300, 1000, 10000, 100000, 300000],
+    )
+    parser.add_argument("--baseline-max", type=int, default=300)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    baseline = SphereOCRDuplicationDetectionEngine()
+    rows = []
+
+    print(f"{'Detections':>10} {'Signs':>7} {'Kept':>7} {'Index (s)':>10} {'Pairwise (s)':>13}")
+    print("-" * 52)
+
+    for n in args.sizes:
+        detections, signs = synthetic_detections(n)
+        kept, index_seconds = time_call(deduplicate_ocr_results, detections)
+
+        row = {
+            "detections": n,
+            "signs": signs,
+            "kept": len(kept),
+            "index_seconds": round(index_seconds, 4),
+            "pairwise_seconds": None,
+            "pairwise_kept": None,
+        }
+        if n <= args.baseline_max:
+            frames = [[d] for d in detections]
+            pairwise_kept, pairwise_seconds = time_call(baseline.deduplicate_frames, frames)
+            row["pairwise_seconds"] = round(pairwise_seconds, 4)
+            row["pairwise_kept"] = len(pairwise_kept)
+
+        rows.append(row)
+        pairwise = (
+            f"{row['pairwise_seconds']:>13.3f}" if row["pairwise_seconds"] is not None else f"{'—':>13}"
+        )
+        print(f"{n:>10} {signs:>7} {len(kept):>7} {index_seconds:>10.3f} {pairwise}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "dedup_scaling", "results": rows}, f, indent=2)
+        print(f"\nResults saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Street View Download Benchmark (Local Stand-In Tile Server)
+============================================================
+
+Compares the demo's old sequential route download (streetlevel's tile
+download per panorama + a fixed sleep) with pano_utils.gsv_download, against
+a local aiohttp server that serves synthetic Street View tiles. No requests
+go to Google.
+
+The stand-in server adds a configurable per-request latency and can fail a
+fraction of requests with 503, to exercise retries. A second downloader run
+over the same output directory checks that finished panoramas are skipped.
+
+Usage
+-----
+  python benchmarks/gsv_download.py
+  python benchmarks/gsv_download.py --panoramas 40 --latency 0.1 --fail-rate 0.05 --json gsv.json
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from aiohttp import web
+from PIL import Image
+from streetlevel.dataclasses import Size, Tile
+from streetlevel.streetview.panorama import StreetViewPanorama
+from streetlevel.util import get_equirectangular_panorama
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pano_utils.gsv_download import StreetViewDownloader
+
+TILE_SIZE = 512
+# Zoom 3 is 8 x 4 tiles, the size the demo's route section downloads.
+IMAGE_SIZES = [Size(512 * 2**z, 256 * 2**z) for z in range(6)]
+
+
+# ---------------------------------------------------------------------------
+# Stand-in tile server
+# ---------------------------------------------------------------------------
+
+
+def start_tile_server(latency, fail_rate, seed=0):
+    """Serve synthetic tiles on localhost in a background thread.
+
+    Returns:
+        (tile URL template, request counter dict)
+    """
+    buf = io.BytesIO()
+    Image.new("RGB", (TILE_SIZE, TILE_SIZE), (90, 120, 160)).save(buf, "JPEG")
+    tile = buf.getvalue()
+    rng = random.Random(seed)
+    counters = {"requests": 0, "failed": 0}
+
+    async def handle_tile(request):
+        counters["requests"] += 1
+        await asyncio.sleep(latency)
+        if rng.random() < fail_rate:
+            counters["failed"] += 1
+            return web.Response(status=503)
+        return web.Response(body=tile, content_type="image/jpeg")
+
+    app = web.Application()
+    app.router.add_get("/v1/tile", handle_tile)
+    runner = web.AppRunner(app)
+    ready = threading.Event()
+    port = {}
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        loop.run_until_complete(site.start())
+        port["port"] = site._server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    ready.wait()
+    url = f"http://127.0.0.1:{port['port']}/v1/tile?panoid={{pano_id}}&x={{x}}&y={{y}}&zoom={{zoom}}"
+    return url, counters
+
+
+def fake_panoramas(n):
+    return [
+        StreetViewPanorama(
+            id=f"pano{i:04d}",
+            lat=42.36 + i * 1e-4,
+            lon=-71.08,
+            image_sizes=IMAGE_SIZES,
+            tile_size=Size(TILE_SIZE, TILE_SIZE),
+        )
+        for i in range(n)
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Runs
+# ---------------------------------------------------------------------------
+
+
+def run_sequential(panos, tile_url, zoom, output_dir, sleep):
+    """The demo's old loop: one panorama at a time, then a fixed sleep."""
+    start = time.perf_counter()
+    for pano in panos:
+        size = pano.image_sizes[zoom]
+        tiles = [
+            Tile(x, y, tile_url.format(pano_id=pano.id, x=x, y=y, zoom=zoom))
+            for x in range(size.x // TILE_SIZE)
+            for y in range(size.y // TILE_SIZE)
+        ]
+        image = get_equirectangular_panorama(size.x, size.y, pano.tile_size, tiles)
+        image.save(os.path.join(output_dir, f"{pano.id}.jpg"))
+        time.sleep(sleep)
+    return time.perf_counter() - start
+
+
+def run_concurrent(panos, tile_url, zoom, output_dir, concurrency, rate):
+    async def run():
+        async with StreetViewDownloader(
+            output_dir,
+            zoom=zoom,
+            concurrency=concurrency,
+            rate=rate,
+            backoff=0.05,
+            tile_url=tile_url,
+            headers={},
+        ) as downloader:
+            results = await downloader.download_many(panos)
+        return downloader.stats, results
+
+    start = time.perf_counter()
+    stats, results = asyncio.run(run())
+    return time.perf_counter() - start, stats, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Street View downloading.")
+    parser.add_argument("--panoramas", type=int, default=20)
+    parser.add_argument("--zoom", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05, help="Server latency (s)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of 503s")
+    parser.add_argument("--sleep", type=float, default=0.5, help="Sequential politeness sleep")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=200.0, help="Requests per second")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    tile_url, server = start_tile_server(args.latency, args.fail_rate)
+    panos = fake_panoramas(args.panoramas)
+    tiles = len(panos) * (IMAGE_SIZES[args.zoom].x // TILE_SIZE) * (IMAGE_SIZES[args.zoom].y // TILE_SIZE)
+    print(f"{len(panos)} panoramas, {tiles} tiles, {args.latency * 1000:.0f} ms latency, "
+          f"{args.fail_rate:.0%} failures\n")
+
+    results = {"panoramas": len(panos), "tiles": tiles}
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.fail_rate == 0:
+            seq_dir = os.path.join(tmp, "sequential")
+            os.makedirs(seq_dir)
+            seq_seconds = run_sequential(panos, tile_url, args.zoom, seq_dir, args.sleep)
+            results["sequential_seconds"] = round(seq_seconds, 3)
+            print(f"Sequential + {args.sleep}s sleep: {seq_seconds:7.2f}s")
+        else:
+            print("Sequential: skipped (streetlevel does not retry failed tiles)")
+
+        out_dir = os.path.join(tmp, "concurrent")
+        seconds, stats, downloads = run_concurrent(
+            panos, tile_url, args.zoom, out_dir, args.concurrency, args.rate
+        )
+        failed = sum(1 for _, path, _ in downloads if path is None)
+        results.update(
+            concurrent_seconds=round(seconds, 3),
+            requests=stats.requests,
+            retries=stats.retries,
+            failed_panoramas=failed,
+        )
+        print(f"Concurrent ({args.concurrency} conns, {args.rate:.0f} req/s): {seconds:7.2f}s  "
+              f"({stats.requests} requests, {stats.retries} retries, {failed} failed)")
+
+        seconds, stats, _ = run_concurrent(
+            panos, tile_url, args.zoom, out_dir, args.concurrency, args.rate
+        )
+        results["resume_seconds"] = round(seconds, 3)
+        print(f"Rerun (all finished):  {seconds:7.2f}s  "
+              f"({stats.panoramas_skipped} skipped, {stats.requests} requests)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "gsv_download", "results": results}, f, indent=2)
+        print(f"\nResults saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+Pipeline Benchmark Suite (Synthetic Panoramas, Stub Engines)
+=============================================================
+
+Times the hot paths of the OCR and segmentation pipelines — JPEG decode,
+perspective projection, coordinate conversion, deduplication, JSON and
+columnar save/load, and mask rasterization — on synthetic panoramas at real
+sizes, for each view preset. PanoOCR / PanoSAM's own code paths are timed
+next to pano_utils' replacements.
+
+Runs offline and on CPU only: the OCR and SAM engines are deterministic
+stubs (see stub_engines.py) that read synthetic signs, so end-to-end runs
+measure everything but the model. Add --engine-delay to stand in for a
+model's per-view latency.
+
+Sizes: gsv3 (4096 x 2048), gsv4 (8192 x 4096), gsv5 (16384 x 8192) and
+insta72 (11968 x 5984, an Insta360 X4 72 MP photo), or any WIDTHxHEIGHT.
+
+Each stage runs --repeat times and reports the fastest run (plus every run
+in the JSON). The JSON output also records the machine, library versions
+and peak memory, so results from different machines can be compared.
+
+Usage
+-----
+  python benchmarks/pipeline_suite.py
+  python benchmarks/pipeline_suite.py --sizes gsv4 insta72 --presets default zoomed_in --json suite.json
+  python benchmarks/pipeline_suite.py --stages project dedup --repeat 5
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("TQDM_DISABLE", "1")
+
+import numpy as np
+import panoocr
+import panosam as ps
+from panoocr import OCRResult, PanoOCR
+from panoocr.api.client import _get_perspectives_for_preset
+from panoocr.image.models import PanoramaImage
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from stub_engines import SIZES, StubOCREngine, StubSAMEngine, synthetic_panorama
+
+from pano_utils import rasterize
+from pano_utils.columnar import load_table, save_ocr_result, save_segmentation_result
+from pano_utils.dedup import deduplicate_masks, deduplicate_ocr_results
+from pano_utils.pipeline import recognize_panorama, segment_panorama
+from pano_utils.projection import RemapCache, project
+
+PRESETS = ["default", "zoomed_in", "zoomed_out", "wideangle"]
+
+# Stage groups selectable with --stages; each entry is timed separately.
+STAGES = {
+    "decode": ["jpeg_decode"],
+    "project": ["project_panoocr", "project_cached_cold", "project_cached_warm"],
+    "convert": ["to_sphere_ocr", "to_sphere_masks"],
+    "dedup": ["dedup_ocr_pairwise", "dedup_ocr_index", "dedup_masks_pairwise", "dedup_masks_index"],
+    "ocr": ["ocr_panoocr", "ocr_pipeline"],
+    "segment": ["segment_panosam", "segment_pipeline"],
+    "io": ["ocr_json_save", "ocr_json_load", "ocr_columnar_save", "ocr_columnar_load",
+           "masks_json_save", "masks_json_load", "masks_columnar_save", "masks_columnar_load"],
+    "visualize": ["rasterize_labels", "overlay_masks"],
+}
+
+PROMPT = "sign"
+
+
+def parse_size(name):
+    if name in SIZES:
+        return SIZES[name]
+    width, _, height = name.lower().partition("x")
+    return int(width), int(height or int(width) // 2)
+
+
+def measure(fn, repeat):
+    """Run fn repeat times; return its last result and every run's seconds."""
+    runs = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        runs.append(time.perf_counter() - start)
+    return result, runs
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return round(rss / (1024**2 if sys.platform == "darwin" else 1024), 1)
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": __import__("cv2").__version__,
+        "panoocr": getattr(panoocr, "__version__", None),
+        "panosam": getattr(ps, "__version__", None),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Stage runs
+# ---------------------------------------------------------------------------
+
+
+def flat_detections(perspectives, pano_array, engine, segment=False):
+    """Run a stub engine on every projected view (untimed setup)."""
+    cache = RemapCache()
+    frames = []
+    for view in perspectives:
+        image = Image.fromarray(project(pano_array, view, cache=cache))
+        if segment:
+            frames.append(engine.segment(image, PROMPT))
+        else:
+            frames.append(engine.recognize(image))
+    return frames
+
+
+def load_masks_json(path):
+    """Read a SegmentationResult JSON back (PanoSAM has no loader)."""
+    with open(path) as f:
+        data = json.load(f)
+    masks = [ps.SphereMaskResult.from_dict(mask) for mask in data["masks"]]
+    return ps.SegmentationResult(prompt=data["prompt"], masks=masks)
+
+
+def to_sphere(frames, perspectives):
+    return [
+        [
+            flat.to_sphere(
+                horizontal_fov=view.horizontal_fov,
+                vertical_fov=view.vertical_fov,
+                yaw_offset=view.yaw_offset,
+                pitch_offset=view.pitch_offset,
+            )
+            for flat in frame
+        ]
+        for frame, view in zip(frames, perspectives)
+    ]
+
+
+def run_preset(stages, pano_array, pano_image, preset, repeat, delay, workdir):
+    """Yield (stage, seconds per run, extra fields) for one preset."""
+    perspectives = _get_perspectives_for_preset(panoocr.PerspectivePreset(preset))
+    ocr_engine = StubOCREngine(delay)
+    sam_engine = StubSAMEngine(delay)
+    pano_ocr = PanoOCR(ocr_engine, perspectives=perspectives)
+    client = ps.PanoSAM(engine=sam_engine, views=ps.PerspectivePreset(preset))
+
+    if "project_panoocr" in stages:
+        def project_panoocr():
+            pano = PanoramaImage(panorama_id="bench", image=pano_image)
+            for view in perspectives:
+                pano.generate_perspective_image(view).get_perspective_image()
+
+        yield "project_panoocr", measure(project_panoocr, repeat)[1], {}
+
+    if "project_cached_cold" in stages or "project_cached_warm" in stages:
+        def project_cold():
+            cache = RemapCache()
+            for view in perspectives:
+                project(pano_array, view, cache=cache)
+            return cache
+
+        cache, runs = measure(project_cold, repeat)
+        if "project_cached_cold" in stages:
+            yield "project_cached_cold", runs, {}
+
+        def project_warm():
+            for view in perspectives:
+                project(pano_array, view, cache=cache)
+
+        if "project_cached_warm" in stages:
+            yield "project_cached_warm", measure(project_warm, repeat)[1], {}
+
+    detection_stages = STAGES["convert"] + STAGES["dedup"] + STAGES["io"] + STAGES["visualize"]
+    if any(stage in stages for stage in detection_stages):
+        ocr_frames = flat_detections(perspectives, pano_array, ocr_engine)
+        mask_frames = flat_detections(perspectives, pano_array, sam_engine, segment=True)
+        detections = sum(len(f) for f in ocr_frames)
+        flat_masks = sum(len(f) for f in mask_frames)
+
+        sphere_ocr, runs = measure(lambda: to_sphere(ocr_frames, perspectives), repeat)
+        if "to_sphere_ocr" in stages:
+            yield "to_sphere_ocr", runs, {"items": detections}
+        sphere_masks, runs = measure(lambda: to_sphere(mask_frames, perspectives), repeat)
+        if "to_sphere_masks" in stages:
+            yield "to_sphere_masks", runs, {"items": flat_masks}
+
+        if "dedup_ocr_pairwise" in stages:
+            kept, runs = measure(lambda: pano_ocr._deduplicate_results(sphere_ocr), repeat)
+            yield "dedup_ocr_pairwise", runs, {"items": detections, "kept": len(kept)}
+        all_ocr = [r for frame in sphere_ocr for r in frame]
+        ocr_views = [i for i, frame in enumerate(sphere_ocr) for _ in frame]
+        unique_ocr, runs = measure(
+            lambda: deduplicate_ocr_results(all_ocr, pano_ocr.dedup_options, ocr_views), repeat
+        )
+        if "dedup_ocr_index" in stages:
+            yield "dedup_ocr_index", runs, {"items": detections, "kept": len(unique_ocr)}
+
+        if "dedup_masks_pairwise" in stages:
+            kept, runs = measure(
+                lambda: client._deduper.deduplicate_frames(sphere_masks, use_union=True), repeat
+            )
+            yield "dedup_masks_pairwise", runs, {"items": flat_masks, "kept": len(kept)}
+        all_masks = [m for frame in sphere_masks for m in frame]
+        for i, mask in enumerate(all_masks):
+            mask.mask_id = f"{i}_{mask.mask_id}"
+        unique_masks, runs = measure(
+            lambda: deduplicate_masks(all_masks, client._deduper, use_union=True), repeat
+        )
+        if "dedup_masks_index" in stages:
+            yield "dedup_masks_index", runs, {"items": flat_masks, "kept": len(unique_masks)}
+
+        ocr_result = OCRResult(results=unique_ocr, image_path=None, perspective_preset=preset)
+        mask_result = ps.SegmentationResult(prompt=PROMPT, masks=unique_masks, perspective_preset=preset)
+        paths = {
+            name: os.path.join(workdir, f"{preset}.{name}")
+            for name in ("ocr.json", "ocr.pcol", "masks.json", "masks.pcol")
+        }
+        io_stages = [
+            ("ocr_json_save", lambda: ocr_result.save_json(paths["ocr.json"]), len(unique_ocr)),
+            ("ocr_json_load", lambda: OCRResult.load_json(paths["ocr.json"]), len(unique_ocr)),
+            ("ocr_columnar_save", lambda: save_ocr_result(ocr_result, paths["ocr.pcol"]), len(unique_ocr)),
+            ("ocr_columnar_load", lambda: list(load_table(paths["ocr.pcol"])), len(unique_ocr)),
+            ("masks_json_save", lambda: mask_result.save_json(paths["masks.json"]), len(unique_masks)),
+            ("masks_json_load", lambda: load_masks_json(paths["masks.json"]), len(unique_masks)),
+            ("masks_columnar_save", lambda: save_segmentation_result(mask_result, paths["masks.pcol"]), len(unique_masks)),
+            ("masks_columnar_load", lambda: list(load_table(paths["masks.pcol"])), len(unique_masks)),
+        ]
+        for name, fn, items in io_stages:
+            # Saves always run, so the matching loads have a file to read.
+            _, runs = measure(fn, repeat)
+            if name in stages:
+                yield name, runs, {"items": items}
+
+        if "rasterize_labels" in stages:
+            height, width = pano_array.shape[:2]
+
+            def rasterize_uncached():
+                rasterize._label_cache.clear()  # time the rasterization, not the cache
+                return rasterize.rasterize_labels(unique_masks, width, height)
+
+            yield "rasterize_labels", measure(rasterize_uncached, repeat)[1], {"items": len(unique_masks)}
+        if "overlay_masks" in stages:
+            yield "overlay_masks", measure(
+                lambda: rasterize.overlay_masks(pano_array, unique_masks, alpha=0.5), repeat
+            )[1], {"items": len(unique_masks)}
+
+    if "ocr_panoocr" in stages:
+        result, runs = measure(lambda: pano_ocr.recognize(pano_image, show_progress=False), repeat)
+        yield "ocr_panoocr", runs, {"items": len(result.results)}
+    if "ocr_pipeline" in stages:
+        result, runs = measure(
+            lambda: recognize_panorama(pano_ocr, pano_array, show_progress=False), repeat
+        )
+        yield "ocr_pipeline", runs, {"items": len(result.results)}
+    if "segment_panosam" in stages:
+        result, runs = measure(lambda: client.segment(pano_image, PROMPT), repeat)
+        yield "segment_panosam", runs, {"items": len(result.masks)}
+    if "segment_pipeline" in stages:
+        result, runs = measure(
+            lambda: segment_panorama(client, pano_array, PROMPT, show_progress=False), repeat
+        )
+        yield "segment_pipeline", runs, {"items": len(result.masks)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the panorama pipelines offline.")
+    parser.add_argument("--sizes", nargs="+", default=["gsv3", "gsv4"],
+                        help=f"Named sizes ({', '.join(SIZES)}) or WIDTHxHEIGHT")
+    parser.add_argument("--presets", nargs="+", default=["default"], choices=PRESETS)
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--signs", type=int, default=60, help="Synthetic signs per panorama")
+    parser.add_argument("--engine-delay", type=float, default=0.0,
+                        help="Seconds the stub engines sleep per view")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    stages = [stage for group in args.stages for stage in STAGES[group]]
+    rows = []
+
+    print(f"{'Size':>9} {'Preset':>10} {'Stage':>21} {'Best (s)':>9} {'Items':>6}")
+    print("-" * 59)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            width, height = parse_size(size)
+            pano_array, _ = synthetic_panorama(width, height, signs=args.signs)
+            pano_image = Image.fromarray(pano_array)
+            common = {"size": size, "width": width, "height": height}
+
+            def record(preset, stage, runs, extra):
+                row = {**common, "preset": preset, "stage": stage,
+                       "seconds": round(min(runs), 5), "runs": [round(r, 5) for r in runs], **extra}
+                rows.append(row)
+                items = extra.get("items", "")
+                print(f"{size:>9} {preset or '—':>10} {stage:>21} {row['seconds']:>9.3f} {items:>6}")
+
+            if "jpeg_decode" in stages:
+                path = os.path.join(workdir, f"{size}.jpg")
+                pano_image.save(path, quality=90)
+
+                def decode():
+                    with Image.open(path) as image:
+                        return np.asarray(image.convert("RGB"))
+
+                record(None, "jpeg_decode", measure(decode, args.repeat)[1],
+                       {"bytes": os.path.getsize(path)})
+
+            for preset in args.presets:
+                for stage, runs, extra in run_preset(
+                    stages, pano_array, pano_image, preset, args.repeat, args.engine_delay, workdir
+                ):
+                    record(preset, stage, runs, extra)
+
+            rows.append({**common, "stage": "peak_rss", "megabytes": peak_rss_mb()})
+            del pano_array, pano_image
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "benchmark": "pipeline_suite",
+                    "environment": environment(),
+                    "config": vars(args),
+                    "results": rows,
+                },
+                f,
+                indent=2,
+            )
+        print(f"\nResults saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Synthetic Panoramas and Stub Engines for Benchmarks
+====================================================
+
+Deterministic stand-ins for real imagery and models, so the benchmarks run
+offline, without a GPU, and give the same detections on every run.
+
+synthetic_panorama() paints an equirectangular street scene at any size:
+a sky gradient, a textured band of building facades with windows, textured
+ground, and saturated red "signs" scattered in yaw — including across the
+±180° seam — at a range of sizes. Each sign's green channel encodes a word,
+so the stub OCR engine can "read" it.
+
+StubOCREngine and StubSAMEngine find the signs in a perspective view by
+color thresholding plus connected components, and return FlatOCRResult /
+FlatMaskResult like the real engines. Their cost is small and roughly
+proportional to view pixels, so timings measure the pipeline around the
+engine; pass delay= to add a fixed per-view model latency.
+"""
+
+import time
+
+import cv2
+import numpy as np
+from panoocr.ocr.models import BoundingBox, FlatOCRResult
+from panosam import FlatMaskResult
+
+WORDS = ["PIZZA", "DELI", "OPEN", "SALE", "HOTEL", "BANK", "PARKING", "EXIT"]
+
+# Named sizes: Google Street View zoom levels and an Insta360 X4 72 MP photo.
+SIZES = {
+    "gsv3": (4096, 2048),
+    "gsv4": (8192, 4096),
+    "gsv5": (16384, 8192),
+    "insta72": (11968, 5984),
+}
+
+SIGN_RED = 220
+
+
+def _texture(rng, size=256, spread=24):
+    return rng.integers(-spread, spread + 1, (size, size, 1), dtype=np.int16)
+
+
+def _paint(pano, texture, rows, color):
+    """Fill rows of the panorama with a color plus tiled noise."""
+    height = rows.stop - rows.start
+    reps = (-(-height // texture.shape[0]), -(-pano.shape[1] // texture.shape[1]), 1)
+    noise = np.tile(texture, reps)[:height, : pano.shape[1]]
+    pano[rows] = np.clip(noise + np.asarray(color, np.int16), 0, 255).astype(np.uint8)
+
+
+def synthetic_panorama(width, height=None, signs=60, seed=0):
+    """Paint a deterministic equirectangular street scene.
+
+    Returns:
+        (RGB uint8 array, list of (yaw, pitch, word) sign centers)
+    """
+    height = height or width // 2
+    rng = np.random.default_rng(seed)
+    pano = np.empty((height, width, 3), dtype=np.uint8)
+
+    horizon = height // 2
+    facade_top, ground_top = int(height * 0.32), int(height * 0.56)
+    sky = np.linspace(0, 1, facade_top)[:, None, None]
+    pano[:facade_top] = (sky * (170, 200, 235) + (1 - sky) * (70, 120, 200)).astype(np.uint8)
+    _paint(pano, _texture(rng), slice(facade_top, ground_top), (120, 110, 100))
+    _paint(pano, _texture(rng, spread=10), slice(ground_top, height), (80, 80, 85))
+
+    # Windows: a regular grid on the facade band.
+    scale = width / 4096
+    window_w, window_h = max(2, int(30 * scale)), max(2, int(40 * scale))
+    for top in range(facade_top + window_h, horizon - window_h, window_h * 2):
+        for left in range(0, width - window_w, window_w * 3):
+            pano[top : top + window_h, left : left + window_w] = (40, 50, 60)
+
+    placed = []
+    for i in range(signs):
+        sign_w = int(rng.uniform(20, 300) * scale)
+        sign_h = max(4, int(sign_w * rng.uniform(0.2, 0.5)))
+        x = int(rng.integers(0, width))
+        y = int(rng.integers(facade_top, ground_top + (height - ground_top) // 3))
+        code = 10 + i % len(WORDS) * 20
+        columns = np.arange(x, x + sign_w) % width  # may wrap across the seam
+        pano[y : y + sign_h, columns] = (SIGN_RED, code, 20)
+        yaw = ((x + sign_w / 2) / width * 360 + 180) % 360 - 180
+        pitch = 90 - (y + sign_h / 2) / height * 180
+        placed.append((yaw, pitch, WORDS[i % len(WORDS)]))
+    return pano, placed
+
+
+def _signs(image):
+    """Connected components of sign-colored pixels that lie fully in view."""
+    view = np.asarray(image)
+    red = (view[..., 0] > SIGN_RED - 40) & (view[..., 2] < 60)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(red.astype(np.uint8))
+    height, width = red.shape
+    for i in range(1, count):
+        x, y, w, h, area = stats[i]
+        if h < 4 or x == 0 or y == 0 or x + w >= width or y + h >= height:
+            continue
+        yield i, labels, (x, y, w, h, area), view
+
+
+class StubOCREngine:
+    """OCR engine that reads the synthetic signs.
+
+    Args:
+        delay: Seconds to sleep per view, to stand in for model latency.
+
+    Attributes:
+        calls: Number of views recognized.
+        pixels: Total view pixels passed in.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self.pixels = 0
+
+    def recognize(self, image):
+        self.calls += 1
+        self.pixels += image.width * image.height
+        if self.delay:
+            time.sleep(self.delay)
+        results = []
+        for i, labels, (x, y, w, h, area), view in _signs(image):
+            code = int(np.median(view[..., 1][labels == i]))
+            word = WORDS[int(round((code - 10) / 20)) % len(WORDS)]
+            results.append(
+                FlatOCRResult(
+                    text=word,
+                    confidence=min(1.0, 0.5 + h / 100),
+                    bounding_box=BoundingBox(
+                        left=x / image.width,
+                        top=y / image.height,
+                        right=(x + w) / image.width,
+                        bottom=(y + h) / image.height,
+                        width=w / image.width,
+                        height=h / image.height,
+                    ),
+                    engine="stub",
+                )
+            )
+        return results
+
+
+class StubSAMEngine:
+    """Segmentation engine that masks the synthetic signs, whatever the prompt.
+
+    Args:
+        delay: Seconds to sleep per view, to stand in for model latency.
+
+    Attributes:
+        calls: Number of views segmented.
+        pixels: Total view pixels passed in.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self.pixels = 0
+
+    def segment(self, image, text_prompt, threshold=0.5, mask_threshold=0.5, simplify_tolerance=0.005):
+        self.calls += 1
+        self.pixels += image.width * image.height
+        if self.delay:
+            time.sleep(self.delay)
+        masks = []
+        for i, labels, (x, y, w, h, area), _ in _signs(image):
+            score = min(1.0, 0.4 + area / 5000)
+            if score < threshold:
+                continue
+            masks.append(
+                FlatMaskResult.from_binary_mask(
+                    mask=labels == i,
+                    score=score,
+                    label=text_prompt,
+                    mask_id=f"{text_prompt}_{len(masks)}",
+                    simplify_tolerance=simplify_tolerance,
+                )
+            )
+        return masks
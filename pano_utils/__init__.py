@@ -0,0 +1,29 @@
+"""Shared helpers for the workshop chapters.
+
+The chapter scripts import these modules to run PanoOCR / PanoSAM at scale:
+
+  projection     — cached equirectangular → perspective remap tables
+  pipeline       — drop-in replacements for PanoOCR.recognize / PanoSAM.segment
+  batch          — process-pool batch runner with crash-safe JSONL output
+  dedup          — spherical KD-tree deduplication of OCR results and masks
+  columnar       — compact memory-mapped storage for OCR results and masks
+  gsv_download   — concurrent, rate-limited, resumable Street View downloads
+  gsv_cache      — on-disk cache for Street View metadata and tiles
+  gsv_crawl      — resumable coverage-tile crawler for an area
+  gsv_route      — route walker over the panorama neighbor graph
+  coarse_to_fine — cheap first pass, then fine OCR / segmentation only where needed
+  sam_embeddings — SAM 3 image embeddings shared across prompts and cached
+  view_pruning   — cheap pre-pass that skips empty views
+  rasterize      — sphere masks to label maps, RLE and overlays in one pass
+  tracing        — per-stage timings, counters and Chrome trace export
+  panorama       — decode-once handle with draft-mode and row-band decoding
+  streaming      — video / interval-shot frames with skipping and tracking
+  view_export    — parallel perspective export with COLMAP rig files
+  text_index     — SQLite word / trigram / location index for OCR search
+  manifest       — skip outputs whose image and pipeline config are unchanged
+  label_tiles    — level-of-detail label tiles and atlases for the 3D preview
+  gsv_history    — compare historical captures, re-read only changed views
+
+Each chapter script adds the repository root to ``sys.path`` so it can be run
+from its own directory, e.g. ``cd 02-ocr-360 && python ocr_demo.py``.
+"""
@@ -0,0 +1,233 @@
+"""Process-pool batch runner with crash-safe JSONL output.
+
+Fans a list of panoramas out over worker processes — each worker loads its
+engine once, in ``init_worker`` — and appends one JSON line per panorama to a
+single output file as results complete::
+
+    {"image": "...", "status": "ok", "elapsed": 3.2, "result": {...}}
+    {"image": "...", "status": "error", "elapsed": 0.1, "error": "..."}
+
+Every line is flushed and fsync'ed before the next is written, so a crash
+loses at most the panoramas that were in flight. If a worker process dies
+(e.g. killed for running out of memory on a huge image), the images in
+flight are recorded as errors and the run stops. Rerunning with the same
+output file skips every image that already has an ``ok`` line.
+
+Pass ``config=manifest.pipeline_config(...)`` to skip only images whose
+``ok`` line was made from the same image contents and configuration: the
+run keeps a ``<output>.manifest.jsonl`` next to the output, and changed
+images or a changed engine, engine version or view setup are processed
+again (their new line supersedes the old one).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterable, Iterator, List, Optional, Set
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".webp")
+
+
+def find_panoramas(source: str) -> List[str]:
+    """List panorama images from a directory or a manifest file.
+
+    Args:
+        source: A directory (searched recursively for images), a text file
+            with one image path per line, or a JSONL file whose lines have an
+            ``image`` key. Relative manifest paths are resolved against the
+            manifest's directory.
+
+    Returns:
+        Image paths, sorted for directories and in file order for manifests.
+    """
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            for name in files:
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(root, name))
+        return sorted(paths)
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    paths = []
+    with open(source) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            path = json.loads(line)["image"] if line.startswith("{") else line
+            paths.append(path if os.path.isabs(path) else os.path.join(base_dir, path))
+    return paths
+
+
+def read_jsonl(path: str) -> Iterator[dict]:
+    """Yield records from a JSONL file, skipping a torn last line."""
+    if not os.path.exists(path):
+        return
+    with open(path) as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def temp_path(path: str) -> str:
+    """Temporary name next to ``path``, unique to this process, thread and call."""
+    return f"{path}.tmp{os.getpid()}-{threading.get_ident()}-{uuid.uuid4().hex[:12]}"
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """Write ``data`` to ``path`` so readers never see a partial file.
+
+    Concurrent writers of the same path each write their own temporary file;
+    the last ``os.replace`` wins.
+    """
+    tmp_path = temp_path(path)
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def completed_images(output_path: str) -> Set[str]:
+    """Return the images that already have an ``ok`` record in the output."""
+    return {
+        record["image"]
+        for record in read_jsonl(output_path)
+        if record.get("status") == "ok"
+    }
+
+
+def _run_one(process_image: Callable[[str], dict], image: str, digest: bool = False) -> dict:
+    start = time.perf_counter()
+    try:
+        result = process_image(image)
+        record = {"image": image, "status": "ok", "result": result}
+        if digest:
+            from .manifest import file_digest
+
+            record["sha256"] = file_digest(image)
+    except Exception as e:
+        record = {
+            "image": image,
+            "status": "error",
+            "error": f"{type(e).__name__}: {e}",
+            "traceback": traceback.format_exc(),
+        }
+    record["elapsed"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def run_batch(
+    images: Iterable[str],
+    output_path: str,
+    process_image: Callable[[str], dict],
+    init_worker: Optional[Callable[..., None]] = None,
+    init_args: tuple = (),
+    workers: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+    resume: bool = True,
+    on_record: Optional[Callable[[dict], None]] = None,
+    config: Optional[dict] = None,
+) -> dict:
+    """Process panoramas on a process pool, appending results to a JSONL file.
+
+    ``process_image`` and ``init_worker`` must be importable module-level
+    functions so they can be sent to worker processes.
+
+    Args:
+        images: Image paths to process.
+        output_path: JSONL file to append records to.
+        process_image: Called in a worker with an image path; returns a
+            JSON-serializable result.
+        init_worker: Called once per worker process, e.g. to load the engine.
+        init_args: Arguments for ``init_worker``.
+        workers: Number of worker processes. Defaults to the CPU count.
+        max_in_flight: Maximum submitted but unfinished images. Defaults to
+            four per worker.
+        resume: Skip images that already have an ``ok`` record.
+        on_record: Called in the parent with each record after it is written.
+        config: ``manifest.pipeline_config`` of this run. With ``resume``,
+            only images recorded in ``<output>.manifest.jsonl`` with the same
+            contents and configuration are skipped.
+
+    Returns:
+        Counts of ``ok``, ``error`` and ``skipped`` images. If a worker
+        process died, the images in flight are ``error`` records and the
+        rest of ``images`` is left for a rerun.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 4
+    manifest = None
+    if config is not None:
+        from .manifest import Manifest, config_digest
+
+        manifest = Manifest(f"{output_path}.manifest.jsonl")
+    done = completed_images(output_path) if resume and manifest is None else set()
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+
+    out_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(out_dir, exist_ok=True)
+
+    with open(output_path, "a") as out, ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=init_args
+    ) as pool:
+
+        def write(record: dict) -> None:
+            if manifest is not None and record["status"] == "ok":
+                record["config"] = config_digest(config)
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+            if manifest is not None and record["status"] == "ok":
+                manifest.record(record["image"], record["image"], config, record["sha256"])
+            counts[record["status"]] += 1
+            if on_record:
+                on_record(record)
+
+        pending = {}  # future -> image
+        broken = False
+
+        def collect(finished) -> None:
+            nonlocal broken
+            for future in finished:
+                image = pending.pop(future)
+                try:
+                    record = future.result()
+                except BrokenProcessPool as e:
+                    # The pool is unusable: every image in flight fails the same way.
+                    broken = True
+                    record = {
+                        "image": image,
+                        "status": "error",
+                        "error": f"{type(e).__name__}: a worker process died",
+                        "elapsed": 0.0,
+                    }
+                write(record)
+
+        for image in images:
+            if image in done or (
+                resume and manifest is not None and manifest.is_current(image, image, config, output="")
+            ):
+                counts["skipped"] += 1
+                continue
+            if len(pending) >= max_in_flight:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            if broken:
+                break
+            try:
+                pending[pool.submit(_run_one, process_image, image, manifest is not None)] = image
+            except BrokenProcessPool:
+                break
+
+        while pending:
+            collect(wait(pending, return_when=FIRST_COMPLETED).done)
+
+    return counts
@@ -0,0 +1,779 @@
+"""Coarse-to-fine OCR and segmentation: look cheaply first, then zoom in.
+
+Running OCR on every 2000 px view of a zoom-4 panorama spends most of its
+bandwidth and compute on sky, road and blank wall. Text is usually still
+*detectable* at a much lower resolution, even when it is not legible, so the
+work can be split in two:
+
+  1. coarse pass — OCR a low-zoom panorama (Street View zoom 2–3, or a
+     downsampled local image) with the same views at matching low resolution
+  2. regions — nearby coarse detections are grouped into a few small views
+     (``plan_regions``), each sized to fit its text plus a margin
+  3. fine pass — only the high-zoom tiles under those views are fetched
+     (``StreetViewTiles``) and only those views are rendered, at the
+     panorama's full pixel density, and OCR'd again
+
+Fine detections are converted to yaw/pitch and deduplicated into one
+``OCRResult``, exactly like ``recognize_panorama``'s output. On sparse scenes
+the fine pass touches a small fraction of the tiles and pixels of the
+exhaustive run; the returned stats report both.
+
+The same idea applies to multi-scale segmentation: ``segment_coarse_to_fine``
+runs the widest PanoSAM preset everywhere and the finer presets only on
+views that overlap a coarse candidate mask.
+
+Example:
+    >>> from pano_utils.coarse_to_fine import recognize_streetview
+    >>> result, stats = recognize_streetview(pano_ocr, pano, coarse_zoom=2, fine_zoom=4)
+    >>> print(stats["fine_tiles"], "of", stats["fine_tiles_total"], "tiles")
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import io
+import math
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import cv2
+import numpy as np
+
+from .dedup import SphereIndex, deduplicate_ocr_results, unit_vectors
+from .pipeline import PanoramaInput, load_panorama_array, recognize_panorama
+from .projection import pixels_for_fov, sample_sphere_grid, scale_perspectives
+from .tracing import NULL_TRACER
+
+TileCoord = Tuple[int, int]
+
+
+# ---------------------------------------------------------------------------
+# Tile sources
+# ---------------------------------------------------------------------------
+
+
+class TileSource(ABC):
+    """A tiled equirectangular panorama that can be read a few tiles at a time.
+
+    Attributes:
+        width, height: Full panorama size in pixels.
+        tile_width, tile_height: Tile size in pixels (edge tiles may be smaller).
+        fetched: Tiles requested so far.
+    """
+
+    width: int
+    height: int
+    tile_width: int
+    tile_height: int
+
+    def __init__(self):
+        self.fetched: Set[TileCoord] = set()
+
+    @property
+    def columns(self) -> int:
+        return -(-self.width // self.tile_width)
+
+    @property
+    def rows(self) -> int:
+        return -(-self.height // self.tile_height)
+
+    def get_tiles(self, tiles: Iterable[TileCoord]) -> Dict[TileCoord, np.ndarray]:
+        """Return ``{(x, y): RGB array}`` for the requested tiles."""
+        tiles = set(tiles)
+        self.fetched |= tiles
+        return self._read(tiles)
+
+    @abstractmethod
+    def _read(self, tiles: Set[TileCoord]) -> Dict[TileCoord, np.ndarray]:
+        """Fetch the tiles, as ``{(x, y): RGB array}``."""
+
+
+class ArrayTiles(TileSource):
+    """Tiles sliced from a panorama that is already in memory.
+
+    Saves no bandwidth, but the fine pass still only renders and OCRs the
+    regions with text.
+    """
+
+    def __init__(self, image: PanoramaInput, tile_size: int = 512):
+        super().__init__()
+        self.array = load_panorama_array(image)
+        self.height, self.width = self.array.shape[:2]
+        self.tile_width = self.tile_height = tile_size
+
+    def _read(self, tiles: Set[TileCoord]) -> Dict[TileCoord, np.ndarray]:
+        tw, th = self.tile_width, self.tile_height
+        return {(x, y): self.array[y * th : (y + 1) * th, x * tw : (x + 1) * tw] for x, y in tiles}
+
+    def downsample(self, width: int = 2048) -> np.ndarray:
+        """The panorama resized to ``width`` (for the coarse pass)."""
+        height = max(1, round(width * self.height / self.width))
+        return cv2.resize(self.array, (width, height), interpolation=cv2.INTER_AREA)
+
+
+class StreetViewTiles(TileSource):
+    """Street View tiles at one zoom level, fetched on demand through a ``GSVCache``.
+
+    Args:
+        pano: Street View panorama (metadata is completed if needed).
+        zoom: Zoom level of the fine pass, clamped to what the panorama has.
+        gsv: ``CachedStreetView`` to fetch through. Defaults to the shared cache.
+    """
+
+    def __init__(self, pano, zoom: int = 4, gsv=None):
+        from .gsv_cache import CachedStreetView
+
+        super().__init__()
+        self.gsv = gsv or CachedStreetView()
+        if pano.is_third_party:
+            raise ValueError(f"{pano.id} is a third-party panorama and is not tiled")
+        if not pano.image_sizes:
+            pano = self.gsv.find_panorama_by_id(pano.id)
+        self.pano = pano
+        self.zoom = min(zoom, len(pano.image_sizes) - 1)
+        size = pano.image_sizes[self.zoom]
+        self.width, self.height = size.x, size.y
+        self.tile_width, self.tile_height = pano.tile_size.x, pano.tile_size.y
+
+    def _read(self, tiles: Set[TileCoord]) -> Dict[TileCoord, np.ndarray]:
+        from PIL import Image
+
+        _, data = self.gsv.get_tiles(self.pano, self.zoom, only=tiles)
+        return {
+            xy: np.asarray(Image.open(io.BytesIO(raw)).convert("RGB"))
+            for xy, raw in data.items()
+            if raw
+        }
+
+
+# ---------------------------------------------------------------------------
+# Rendering views from tiles
+# ---------------------------------------------------------------------------
+
+
+def _view_maps(perspective, width: int, height: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Panorama pixel coordinates sampled by each view pixel.
+
+    x is unwrapped around the view center, so a view across the ±180° seam
+    reads one contiguous strip (with x < 0 or x >= width) instead of two.
+    """
+    world_yaw, world_pitch = sample_sphere_grid(perspective)
+    map_x = (world_yaw / (2 * math.pi) + 0.5) * width - 0.5
+    map_y = np.clip((0.5 - world_pitch / math.pi) * height - 0.5, 0, height - 1)
+    center = (math.radians(perspective.yaw_offset) / (2 * math.pi) + 0.5) * width - 0.5
+    map_x = center + np.mod(map_x - center + width / 2, width) - width / 2
+    return map_x, map_y
+
+
+def _strip_columns(source: TileSource, x0: float, x1: float) -> List[Tuple[int, int]]:
+    """``(wrap, column)`` of the tiles under unwrapped x range [x0, x1], left to right."""
+    columns = []
+    for wrap in range(math.floor(x0 / source.width), math.floor(x1 / source.width) + 1):
+        lo = max(x0, wrap * source.width) - wrap * source.width
+        hi = min(x1, (wrap + 1) * source.width - 1) - wrap * source.width
+        for column in range(int(lo) // source.tile_width, int(hi) // source.tile_width + 1):
+            columns.append((wrap, column))
+    return columns
+
+
+def _view_tiles(source: TileSource, map_x: np.ndarray, map_y: np.ndarray):
+    """Tile strip under a view: ``(columns, rows)`` for ``_strip_columns`` layout."""
+    # +1: bilinear sampling also reads the next pixel.
+    x0, x1 = math.floor(map_x.min()), math.floor(map_x.max()) + 1
+    y0 = math.floor(map_y.min())
+    y1 = min(math.floor(map_y.max()) + 1, source.height - 1)
+    columns = _strip_columns(source, x0, x1)
+    rows = list(range(y0 // source.tile_height, y1 // source.tile_height + 1))
+    return columns, rows
+
+
+def view_tiles(source: TileSource, perspective) -> Set[TileCoord]:
+    """The ``(x, y)`` tiles a view reads from ``source``."""
+    columns, rows = _view_tiles(source, *_view_maps(perspective, source.width, source.height))
+    return {(column, row) for _, column in columns for row in rows}
+
+
+def render_view(
+    source: TileSource, perspective, tiles: Optional[Dict[TileCoord, np.ndarray]] = None
+) -> np.ndarray:
+    """Project a view from the tiles under it, without assembling the panorama.
+
+    Args:
+        source: Tile source of the full-resolution panorama.
+        perspective: PerspectiveMetadata of the view.
+        tiles: Already fetched tiles; missing ones are fetched from ``source``.
+
+    Returns:
+        The view as an RGB array, identical to ``project`` on the full panorama
+        (up to tiles that failed to download, which read as black).
+    """
+    map_x, map_y = _view_maps(perspective, source.width, source.height)
+    columns, rows = _view_tiles(source, map_x, map_y)
+    needed = {(column, row) for _, column in columns for row in rows}
+    tiles = dict(tiles or {})
+    missing = needed - tiles.keys()
+    if missing:
+        tiles.update(source.get_tiles(missing))
+
+    tw, th = source.tile_width, source.tile_height
+    x_origin = columns[0][0] * source.width + columns[0][1] * tw
+    y_origin = rows[0] * th
+    last_wrap, last_column = columns[-1]
+    x_end = last_wrap * source.width + min((last_column + 1) * tw, source.width)
+    y_end = min((rows[-1] + 1) * th, source.height)
+
+    canvas = np.zeros((y_end - y_origin, x_end - x_origin, 3), dtype=np.uint8)
+    for wrap, column in columns:
+        left = wrap * source.width + column * tw - x_origin
+        for row in rows:
+            tile = tiles.get((column, row))
+            if tile is None:
+                continue
+            # Edge tiles may be padded past the panorama; keep the real part.
+            tile = tile[: source.height - row * th, : source.width - column * tw]
+            top = row * th - y_origin
+            canvas[top : top + tile.shape[0], left : left + tile.shape[1]] = tile[..., :3]
+
+    return cv2.remap(
+        canvas,
+        (map_x - x_origin).astype(np.float32),
+        (map_y - y_origin).astype(np.float32),
+        interpolation=cv2.INTER_LINEAR,
+        borderMode=cv2.BORDER_REPLICATE,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Regions
+# ---------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class Region:
+    """A patch of the sphere to read again at full resolution.
+
+    Attributes:
+        yaw: View center yaw in degrees.
+        pitch: View center pitch in degrees.
+        horizontal_fov: View width in degrees.
+        vertical_fov: View height in degrees.
+        members: Indices of the coarse detections inside the region.
+    """
+
+    yaw: float
+    pitch: float
+    horizontal_fov: float
+    vertical_fov: float
+    members: Tuple[int, ...]
+
+
+def _local_angles(vectors: np.ndarray, yaw: float, pitch: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Tangent angles (degrees) of unit vectors in the camera frame at yaw/pitch.
+
+    Inverse of the rotation in ``projection.sample_sphere_grid``. Also returns
+    the depth along the optical axis (<= 0 means behind the camera).
+    """
+    yaw, pitch = math.radians(yaw), math.radians(pitch)
+    x, y, z = vectors[:, 0], vectors[:, 1], vectors[:, 2]
+    x_local = x * math.cos(yaw) - z * math.sin(yaw)
+    z_yawed = x * math.sin(yaw) + z * math.cos(yaw)
+    y_local = y * math.cos(pitch) - z_yawed * math.sin(pitch)
+    z_local = y * math.sin(pitch) + z_yawed * math.cos(pitch)
+    return (
+        np.degrees(np.arctan2(x_local, z_local)),
+        np.degrees(np.arctan2(y_local, z_local)),
+        z_local,
+    )
+
+
+def _fit(
+    vectors: np.ndarray,
+    half_widths: np.ndarray,
+    half_heights: np.ndarray,
+    members: Sequence[int],
+    margin: float,
+    min_fov: float,
+) -> Region:
+    """Smallest view centered on the members' mean direction that holds them."""
+    center = vectors[members].sum(axis=0)
+    center /= np.linalg.norm(center) or 1.0
+    yaw = math.degrees(math.atan2(center[0], center[2]))
+    pitch = math.degrees(math.asin(max(-1.0, min(1.0, center[1]))))
+
+    ax, ay, depth = _local_angles(vectors[members], yaw, pitch)
+    if (depth <= 0).any():
+        return Region(yaw, pitch, 180.0, 180.0, tuple(members))
+    horizontal = 2 * (np.max(np.abs(ax) + half_widths[members]) + margin)
+    vertical = 2 * (np.max(np.abs(ay) + half_heights[members]) + margin)
+    return Region(
+        yaw, pitch, max(min_fov, float(horizontal)), max(min_fov, float(vertical)), tuple(members)
+    )
+
+
+def plan_regions(
+    results: Sequence,
+    margin: float = 2.0,
+    min_fov: float = 8.0,
+    max_fov: float = 60.0,
+) -> List[Region]:
+    """Group coarse detections into a few views that cover them all.
+
+    Detections whose padded extents touch are grouped (through the same
+    spherical index as deduplication); a group too wide for one ``max_fov``
+    view is split into consecutive runs from left to right.
+
+    Args:
+        results: Coarse SphereOCRResult objects.
+        margin: Padding around each detection, in degrees. Covers words
+            whose coarse box was cut short.
+        min_fov: Smallest view extent in degrees.
+        max_fov: Largest view extent in degrees.
+
+    Returns:
+        Regions covering every detection.
+    """
+    if not results:
+        return []
+    vectors = unit_vectors([r.yaw for r in results], [r.pitch for r in results])
+    half_widths = np.array([r.width / 2 for r in results])
+    half_heights = np.array([r.height / 2 for r in results])
+
+    index = SphereIndex(
+        [r.yaw for r in results],
+        [r.pitch for r in results],
+        np.hypot(half_widths, half_heights) + margin,
+    )
+    parent = list(range(len(results)))
+
+    def find(k: int) -> int:
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+
+    for i, j in index.candidate_pairs().tolist():
+        parent[find(j)] = find(i)
+
+    groups: Dict[int, List[int]] = {}
+    for k in range(len(results)):
+        groups.setdefault(find(k), []).append(k)
+
+    def fits(region: Region) -> bool:
+        return region.horizontal_fov <= max_fov and region.vertical_fov <= max_fov
+
+    regions = []
+    for members in groups.values():
+        region = _fit(vectors, half_widths, half_heights, members, margin, min_fov)
+        if fits(region):
+            regions.append(region)
+            continue
+        # Sweep left to right in the group's own frame, starting a new view
+        # whenever the next detection would overflow the current one.
+        ax, _, _ = _local_angles(vectors[members], region.yaw, region.pitch)
+        run: List[int] = []
+        current = None
+        for k in (members[i] for i in np.argsort(ax)):
+            candidate = _fit(vectors, half_widths, half_heights, run + [k], margin, min_fov)
+            if run and not fits(candidate):
+                regions.append(current)
+                run = [k]
+                current = _fit(vectors, half_widths, half_heights, run, margin, min_fov)
+            else:
+                run.append(k)
+                current = candidate
+        regions.append(current)
+
+    # A single detection wider than max_fov is read at max_fov.
+    return [
+        dataclasses.replace(
+            r,
+            horizontal_fov=min(r.horizontal_fov, max_fov),
+            vertical_fov=min(r.vertical_fov, max_fov),
+        )
+        for r in regions
+    ]
+
+
+def region_perspective(region: Region, pano_width: int, max_resolution: int = 2048):
+    """PerspectiveMetadata reading a region at the panorama's full pixel density.
+
+    Args:
+        region: Region to render.
+        pano_width: Width of the full-resolution panorama.
+        max_resolution: Cap on the longer view side; larger views are scaled down.
+    """
+    from panoocr import PerspectiveMetadata
+
+    width = pixels_for_fov(region.horizontal_fov, pano_width)
+    height = pixels_for_fov(region.vertical_fov, pano_width)
+    scale = min(1.0, max_resolution / max(width, height))
+    return PerspectiveMetadata(
+        pixel_width=max(1, round(width * scale)),
+        pixel_height=max(1, round(height * scale)),
+        horizontal_fov=region.horizontal_fov,
+        vertical_fov=region.vertical_fov,
+        yaw_offset=region.yaw,
+        pitch_offset=region.pitch,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Two-stage OCR
+# ---------------------------------------------------------------------------
+
+
+def recognize_coarse_to_fine(
+    pano_ocr,
+    coarse_image: PanoramaInput,
+    fine: TileSource,
+    *,
+    margin: float = 2.0,
+    min_fov: float = 8.0,
+    max_fov: float = 60.0,
+    max_resolution: int = 2048,
+    min_coarse_confidence: float = 0.0,
+    image_path: Optional[str] = None,
+    show_progress: bool = True,
+    tracer=None,
+):
+    """OCR a low-resolution panorama, then re-read only its text at full resolution.
+
+    Args:
+        pano_ocr: Configured ``panoocr.PanoOCR``; its views (at coarse
+            density), engine and dedup options are used for both passes.
+        coarse_image: Low-resolution panorama (path, PIL image or array).
+        fine: Tile source of the full-resolution panorama.
+        margin: Padding around coarse detections, in degrees.
+        min_fov: Smallest fine view extent in degrees.
+        max_fov: Largest fine view extent in degrees.
+        max_resolution: Cap on the longer side of a fine view.
+        min_coarse_confidence: Ignore coarse detections below this. Keep it
+            low: a blurry coarse read is still a good hint that text is there.
+        image_path: Stored in the returned result.
+        show_progress: Show progress bars.
+        tracer: Optional ``tracing.Tracer``; the coarse pass is traced like
+            ``recognize_panorama``, the fine pass per region.
+
+    Returns:
+        Tuple of (panoocr.OCRResult with the fine detections, stats dict).
+        Stats count views, OCR'd pixels and tiles for both passes, next to
+        ``exhaustive_pixels`` / ``fine_tiles_total`` for an exhaustive run.
+    """
+    from panoocr import OCRResult
+    from PIL import Image
+    from tqdm import tqdm
+
+    tracer = tracer or NULL_TRACER
+    coarse_array = load_panorama_array(coarse_image, tracer)
+    coarse_views = scale_perspectives(pano_ocr.perspectives, coarse_array.shape[1])
+    coarse = recognize_panorama(
+        pano_ocr,
+        coarse_array,
+        show_progress=show_progress,
+        perspectives=coarse_views,
+        tracer=tracer,
+    )
+    candidates = [r for r in coarse.results if r.confidence >= min_coarse_confidence]
+
+    regions = plan_regions(candidates, margin, min_fov, max_fov)
+    views = [region_perspective(r, fine.width, max_resolution) for r in regions]
+
+    with tracer.span("fetch_tiles") as args:
+        tiles = fine.get_tiles(set().union(*(view_tiles(fine, v) for v in views)))
+        args["tiles"] = len(tiles)
+    results = []
+    result_views = []
+    for i, view in enumerate(
+        tqdm(views, desc="Reading text regions", unit="region", disable=not show_progress)
+    ):
+        with tracer.span("project", view=i, stage="fine"):
+            image = Image.fromarray(render_view(fine, view, tiles))
+        with tracer.span("inference", view=i, stage="fine") as args:
+            flat_results = pano_ocr.engine.recognize(image)
+            args["detections"] = len(flat_results)
+        with tracer.span("to_sphere", view=i, stage="fine"):
+            results.extend(
+                flat.to_sphere(
+                    horizontal_fov=view.horizontal_fov,
+                    vertical_fov=view.vertical_fov,
+                    yaw_offset=view.yaw_offset,
+                    pitch_offset=view.pitch_offset,
+                )
+                for flat in flat_results
+            )
+            result_views.extend([i] * len(flat_results))
+        tracer.count("views")
+        tracer.count("detections", len(flat_results))
+
+    stats = {
+        "coarse_views": len(coarse_views),
+        "coarse_pixels": sum(p.pixel_width * p.pixel_height for p in coarse_views),
+        "coarse_detections": len(coarse.results),
+        "regions": len(regions),
+        "fine_pixels": sum(v.pixel_width * v.pixel_height for v in views),
+        "fine_tiles": len(fine.fetched),
+        "fine_tiles_total": fine.columns * fine.rows,
+        "exhaustive_pixels": sum(p.pixel_width * p.pixel_height for p in pano_ocr.perspectives),
+    }
+    with tracer.span("dedup", detections=len(results), stage="fine") as args:
+        results = deduplicate_ocr_results(results, pano_ocr.dedup_options, result_views)
+        args["kept"] = len(results)
+    tracer.count("detections_kept", len(results))
+    result = OCRResult(
+        results=results,
+        image_path=image_path,
+        perspective_preset=pano_ocr._preset_name,
+    )
+    return result, stats
+
+
+def recognize_streetview(
+    pano_ocr,
+    pano,
+    gsv=None,
+    coarse_zoom: int = 2,
+    fine_zoom: int = 4,
+    **kwargs,
+):
+    """Coarse-to-fine OCR of a Street View panorama.
+
+    Downloads the whole panorama at ``coarse_zoom`` and, at ``fine_zoom``, only
+    the tiles under detected text. Both go through the ``GSVCache``.
+
+    Args:
+        pano_ocr: Configured ``panoocr.PanoOCR``.
+        pano: Street View panorama.
+        gsv: ``CachedStreetView``. Defaults to the shared cache.
+        coarse_zoom: Zoom of the coarse pass (2 = 2048 px wide).
+        fine_zoom: Zoom of the fine pass (4 = 8192 px wide).
+        **kwargs: Passed to ``recognize_coarse_to_fine``.
+
+    Returns:
+        Tuple of (OCRResult, stats); stats also has ``coarse_tiles``.
+    """
+    fine = StreetViewTiles(pano, fine_zoom, gsv)
+    coarse_image = fine.gsv.get_panorama(fine.pano, zoom=coarse_zoom)
+    result, stats = recognize_coarse_to_fine(pano_ocr, coarse_image, fine, **kwargs)
+    stats["coarse_tiles"] = -(-coarse_image.width // fine.tile_width) * -(
+        -coarse_image.height // fine.tile_height
+    )
+    return result, stats
+
+
+# ---------------------------------------------------------------------------
+# Coarse-to-fine multi-scale segmentation
+# ---------------------------------------------------------------------------
+
+
+def split_scales(perspectives: Sequence) -> Tuple[list, list]:
+    """Split a multi-scale view list into (widest scale, all other scales)."""
+    scales: Dict[tuple, list] = {}
+    for p in perspectives:
+        key = (p.horizontal_fov, p.vertical_fov, p.pixel_width, p.pixel_height)
+        scales.setdefault(key, []).append(p)
+    coarse_key = max(scales, key=lambda k: (k[0], k[1]))
+    fine = [p for key, views in scales.items() if key != coarse_key for p in views]
+    return scales[coarse_key], fine
+
+
+def views_overlapping(perspectives: Sequence, masks: Sequence, margin: float = 5.0) -> List[int]:
+    """Indices of the views that see any part of any mask.
+
+    A view is selected when a mask's center or polygon vertex falls inside
+    the view grown by ``margin`` degrees, or when the view center lies within
+    the mask's bounding disc (masks larger than the view).
+    """
+    from .dedup import _mask_radius
+
+    masks = [m for m in masks if m.polygons]
+    if not masks or not perspectives:
+        return []
+    mask_centers = unit_vectors([m.center_yaw for m in masks], [m.center_pitch for m in masks])
+    mask_radii = np.array([_mask_radius(m) for m in masks])
+    points = [
+        unit_vectors(
+            [m.center_yaw] + [pt[0] for poly in m.polygons for pt in poly],
+            [m.center_pitch] + [pt[1] for poly in m.polygons for pt in poly],
+        )
+        for m in masks
+    ]
+
+    selected = []
+    for index, view in enumerate(perspectives):
+        half_width = view.horizontal_fov / 2
+        half_height = view.vertical_fov / 2
+        view_radius = math.degrees(
+            math.atan(math.hypot(math.tan(math.radians(half_width)), math.tan(math.radians(half_height))))
+        )
+        center = unit_vectors([view.yaw_offset], [view.pitch_offset])[0]
+        distance = np.degrees(np.arccos(np.clip(mask_centers @ center, -1.0, 1.0)))
+
+        for k in np.flatnonzero(distance <= mask_radii + view_radius + margin):
+            if distance[k] <= mask_radii[k]:
+                selected.append(index)
+                break
+            ax, ay, depth = _local_angles(points[k], view.yaw_offset, view.pitch_offset)
+            inside = (depth > 0) & (np.abs(ax) <= half_width + margin) & (np.abs(ay) <= half_height + margin)
+            if inside.any():
+                selected.append(index)
+                break
+    return selected
+
+
+def segment_coarse_to_fine(
+    client,
+    panorama: PanoramaInput,
+    prompt,
+    *,
+    coarse: Optional[Sequence] = None,
+    fine: Optional[Sequence] = None,
+    candidate_threshold: Optional[float] = None,
+    margin: float = 5.0,
+    options=None,
+    dedup=None,
+    cache=None,
+    embedding_cache=None,
+    show_progress: bool = True,
+    workers: int = 2,
+    prefetch: int = 4,
+    tracer=None,
+):
+    """Multi-scale segmentation that only runs fine views where the coarse pass found something.
+
+    The coarse scale runs everywhere, with a lowered ``candidate_threshold``
+    so that weak, low-confidence detections also count as candidates. Fine
+    views then run only where they overlap a candidate; coarse masks below
+    the real threshold are dropped and everything is deduplicated together,
+    as in an exhaustive multi-scale run.
+
+    Args:
+        client: Configured ``panosam.PanoSAM`` instance.
+        panorama: Path to panorama image, PIL Image, or numpy array.
+        prompt: Text prompt, or a list of prompts.
+        coarse: Views of the coarse pass. Defaults to the widest scale in
+            the client's views.
+        fine: Candidate fine views. Defaults to the client's other scales.
+        candidate_threshold: Score threshold of the coarse pass. Defaults to
+            half the segmentation threshold.
+        margin: Grow fine views by this many degrees when testing overlap.
+        options: SegmentationOptions; defaults to the client's.
+        dedup: DedupOptions; defaults to the client's.
+        cache: RemapCache to project with. Defaults to the shared cache.
+        embedding_cache: Optional ``sam_embeddings.EmbeddingCache``.
+        show_progress: Whether to show progress bars.
+        workers: Projection threads running ahead of the engine (0 = serial).
+        prefetch: Maximum number of views projected ahead of the engine.
+        tracer: Optional ``tracing.Tracer`` to record per-stage timings.
+
+    Returns:
+        Tuple of (SegmentationResult, or ``{prompt: SegmentationResult}`` for
+        a list of prompts, and a stats dict with ``coarse_views``,
+        ``fine_views``, ``fine_views_run``, ``skipped_views`` and
+        ``candidates``).
+    """
+    from .pipeline import build_segmentation_result, segment_views
+    from .sam_embeddings import PromptSegmenter, source_digest
+
+    prompts = [prompt] if isinstance(prompt, str) else list(dict.fromkeys(prompt))
+    opts = options or client.default_options
+    dopt = dedup or client.default_dedup
+    image_path = panorama if isinstance(panorama, str) else None
+    segmenter = PromptSegmenter(client.engine, embedding_cache)
+    image_key = source_digest(panorama) if embedding_cache is not None and segmenter.shares_embeddings else None
+    pano_array = load_panorama_array(panorama, tracer)
+
+    if coarse is None or fine is None:
+        default_coarse, default_fine = split_scales(client._perspectives)
+        coarse = default_coarse if coarse is None else coarse
+        fine = default_fine if fine is None else fine
+    if candidate_threshold is None:
+        candidate_threshold = opts.threshold / 2
+
+    run = dict(
+        cache=cache,
+        image_key=image_key,
+        show_progress=show_progress,
+        workers=workers,
+        prefetch=prefetch,
+        tracer=tracer,
+    )
+
+    coarse_options = dataclasses.replace(
+        opts, threshold=min(candidate_threshold, opts.threshold)
+    )
+    candidates = segment_views(
+        segmenter, pano_array, coarse, prompts, coarse_options, desc="Coarse views", **run
+    )
+
+    all_candidates = [m for p in prompts for m in candidates[p]]
+    selected = views_overlapping(fine, all_candidates, margin)
+    fine_masks = segment_views(
+        segmenter,
+        pano_array,
+        [fine[i] for i in selected],
+        prompts,
+        opts,
+        view_ids=[len(coarse) + i for i in selected],
+        desc="Fine views",
+        **run,
+    )
+
+    results = {
+        p: build_segmentation_result(
+            client,
+            p,
+            [m for m in candidates[p] if m.score >= opts.threshold] + fine_masks[p],
+            dopt,
+            image_path,
+            tracer,
+        )
+        for p in prompts
+    }
+    stats = {
+        "coarse_views": len(coarse),
+        "fine_views": len(fine),
+        "fine_views_run": len(selected),
+        "skipped_views": len(fine) - len(selected),
+        "candidates": len(all_candidates),
+    }
+    return (results[prompt] if isinstance(prompt, str) else results), stats
+
+
+def mask_recall(reference: Sequence, candidate: Sequence, min_iou: float = 0.5) -> float:
+    """Fraction of ``reference`` masks matched by a ``candidate`` mask with IoU >= ``min_iou``.
+
+    Compare a coarse-to-fine result against an exhaustive run of the same
+    views: ``mask_recall(exhaustive.masks, fast.masks)`` and the reverse.
+    """
+    from panosam import SphereMaskDeduplicationEngine
+
+    from .dedup import _mask_radius
+
+    reference = [m for m in reference if m.polygons]
+    candidate = [m for m in candidate if m.polygons]
+    if not reference:
+        return 1.0
+    if not candidate:
+        return 0.0
+
+    masks = reference + candidate
+    index = SphereIndex(
+        [m.center_yaw for m in masks],
+        [m.center_pitch for m in masks],
+        [_mask_radius(m) for m in masks],
+    )
+    engine = SphereMaskDeduplicationEngine(min_iou=min_iou)
+    matched = set()
+    engine._preload_gdfs(masks)
+    try:
+        for i, j in index.candidate_pairs().tolist():
+            i, j = min(i, j), max(i, j)
+            if i >= len(reference) or j < len(reference) or i in matched:
+                continue
+            overlap = engine._intersect_masks(masks[i], masks[j])
+            if overlap is not None and overlap.iou >= min_iou:
+                matched.add(i)
+    finally:
+        engine._clear_cache()
+    return len(matched) / len(reference)
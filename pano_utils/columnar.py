@@ -0,0 +1,567 @@
+"""Compact columnar storage for OCR results and PanoSAM masks.
+
+The JSON written by ``OCRResult.save_json`` / ``SegmentationResult.save_json``
+repeats every key for every detection. This module stores the same data as
+one column per field in a single memory-mappable file:
+
+  - yaw / pitch / sizes / scores as float32
+  - engine and label names dictionary-encoded into small integer codes
+  - text and mask IDs in a UTF-8 string heap with an offsets column
+  - mask polygons packed into one (n, 2) float32 point array, with
+    per-mask polygon offsets and per-polygon point offsets
+
+Loading maps the file and reads nothing else up front. Columns are NumPy views
+into the mapping, so filtering by confidence or yaw range touches only those
+columns; records are built only for the rows that are asked for.
+
+File layout: an 8-byte magic, a little-endian uint64 header length, a JSON
+header (kind, metadata, column dtypes/shapes/offsets), then each column at a
+64-byte-aligned offset.
+
+Example:
+    >>> from pano_utils.columnar import save_ocr_result, load_ocr_table
+    >>> save_ocr_result(result, "pano-ocr.pcol")
+    >>> table = load_ocr_table("pano-ocr.pcol")
+    >>> signs = table.select(min_confidence=0.8, yaw_range=(150, -150))
+    >>> [r.text for r in signs]
+
+Convert existing JSON files (and back) from the command line::
+
+    python -m pano_utils.columnar assets/pano-ocr.json assets/pano-ocr.pcol
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import struct
+import sys
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .dedup import wrap_degrees
+
+MAGIC = b"PANOCOL1"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+
+# ---------------------------------------------------------------------------
+# File format
+# ---------------------------------------------------------------------------
+
+
+def write_columns(path: str, kind: str, meta: dict, columns: Dict[str, np.ndarray]) -> None:
+    """Write named arrays to a columnar file, atomically.
+
+    Args:
+        path: Output file path.
+        kind: Record type stored in the file, e.g. ``"ocr"`` or ``"masks"``.
+        meta: JSON-serializable metadata (image path, dictionaries, ...).
+        columns: Arrays to store. Each is written C-contiguous, little-endian.
+    """
+    arrays = {
+        name: np.ascontiguousarray(array, dtype=np.asarray(array).dtype.newbyteorder("<"))
+        for name, array in columns.items()
+    }
+
+    # Offsets depend on the header length, which depends on the offsets;
+    # grow the reserved header size until it fits.
+    reserved = 256
+    while True:
+        offset = _align(len(MAGIC) + 8 + reserved)
+        layout = {}
+        for name, array in arrays.items():
+            layout[name] = {
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                "offset": offset,
+            }
+            offset = _align(offset + array.nbytes)
+        header = json.dumps(
+            {
+                "version": FORMAT_VERSION,
+                "kind": kind,
+                "meta": meta,
+                "columns": layout,
+            }
+        ).encode("utf-8")
+        if len(header) <= reserved:
+            break
+        reserved = len(header) * 2
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", reserved))
+        f.write(header.ljust(reserved, b" "))
+        for name, array in arrays.items():
+            f.seek(layout[name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(max(f.tell(), offset))
+    os.replace(tmp_path, path)
+
+
+def read_columns(path: str) -> Tuple[str, dict, Dict[str, np.ndarray]]:
+    """Memory-map a columnar file.
+
+    Returns:
+        ``(kind, meta, columns)``; the columns are read-only views into the
+        mapped file, so nothing is read from disk until they are used.
+    """
+    with open(path, "rb") as f:
+        magic = f.read(len(MAGIC))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a columnar results file")
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len))
+
+    if header["version"] > FORMAT_VERSION:
+        raise ValueError(
+            f"{path} uses format version {header['version']}, "
+            f"this reader supports up to {FORMAT_VERSION}"
+        )
+
+    mapped = np.memmap(path, dtype=np.uint8, mode="r")
+    columns = {}
+    for name, spec in header["columns"].items():
+        dtype = np.dtype(spec["dtype"])
+        shape = tuple(spec["shape"])
+        count = int(np.prod(shape)) if shape else 1
+        columns[name] = np.frombuffer(
+            mapped, dtype=dtype, count=count, offset=spec["offset"]
+        ).reshape(shape)
+    return header["kind"], header["meta"], columns
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def encode_strings(values: Sequence[Optional[str]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Pack strings into a UTF-8 heap.
+
+    Returns:
+        ``(offsets, heap, null)``: int64 start offsets with one trailing end
+        offset, the uint8 heap, and a bool column marking ``None`` values.
+    """
+    encoded = [b"" if v is None else v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    heap = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    null = np.array([v is None for v in values], dtype=bool)
+    return offsets, heap, null
+
+
+def decode_string(columns: Dict[str, np.ndarray], name: str, i: int) -> Optional[str]:
+    """Read string ``i`` of column ``name`` written by ``encode_strings``."""
+    if columns[f"{name}_null"][i]:
+        return None
+    offsets = columns[f"{name}_offsets"]
+    return columns[f"{name}_heap"][offsets[i] : offsets[i + 1]].tobytes().decode("utf-8")
+
+
+def _string_columns(name: str, values: Sequence[Optional[str]]) -> Dict[str, np.ndarray]:
+    offsets, heap, null = encode_strings(values)
+    return {f"{name}_offsets": offsets, f"{name}_heap": heap, f"{name}_null": null}
+
+
+def encode_categories(values: Sequence[Optional[str]]) -> Tuple[np.ndarray, List[Optional[str]]]:
+    """Dictionary-encode repeated strings into int16 codes."""
+    categories: List[Optional[str]] = []
+    lookup: Dict[Optional[str], int] = {}
+    codes = np.empty(len(values), dtype=np.int16)
+    for i, value in enumerate(values):
+        if value not in lookup:
+            lookup[value] = len(categories)
+            categories.append(value)
+        codes[i] = lookup[value]
+    return codes, categories
+
+
+def _yaw_mask(yaw: np.ndarray, yaw_range: Tuple[float, float]) -> np.ndarray:
+    """Rows with yaw in ``[start, end]``; ``start > end`` wraps across ±180°.
+
+    Yaws and bounds are compared wrapped to [-180, 180): PanoOCR reports
+    yaws beyond ±180° (-205° is 155°), and ``(170, 190)`` is ``(170, -170)``.
+    """
+    start, end = yaw_range
+    if end - start >= 360.0:
+        return np.ones(len(yaw), dtype=bool)
+    yaw = wrap_degrees(yaw)
+    start, end = wrap_degrees(start), wrap_degrees(end)
+    if start <= end:
+        return (yaw >= start) & (yaw <= end)
+    return (yaw >= start) | (yaw <= end)
+
+
+# ---------------------------------------------------------------------------
+# Tables
+# ---------------------------------------------------------------------------
+
+
+class _Table(ABC):
+    """Lazy view over the rows of a columnar file, optionally a subset."""
+
+    kind = ""
+
+    def __init__(self, meta: dict, columns: Dict[str, np.ndarray], rows: Optional[np.ndarray] = None):
+        self.meta = meta
+        self._columns = columns
+        self._rows = rows
+
+    def __len__(self) -> int:
+        if self._rows is not None:
+            return len(self._rows)
+        return self.meta["count"]
+
+    def __iter__(self) -> Iterator:
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, i: int):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._record(self._row(i))
+
+    def _row(self, i: int) -> int:
+        return int(self._rows[i]) if self._rows is not None else i
+
+    def column(self, name: str) -> np.ndarray:
+        """Return a column for the rows in this view."""
+        values = self._columns[name]
+        return values if self._rows is None else values[self._rows]
+
+    def _subset(self, keep: np.ndarray) -> "_Table":
+        base = np.arange(len(self)) if self._rows is None else self._rows
+        return type(self)(self.meta, self._columns, base[keep])
+
+    @abstractmethod
+    def _record(self, row: int):
+        """Build the record object of file row ``row``."""
+
+
+class OCRTable(_Table):
+    """Lazily loaded OCR results.
+
+    Numeric columns (``yaw``, ``pitch``, ``width``, ``height``,
+    ``confidence``) are exposed as NumPy arrays; indexing or iterating builds
+    ``SphereOCRResult`` objects on demand.
+    """
+
+    kind = "ocr"
+
+    @property
+    def yaw(self) -> np.ndarray:
+        return self.column("yaw")
+
+    @property
+    def pitch(self) -> np.ndarray:
+        return self.column("pitch")
+
+    @property
+    def width(self) -> np.ndarray:
+        return self.column("width")
+
+    @property
+    def height(self) -> np.ndarray:
+        return self.column("height")
+
+    @property
+    def confidence(self) -> np.ndarray:
+        return self.column("confidence")
+
+    def text(self, i: int) -> Optional[str]:
+        return decode_string(self._columns, "text", self._row(i))
+
+    def select(
+        self,
+        min_confidence: Optional[float] = None,
+        yaw_range: Optional[Tuple[float, float]] = None,
+        pitch_range: Optional[Tuple[float, float]] = None,
+        engine: Optional[str] = None,
+    ) -> "OCRTable":
+        """Return the rows matching every given filter, without decoding text.
+
+        Args:
+            min_confidence: Keep results with at least this confidence.
+            yaw_range: ``(start, end)`` in degrees; ``start > end`` selects a
+                range across the ±180° seam, e.g. ``(170, -170)``.
+            pitch_range: ``(low, high)`` in degrees.
+            engine: Keep results from this engine only.
+        """
+        keep = np.ones(len(self), dtype=bool)
+        if min_confidence is not None:
+            keep &= self.confidence >= min_confidence
+        if yaw_range is not None:
+            keep &= _yaw_mask(self.yaw, yaw_range)
+        if pitch_range is not None:
+            keep &= (self.pitch >= pitch_range[0]) & (self.pitch <= pitch_range[1])
+        if engine is not None:
+            engines = self.meta["engines"]
+            code = engines.index(engine) if engine in engines else -1
+            keep &= self.column("engine") == code
+        return self._subset(keep)
+
+    def _record(self, row: int):
+        from panoocr import SphereOCRResult
+
+        c = self._columns
+        return SphereOCRResult(
+            text=decode_string(c, "text", row),
+            confidence=float(c["confidence"][row]),
+            yaw=float(c["yaw"][row]),
+            pitch=float(c["pitch"][row]),
+            width=float(c["width"][row]),
+            height=float(c["height"][row]),
+            engine=self.meta["engines"][c["engine"][row]],
+        )
+
+    def to_result(self):
+        """Materialize the rows in this view as a ``panoocr.OCRResult``."""
+        from panoocr import OCRResult
+
+        return OCRResult(
+            results=list(self),
+            image_path=self.meta.get("image_path"),
+            perspective_preset=self.meta.get("perspective_preset"),
+            perspective_presets=self.meta.get("perspective_presets"),
+        )
+
+
+class MaskTable(_Table):
+    """Lazily loaded PanoSAM masks.
+
+    ``score``, ``center_yaw`` and ``center_pitch`` are NumPy columns; polygon
+    points are only sliced out of the packed point array for the masks that
+    are actually built.
+    """
+
+    kind = "masks"
+
+    @property
+    def score(self) -> np.ndarray:
+        return self.column("score")
+
+    @property
+    def center_yaw(self) -> np.ndarray:
+        return self.column("center_yaw")
+
+    @property
+    def center_pitch(self) -> np.ndarray:
+        return self.column("center_pitch")
+
+    def polygons(self, i: int) -> List[np.ndarray]:
+        """Return mask ``i``'s polygons as (k, 2) yaw/pitch arrays."""
+        return self._polygons(self._row(i))
+
+    def _polygons(self, row: int) -> List[np.ndarray]:
+        c = self._columns
+        first, last = c["mask_polygons"][row], c["mask_polygons"][row + 1]
+        bounds = c["polygon_points"][first : last + 1]
+        return [c["points"][bounds[k] : bounds[k + 1]] for k in range(len(bounds) - 1)]
+
+    def select(
+        self,
+        min_score: Optional[float] = None,
+        yaw_range: Optional[Tuple[float, float]] = None,
+        pitch_range: Optional[Tuple[float, float]] = None,
+        label: Optional[str] = None,
+    ) -> "MaskTable":
+        """Return the masks matching every given filter (by mask center).
+
+        Args:
+            min_score: Keep masks with at least this score.
+            yaw_range: ``(start, end)`` in degrees; ``start > end`` wraps
+                across the ±180° seam.
+            pitch_range: ``(low, high)`` in degrees.
+            label: Keep masks with this label only.
+        """
+        keep = np.ones(len(self), dtype=bool)
+        if min_score is not None:
+            keep &= self.score >= min_score
+        if yaw_range is not None:
+            keep &= _yaw_mask(self.center_yaw, yaw_range)
+        if pitch_range is not None:
+            keep &= (self.center_pitch >= pitch_range[0]) & (
+                self.center_pitch <= pitch_range[1]
+            )
+        if label is not None:
+            labels = self.meta["labels"]
+            code = labels.index(label) if label in labels else -1
+            keep &= self.column("label") == code
+        return self._subset(keep)
+
+    def _record(self, row: int):
+        from panosam import SphereMaskResult
+
+        c = self._columns
+        return SphereMaskResult(
+            polygons=[
+                [(float(yaw), float(pitch)) for yaw, pitch in polygon.tolist()]
+                for polygon in self._polygons(row)
+            ],
+            score=float(c["score"][row]),
+            label=self.meta["labels"][c["label"][row]],
+            mask_id=decode_string(c, "mask_id", row),
+            center_yaw=float(c["center_yaw"][row]),
+            center_pitch=float(c["center_pitch"][row]),
+        )
+
+    def to_result(self):
+        """Materialize the masks in this view as a ``panosam.SegmentationResult``."""
+        from panosam import SegmentationResult
+
+        return SegmentationResult(
+            prompt=self.meta.get("prompt"),
+            masks=list(self),
+            image_path=self.meta.get("image_path"),
+            perspective_preset=self.meta.get("perspective_preset"),
+            perspective_presets=self.meta.get("perspective_presets"),
+        )
+
+
+# ---------------------------------------------------------------------------
+# Save / load
+# ---------------------------------------------------------------------------
+
+
+def _common_meta(data: dict) -> dict:
+    return {
+        "image_path": data.get("image_path"),
+        "perspective_preset": data.get("perspective_preset"),
+        "perspective_presets": data.get("perspective_presets"),
+    }
+
+
+def save_ocr_dict(data: dict, path: str) -> None:
+    """Save an ``OCRResult.to_dict()``-style dict (e.g. loaded JSON)."""
+    records = data.get("results", [])
+    engine_codes, engines = encode_categories([r.get("engine") for r in records])
+
+    def floats(key: str) -> np.ndarray:
+        return np.array([r[key] for r in records], dtype=np.float32)
+
+    write_columns(
+        path,
+        OCRTable.kind,
+        dict(_common_meta(data), count=len(records), engines=engines),
+        {
+            "yaw": floats("yaw"),
+            "pitch": floats("pitch"),
+            "width": floats("width"),
+            "height": floats("height"),
+            "confidence": floats("confidence"),
+            "engine": engine_codes,
+            **_string_columns("text", [r["text"] for r in records]),
+        },
+    )
+
+
+def save_masks_dict(data: dict, path: str) -> None:
+    """Save a ``SegmentationResult.to_dict()``-style dict (e.g. loaded JSON)."""
+    records = data.get("masks", [])
+    label_codes, labels = encode_categories([m.get("label") for m in records])
+
+    mask_polygons = [0]
+    polygon_points = [0]
+    points = []
+    for mask in records:
+        polygons = mask.get("polygons")
+        if polygons is None:
+            # Legacy single-polygon format, as accepted by SphereMaskResult.from_dict.
+            polygons = [mask["polygon"]] if mask.get("polygon") else []
+        for polygon in polygons:
+            points.extend(polygon)
+            polygon_points.append(len(points))
+        mask_polygons.append(len(polygon_points) - 1)
+
+    def floats(key: str) -> np.ndarray:
+        return np.array([m.get(key, 0.0) for m in records], dtype=np.float32)
+
+    write_columns(
+        path,
+        MaskTable.kind,
+        dict(_common_meta(data), count=len(records), prompt=data.get("prompt"), labels=labels),
+        {
+            "score": floats("score"),
+            "center_yaw": floats("center_yaw"),
+            "center_pitch": floats("center_pitch"),
+            "label": label_codes,
+            **_string_columns("mask_id", [m.get("mask_id") for m in records]),
+            "mask_polygons": np.array(mask_polygons, dtype=np.int64),
+            "polygon_points": np.array(polygon_points, dtype=np.int64),
+            "points": np.array(points, dtype=np.float32).reshape(-1, 2),
+        },
+    )
+
+
+def save_ocr_result(result, path: str) -> None:
+    """Save a ``panoocr.OCRResult`` in columnar form."""
+    save_ocr_dict(result.to_dict(), path)
+
+
+def save_segmentation_result(result, path: str) -> None:
+    """Save a ``panosam.SegmentationResult`` in columnar form."""
+    save_masks_dict(result.to_dict(), path)
+
+
+def load_table(path: str) -> _Table:
+    """Open a columnar file as an ``OCRTable`` or ``MaskTable``."""
+    kind, meta, columns = read_columns(path)
+    for table_type in (OCRTable, MaskTable):
+        if kind == table_type.kind:
+            return table_type(meta, columns)
+    raise ValueError(f"{path} holds unknown record kind {kind!r}")
+
+
+def load_ocr_table(path: str) -> OCRTable:
+    """Open a columnar OCR results file without reading the records."""
+    table = load_table(path)
+    if not isinstance(table, OCRTable):
+        raise ValueError(f"{path} holds {table.kind}, not OCR results")
+    return table
+
+
+def load_mask_table(path: str) -> MaskTable:
+    """Open a columnar PanoSAM masks file without reading the records."""
+    table = load_table(path)
+    if not isinstance(table, MaskTable):
+        raise ValueError(f"{path} holds {table.kind}, not masks")
+    return table
+
+
+def convert(src: str, dst: str) -> None:
+    """Convert between result JSON and the columnar format.
+
+    The direction is taken from the source file: JSON (``OCRResult`` or
+    ``SegmentationResult`` layout) is written as columnar, and a columnar
+    file is written back as JSON for the preview tool. Numbers round-trip at
+    float32 precision.
+    """
+    with open(src, "rb") as f:
+        is_columnar = f.read(len(MAGIC)) == MAGIC
+
+    if is_columnar:
+        with open(dst, "w") as f:
+            json.dump(load_table(src).to_result().to_dict(), f, indent=2)
+        return
+
+    with open(src) as f:
+        data = json.load(f)
+    if "masks" in data:
+        save_masks_dict(data, dst)
+    else:
+        save_ocr_dict(data, dst)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("usage: python -m pano_utils.columnar SRC DST")
+    src, dst = sys.argv[1:]
+    convert(src, dst)
+    print(f"{src} ({os.path.getsize(src):,} bytes) → {dst} ({os.path.getsize(dst):,} bytes)")
@@ -0,0 +1,338 @@
+"""Spatially indexed deduplication of spherical detections.
+
+PanoOCR and PanoSAM deduplicate by comparing detections pairwise (PanoOCR's
+ring shortcut only applies to a single pitch row), and every comparison runs a
+GeoPandas overlay. With overlapping presets, multi-scale runs or the 32-view
+ZOOMED_IN preset that is quadratic in the number of detections.
+
+Here detections are indexed as 3-D unit vectors in KD-trees, so only pairs
+whose angular extents can actually touch are ever compared. Working on the
+sphere means the ±180° yaw seam and the poles need no special cases. The
+duplicate rules themselves are unchanged: PanoOCR's text-similarity plus
+region-overlap test, applied only between results of different views, and
+PanoSAM's own ``check_duplication`` / union merge.
+
+Example:
+    >>> from pano_utils.dedup import deduplicate_ocr_results
+    >>> unique = deduplicate_ocr_results(all_results, pano_ocr.dedup_options, result_views)
+"""
+
+from __future__ import annotations
+
+import itertools
+import math
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def wrap_degrees(angle):
+    """Wrap an angle (or array of angles) in degrees to [-180, 180)."""
+    return (angle + 180.0) % 360.0 - 180.0
+
+
+def unit_vectors(yaw: np.ndarray, pitch: np.ndarray) -> np.ndarray:
+    """Convert yaw/pitch in degrees to (n, 3) unit vectors.
+
+    Uses the same axes as ``panoocr.geometry`` (x east, y up, z north).
+    """
+    yaw = np.radians(np.asarray(yaw, dtype=np.float64))
+    pitch = np.radians(np.asarray(pitch, dtype=np.float64))
+    cos_pitch = np.cos(pitch)
+    return np.column_stack(
+        (cos_pitch * np.sin(yaw), np.sin(pitch), cos_pitch * np.cos(yaw))
+    )
+
+
+def _chord(angle_deg: np.ndarray) -> np.ndarray:
+    """Chord length on the unit sphere for an angular distance in degrees."""
+    angle = np.radians(np.minimum(np.asarray(angle_deg, dtype=np.float64), 180.0))
+    return 2.0 * np.sin(angle / 2.0)
+
+
+class SphereIndex:
+    """Neighbor search over discs on the unit sphere.
+
+    Each item is a disc (center yaw/pitch, angular radius). ``candidate_pairs``
+    returns every pair of discs that may overlap. Discs are grouped into
+    radius classes (powers of two) with one KD-tree per class, so a few large
+    detections do not widen the search radius for all the small ones.
+
+    Attributes:
+        vectors: (n, 3) unit vectors of the disc centers.
+        radii: (n,) angular radii in degrees.
+    """
+
+    def __init__(self, yaw: Sequence[float], pitch: Sequence[float], radii: Sequence[float]):
+        self.vectors = unit_vectors(yaw, pitch)
+        self.radii = np.asarray(radii, dtype=np.float64)
+        self._classes: List[tuple] = []
+
+        if len(self.radii) == 0:
+            return
+
+        size_class = np.floor(np.log2(np.maximum(self.radii, 1e-6))).astype(int)
+        for c in np.unique(size_class):
+            members = np.flatnonzero(size_class == c)
+            tree = cKDTree(self.vectors[members])
+            self._classes.append((members, tree, float(self.radii[members].max())))
+
+    def __len__(self) -> int:
+        return len(self.radii)
+
+    def candidate_pairs(self) -> np.ndarray:
+        """Return an (m, 2) array of index pairs ``i < j`` whose discs overlap."""
+        pairs = []
+        for members, tree, class_radius in self._classes:
+            neighbors = tree.query_ball_point(
+                self.vectors, _chord(self.radii + class_radius), return_sorted=False
+            )
+            lengths = np.fromiter(map(len, neighbors), dtype=np.int64, count=len(neighbors))
+            if lengths.sum() == 0:
+                continue
+            i = np.repeat(np.arange(len(self)), lengths)
+            j = members[
+                np.fromiter(
+                    itertools.chain.from_iterable(neighbors),
+                    dtype=np.int64,
+                    count=int(lengths.sum()),
+                )
+            ]
+            keep = i < j
+            pairs.append(np.column_stack((i[keep], j[keep])))
+
+        if not pairs:
+            return np.empty((0, 2), dtype=np.int64)
+
+        pairs = np.concatenate(pairs)
+        # Exact test: centers closer than the sum of the two radii.
+        cos_angle = np.einsum("ij,ij->i", self.vectors[pairs[:, 0]], self.vectors[pairs[:, 1]])
+        angle = np.degrees(np.arccos(np.clip(cos_angle, -1.0, 1.0)))
+        return pairs[angle <= self.radii[pairs[:, 0]] + self.radii[pairs[:, 1]]]
+
+
+def _adjacency(n: int, pairs: np.ndarray) -> Dict[int, List[int]]:
+    neighbors: Dict[int, List[int]] = {i: [] for i in range(n)}
+    for i, j in pairs.tolist():
+        neighbors[i].append(j)
+        neighbors[j].append(i)
+    return neighbors
+
+
+# ---------------------------------------------------------------------------
+# OCR results
+# ---------------------------------------------------------------------------
+
+
+def _box_intersection_ratio(results: Sequence, pairs: np.ndarray) -> np.ndarray:
+    """Intersection area over the smaller box area for each candidate pair.
+
+    Same measure as PanoOCR's rectangle test, but both boxes are laid out in
+    the tangent plane at the midpoint of their centers instead of in raw
+    yaw/pitch, so boxes straddling the ±180° seam or near a pole still meet.
+    """
+    yaw = np.array([r.yaw for r in results], dtype=np.float64)
+    pitch = np.array([r.pitch for r in results], dtype=np.float64)
+    # Yaw extents shrink towards the poles; convert to true angular widths.
+    width = np.array([r.width for r in results]) * np.cos(np.radians(pitch))
+    height = np.array([r.height for r in results], dtype=np.float64)
+    vectors = unit_vectors(yaw, pitch)
+
+    i, j = pairs[:, 0], pairs[:, 1]
+    mid = vectors[i] + vectors[j]
+    mid /= np.maximum(np.linalg.norm(mid, axis=1, keepdims=True), 1e-12)
+    east = np.cross([0.0, 1.0, 0.0], mid)
+    east_norm = np.linalg.norm(east, axis=1, keepdims=True)
+    east = np.where(east_norm > 1e-9, east / np.maximum(east_norm, 1e-12), [1.0, 0.0, 0.0])
+    north = np.cross(mid, east)
+
+    offset = vectors[i] - vectors[j]
+    d_east = np.degrees(np.abs(np.einsum("ij,ij->i", offset, east)))
+    d_north = np.degrees(np.abs(np.einsum("ij,ij->i", offset, north)))
+
+    overlap_w = np.clip((width[i] + width[j]) / 2 - d_east, 0, np.minimum(width[i], width[j]))
+    overlap_h = np.clip(
+        (height[i] + height[j]) / 2 - d_north, 0, np.minimum(height[i], height[j])
+    )
+    smaller = np.minimum(width[i] * height[i], width[j] * height[j])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(smaller > 0, overlap_w * overlap_h / smaller, 0.0)
+    return ratio
+
+
+def _text_overlap(text_i: str, text_j: str, counts_i: Counter, counts_j: Counter) -> tuple:
+    """Character overlap and a Levenshtein similarity upper bound.
+
+    The overlap equals ``textdistance.overlap.normalized_similarity``. Edits
+    can't be fewer than the characters the two texts don't share, so
+    ``shared / longest`` bounds the Levenshtein similarity from above and lets
+    most pairs skip the (pure-Python) edit distance.
+    """
+    if text_i == text_j:
+        return 1.0, 1.0
+    if not text_i or not text_j:
+        return 0.0, 0.0
+    shared = sum((counts_i & counts_j).values())
+    return (
+        shared / min(len(text_i), len(text_j)),
+        shared / max(len(text_i), len(text_j)),
+    )
+
+
+def deduplicate_ocr_results(
+    results: Sequence, dedup_options=None, views: Optional[Sequence[int]] = None
+) -> list:
+    """Deduplicate sphere OCR results from any number of views.
+
+    Like PanoOCR, only results from different views are compared: two
+    stacked lines of text read in one view are two detections, however
+    close together they are.
+
+    Args:
+        results: SphereOCRResult objects from all views, flattened.
+        dedup_options: ``panoocr.DedupOptions`` thresholds. Defaults to
+            PanoOCR's defaults.
+        views: Index of the view each result came from. Without it, every
+            pair of results is compared.
+
+    Returns:
+        Deduplicated SphereOCRResult list, best results first.
+    """
+    import textdistance
+    from panoocr import DedupOptions
+
+    opts = dedup_options or DedupOptions()
+    keep = [
+        k
+        for k, r in enumerate(results)
+        if all(math.isfinite(v) for v in (r.yaw, r.pitch, r.width, r.height))
+    ]
+    results = [results[k] for k in keep]
+    if views is not None:
+        views = np.asarray(views, dtype=np.int64)[keep]
+    if len(results) <= 1:
+        return list(results)
+
+    index = SphereIndex(
+        [r.yaw for r in results],
+        [r.pitch for r in results],
+        [0.5 * math.hypot(r.width, r.height) for r in results],
+    )
+    pairs = index.candidate_pairs()
+    if views is not None:
+        pairs = pairs[views[pairs[:, 0]] != views[pairs[:, 1]]]
+    ratio = _box_intersection_ratio(results, pairs)
+    close = ratio >= opts.min_intersection_ratio
+    pairs, ratio = pairs[close], ratio[close]
+
+    counts = [Counter(r.text) for r in results]
+    duplicates = []
+    for (i, j), intersection_ratio in zip(pairs.tolist(), ratio.tolist()):
+        text_i, text_j = results[i].text, results[j].text
+        overlap, similarity_bound = _text_overlap(text_i, text_j, counts[i], counts[j])
+        if (
+            overlap >= opts.min_text_overlap
+            and intersection_ratio >= opts.min_intersection_ratio_for_overlapping_text
+        ):
+            duplicates.append((i, j))
+            continue
+        if (
+            intersection_ratio >= opts.min_intersection_ratio_for_similar_text
+            and similarity_bound >= opts.min_text_similarity
+        ):
+            similarity = textdistance.levenshtein.normalized_similarity(text_i, text_j)
+            if similarity >= opts.min_text_similarity:
+                duplicates.append((i, j))
+
+    neighbors = _adjacency(len(results), np.array(duplicates, dtype=np.int64).reshape(-1, 2))
+
+    # Keep the best result of every group of duplicates, greedily.
+    order = sorted(
+        range(len(results)),
+        key=lambda k: (len(results[k].text), results[k].confidence),
+        reverse=True,
+    )
+    kept = [False] * len(results)
+    for k in order:
+        if not any(kept[n] for n in neighbors[k]):
+            kept[k] = True
+
+    return [results[k] for k in order if kept[k]]
+
+
+# ---------------------------------------------------------------------------
+# PanoSAM masks
+# ---------------------------------------------------------------------------
+
+
+def _mask_radius(mask) -> float:
+    """Angular radius (degrees) of the smallest center-disc holding the mask."""
+    points = [pt for polygon in mask.polygons for pt in polygon]
+    if not points:
+        return 0.0
+    center = unit_vectors([mask.center_yaw], [mask.center_pitch])[0]
+    vectors = unit_vectors([p[0] for p in points], [p[1] for p in points])
+    cos_angle = np.clip(vectors @ center, -1.0, 1.0)
+    return float(np.degrees(np.arccos(cos_angle.min())))
+
+
+def deduplicate_masks(masks: Sequence, deduper, use_union: bool = True) -> list:
+    """Deduplicate sphere masks from any number of views.
+
+    Candidate pairs come from the spatial index; each candidate is confirmed
+    with ``deduper.check_duplication`` and each connected group of duplicates
+    is merged with the deduper's polygon union (or reduced to its best-scoring
+    mask when ``use_union`` is False).
+
+    Args:
+        masks: SphereMaskResult objects from all views, flattened.
+        deduper: ``panosam.SphereMaskDeduplicationEngine`` with the thresholds.
+        use_union: Merge duplicates by polygon union instead of keeping one.
+
+    Returns:
+        Deduplicated SphereMaskResult list.
+    """
+    masks = [m for m in masks if m.polygons]
+    if len(masks) <= 1:
+        return [deduper._validate_and_fix_mask(m) for m in masks]
+
+    index = SphereIndex(
+        [m.center_yaw for m in masks],
+        [m.center_pitch for m in masks],
+        [_mask_radius(m) for m in masks],
+    )
+    pairs = index.candidate_pairs()
+
+    deduper._preload_gdfs(masks)
+    try:
+        # Union-find over confirmed duplicate pairs.
+        parent = list(range(len(masks)))
+
+        def find(k: int) -> int:
+            while parent[k] != k:
+                parent[k] = parent[parent[k]]
+                k = parent[k]
+            return k
+
+        for i, j in pairs.tolist():
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j and deduper.check_duplication(masks[i], masks[j]):
+                parent[root_j] = root_i
+
+        groups: Dict[int, List] = {}
+        for k, mask in enumerate(masks):
+            groups.setdefault(find(k), []).append(mask)
+
+        merged = []
+        for group in groups.values():
+            best = max(group, key=lambda m: m.score)
+            if use_union and len(group) > 1:
+                merged.append(deduper._merge_masks(group) or best)
+            else:
+                merged.append(best)
+
+        return [deduper._validate_and_fix_mask(m) for m in merged]
+    finally:
+        deduper._clear_cache()
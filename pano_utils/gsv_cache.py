@@ -0,0 +1,366 @@
+"""Local cache for Street View metadata and panorama tiles.
+
+Reruns of the demos and overlapping crawls ask Google for the same panoramas
+again and again. ``GSVCache`` keeps everything that was fetched once:
+
+  - metadata (``find_panorama`` / ``find_panorama_by_id`` results) in SQLite,
+    keyed by panorama ID or by the rounded search location
+  - image tiles in a content-addressed blob store: each tile's bytes live
+    once under ``blobs/ab/cd/<sha256>``, and SQLite maps
+    ``<pano_id>/z<zoom>/<x>_<y>`` to its digest
+
+The blob store is bounded by ``max_bytes``; when it grows past the limit, the
+least recently used tiles are evicted. Metadata is small and never evicted.
+
+``CachedStreetView`` has the same functions as ``streetlevel.streetview``
+(``find_panorama``, ``find_panorama_by_id``, ``get_panorama``,
+``download_panorama``) and goes to the network only for what is not cached.
+``StreetViewDownloader`` takes a ``cache=`` argument for the same effect in
+concurrent downloads.
+
+The default cache directory is ``$PANO_GSV_CACHE_DIR``, or
+``~/.cache/pano_utils/gsv``.
+
+Example:
+    >>> from pano_utils.gsv_cache import CachedStreetView
+    >>> gsv = CachedStreetView()
+    >>> pano = gsv.find_panorama(42.3601, -71.0868)   # network the first time only
+    >>> gsv.download_panorama(pano, "pano.jpg", zoom=4)
+    >>> gsv.cache.stats
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_CACHE_DIR = os.path.join("~", ".cache", "pano_utils", "gsv")
+DEFAULT_MAX_BYTES = 5 * 1024**3
+
+_MISSING = object()
+
+
+def tile_key(pano_id: str, zoom: int, x: int, y: int) -> str:
+    return f"{pano_id}/z{zoom}/{x}_{y}"
+
+
+def location_key(lat: float, lon: float, radius: int) -> str:
+    # ~0.1 m; nearby repeat queries hit, different waypoints don't.
+    return f"find/{lat:.6f},{lon:.6f}/r{radius}"
+
+
+class GSVCache:
+    """SQLite metadata plus a content-addressed, LRU-bounded tile store.
+
+    Safe to share between threads. Separate processes may share one
+    directory; SQLite serializes their writes.
+
+    Args:
+        cache_dir: Cache directory. Defaults to ``$PANO_GSV_CACHE_DIR`` or
+            ``~/.cache/pano_utils/gsv``.
+        max_bytes: Size limit of the tile store.
+
+    Attributes:
+        stats: Hit / miss counters for metadata and tiles, and evictions.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        cache_dir = cache_dir or os.environ.get("PANO_GSV_CACHE_DIR") or DEFAULT_CACHE_DIR
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_bytes = max_bytes
+        self.stats: Dict[str, int] = {
+            "metadata_hits": 0,
+            "metadata_misses": 0,
+            "tile_hits": 0,
+            "tile_misses": 0,
+            "evicted_tiles": 0,
+        }
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.join(self.cache_dir, "blobs"), exist_ok=True)
+        self._db = sqlite3.connect(
+            os.path.join(self.cache_dir, "index.sqlite"),
+            check_same_thread=False,
+            isolation_level=None,
+            timeout=30,
+        )
+        self._db.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS metadata (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                fetched_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS tiles (
+                key TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS tiles_last_used ON tiles (last_used);
+            CREATE INDEX IF NOT EXISTS tiles_digest ON tiles (digest);
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL
+            );
+            """
+        )
+        # Running size of the tile store; re-synced from SQLite before evicting,
+        # since other processes may share the directory.
+        self._total_bytes = self.total_bytes()
+
+    # -- metadata ----------------------------------------------------------
+
+    def get_metadata(self, key: str, default=None, max_age: Optional[float] = None):
+        """Return the cached value for ``key``, or ``default``.
+
+        Args:
+            max_age: Ignore entries older than this many seconds.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, fetched_at FROM metadata WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (max_age is not None and time.time() - row[1] > max_age):
+                self.stats["metadata_misses"] += 1
+                return default
+            self.stats["metadata_hits"] += 1
+        return pickle.loads(row[0])
+
+    def put_metadata(self, key: str, value) -> None:
+        """Cache a picklable value (``None`` is cached too, as "not found")."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO metadata (key, value, fetched_at) VALUES (?, ?, ?)",
+                (key, pickle.dumps(value), time.time()),
+            )
+
+    # -- tiles -------------------------------------------------------------
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, "blobs", digest[:2], digest[2:4], digest)
+
+    def get_tile(self, key: str) -> Optional[bytes]:
+        """Return the cached bytes for a tile key, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT digest FROM tiles WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                try:
+                    with open(self._blob_path(row[0]), "rb") as f:
+                        data = f.read()
+                except FileNotFoundError:
+                    # Blob removed behind our back (e.g. by another process's eviction).
+                    self._db.execute("DELETE FROM tiles WHERE key = ?", (key,))
+                    row = None
+            if row is None:
+                self.stats["tile_misses"] += 1
+                return None
+            self._db.execute(
+                "UPDATE tiles SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            self.stats["tile_hits"] += 1
+        return data
+
+    def put_tile(self, key: str, data: bytes) -> None:
+        """Store a tile's bytes; identical content is stored only once."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        with self._lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            self._db.execute("BEGIN IMMEDIATE")
+            new_blob = self._db.execute(
+                "INSERT OR IGNORE INTO blobs (digest, size) VALUES (?, ?)", (digest, len(data))
+            ).rowcount
+            self._db.execute(
+                "INSERT OR REPLACE INTO tiles (key, digest, last_used) VALUES (?, ?, ?)",
+                (key, digest, time.time()),
+            )
+            self._db.execute("COMMIT")
+            self._total_bytes += len(data) if new_blob else 0
+            if self._total_bytes > self.max_bytes:
+                self._total_bytes = self._evict(int(self.max_bytes * 0.9))
+
+    def total_bytes(self) -> int:
+        """Size of the tile store in bytes."""
+        return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def _evict(self, target_bytes: int) -> int:
+        """Drop least recently used tiles until the store fits ``target_bytes``.
+
+        Returns:
+            The new size of the tile store.
+        """
+        total = self.total_bytes()
+        while total > target_bytes:
+            rows = self._db.execute(
+                "SELECT key, digest FROM tiles ORDER BY last_used LIMIT 256"
+            ).fetchall()
+            if not rows:
+                break
+            self._db.execute("BEGIN IMMEDIATE")
+            for key, digest in rows:
+                self._db.execute("DELETE FROM tiles WHERE key = ?", (key,))
+                self.stats["evicted_tiles"] += 1
+                still_used = self._db.execute(
+                    "SELECT 1 FROM tiles WHERE digest = ? LIMIT 1", (digest,)
+                ).fetchone()
+                if still_used:
+                    continue
+                size = self._db.execute(
+                    "SELECT size FROM blobs WHERE digest = ?", (digest,)
+                ).fetchone()
+                self._db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+                if size:
+                    total -= size[0]
+                try:
+                    os.remove(self._blob_path(digest))
+                except FileNotFoundError:
+                    pass
+                if total <= target_bytes:
+                    break
+            self._db.execute("COMMIT")
+        return total
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+
+    def close(self) -> None:
+        self._db.close()
+
+
+_default_cache: Optional[GSVCache] = None
+
+
+def default_gsv_cache() -> GSVCache:
+    """The process-wide cache in the default directory, created on first use."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = GSVCache()
+    return _default_cache
+
+
+class CachedStreetView:
+    """Drop-in for ``streetlevel.streetview`` that goes through a ``GSVCache``.
+
+    Args:
+        cache: Cache to use. Defaults to ``default_gsv_cache()``.
+        max_age: Refetch metadata cached longer ago than this many seconds.
+            Defaults to never: a panorama's ``historical`` captures then stay
+            as they were when it was first looked up.
+    """
+
+    def __init__(self, cache: Optional[GSVCache] = None, max_age: Optional[float] = None):
+        self.cache = cache if cache is not None else default_gsv_cache()
+        self.max_age = max_age
+
+    def find_panorama(self, lat: float, lon: float, radius: int = 50, max_age: Optional[float] = None):
+        """Nearest panorama, like ``streetview.find_panorama``.
+
+        Args:
+            max_age: Overrides the instance's ``max_age`` (0 always refetches).
+        """
+        from streetlevel import streetview
+
+        key = location_key(lat, lon, radius)
+        pano = self.cache.get_metadata(key, _MISSING, self.max_age if max_age is None else max_age)
+        if pano is _MISSING:
+            pano = streetview.find_panorama(lat, lon, radius=radius)
+            self.cache.put_metadata(key, pano)
+        return pano
+
+    def find_panorama_by_id(self, pano_id: str, max_age: Optional[float] = None):
+        """Panorama with full metadata, like ``streetview.find_panorama_by_id``.
+
+        Args:
+            max_age: Overrides the instance's ``max_age`` (0 always refetches).
+        """
+        from streetlevel import streetview
+
+        key = f"pano/{pano_id}"
+        pano = self.cache.get_metadata(key, _MISSING, self.max_age if max_age is None else max_age)
+        if pano is _MISSING:
+            pano = streetview.find_panorama_by_id(pano_id)
+            self.cache.put_metadata(key, pano)
+        return pano
+
+    def get_tiles(
+        self, pano, zoom: int, only: Optional[Iterable[Tuple[int, int]]] = None
+    ) -> Tuple[int, Dict[Tuple[int, int], bytes]]:
+        """Return ``(zoom, {(x, y): bytes})``, downloading only missing tiles.
+
+        Args:
+            pano: Panorama with ``image_sizes`` and ``tile_size``.
+            zoom: Requested zoom level (clamped like ``streetview.get_panorama``).
+            only: Restrict to these ``(x, y)`` tiles instead of the whole image.
+        """
+        from streetlevel.streetview.streetview import (
+            _generate_tile_list,
+            _validate_get_panorama_params,
+        )
+        from streetlevel.util import download_tiles
+
+        zoom = _validate_get_panorama_params(pano, zoom)
+        tiles: Dict[Tuple[int, int], bytes] = {}
+        missing: List = []
+        wanted = set(only) if only is not None else None
+        for tile in _generate_tile_list(pano, zoom):
+            if wanted is not None and (tile.x, tile.y) not in wanted:
+                continue
+            data = self.cache.get_tile(tile_key(pano.id, zoom, tile.x, tile.y))
+            if data is None:
+                missing.append(tile)
+            else:
+                tiles[(tile.x, tile.y)] = data
+
+        if missing:
+            for (x, y), data in download_tiles(missing, headers=_tile_headers()).items():
+                self.cache.put_tile(tile_key(pano.id, zoom, x, y), data)
+                tiles[(x, y)] = data
+        return zoom, tiles
+
+    def get_panorama(self, pano, zoom: int = 5):
+        """Return the panorama as a PIL image, like ``streetview.get_panorama``."""
+        from streetlevel import streetview
+        from streetlevel.util import stitch_equirectangular_tiles
+
+        if pano.is_third_party:
+            return streetview.get_panorama(pano, zoom=zoom)
+        if not pano.image_sizes:
+            pano = self.find_panorama_by_id(pano.id)
+
+        zoom, tiles = self.get_tiles(pano, zoom)
+        size = pano.image_sizes[zoom]
+        return stitch_equirectangular_tiles(
+            tiles, size.x, size.y, pano.tile_size.x, pano.tile_size.y
+        )
+
+    def download_panorama(self, pano, path: str, zoom: int = 5, pil_args: Optional[dict] = None) -> None:
+        """Save the panorama with GPano metadata, like ``streetview.download_panorama``."""
+        from streetlevel import streetview
+        from streetlevel.exif import save_with_metadata
+        from streetlevel.streetview.streetview import _build_output_metadata_object
+
+        if pano.is_third_party:
+            streetview.download_panorama(pano, path, zoom=zoom, pil_args=pil_args)
+            return
+        image = self.get_panorama(pano, zoom=zoom)
+        save_with_metadata(
+            image, path, pil_args or {}, _build_output_metadata_object(pano, image.width, image.height)
+        )
+
+
+def _tile_headers() -> dict:
+    from .gsv_download import TILE_HEADERS
+
+    return dict(TILE_HEADERS, Host="streetviewpixels-pa.googleapis.com")
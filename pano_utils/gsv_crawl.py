@@ -0,0 +1,282 @@
+"""Resumable Street View coverage crawler for a bounding box or polygon.
+
+Sampling a grid of points and calling ``find_panorama`` on each costs one
+request per point (a 5 m grid over a borough is millions of them) and still
+misses panoramas between points. Coverage tiles return *every* panorama on a
+zoom-17 map tile (~300 m across) in one request, so an area is enumerated by
+listing the tiles that cover it and fetching those:
+
+  1. ``tiles_in_bbox`` / ``tiles_in_polygon`` list the covering tiles
+  2. ``crawl`` fetches them concurrently through a rate-limited
+     ``StreetViewClient``
+  3. each finished tile is written to SQLite in one transaction, together
+     with its panoramas (deduplicated by ID across tiles) and their links
+
+The ``tiles`` table is the checkpoint: rerunning ``crawl`` with the same
+database skips every tile already recorded, so an interrupted crawl resumes
+where it stopped.
+
+Example:
+    >>> from pano_utils.gsv_crawl import crawl, tiles_in_bbox
+    >>> tiles = tiles_in_bbox(42.355, -71.095, 42.367, -71.080)
+    >>> crawl(tiles, "cambridge.sqlite", rate=10)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import sqlite3
+import time
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+from streetlevel.geo import tile_coord_to_wgs84, wgs84_to_tile_coord
+
+COVERAGE_ZOOM = 17
+
+Tile = Tuple[int, int]
+
+
+# ---------------------------------------------------------------------------
+# Covering tiles
+# ---------------------------------------------------------------------------
+
+
+def tiles_in_bbox(
+    min_lat: float, min_lon: float, max_lat: float, max_lon: float, zoom: int = COVERAGE_ZOOM
+) -> List[Tile]:
+    """List the map tiles covering a lat/lon bounding box."""
+    # Tile y grows southwards.
+    x0, y0 = wgs84_to_tile_coord(max_lat, min_lon, zoom)
+    x1, y1 = wgs84_to_tile_coord(min_lat, max_lon, zoom)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def tiles_in_polygon(polygon: Sequence[Tuple[float, float]], zoom: int = COVERAGE_ZOOM) -> List[Tile]:
+    """List the map tiles that intersect a polygon.
+
+    Args:
+        polygon: Exterior ring as ``(lat, lon)`` points.
+        zoom: Tile zoom level.
+    """
+    from shapely.geometry import Polygon, box
+    from shapely.prepared import prep
+
+    shape = Polygon([(lon, lat) for lat, lon in polygon])
+    area = prep(shape)
+    min_lon, min_lat, max_lon, max_lat = shape.bounds
+
+    tiles = []
+    for x, y in tiles_in_bbox(min_lat, min_lon, max_lat, max_lon, zoom):
+        north, west = tile_coord_to_wgs84(x, y, zoom)
+        south, east = tile_coord_to_wgs84(x + 1, y + 1, zoom)
+        if area.intersects(box(west, south, east, north)):
+            tiles.append((x, y))
+    return tiles
+
+
+def load_polygon(path: str) -> List[Tuple[float, float]]:
+    """Read the exterior ring of a GeoJSON Polygon (or Feature) as ``(lat, lon)``."""
+    with open(path) as f:
+        geojson = json.load(f)
+    if geojson.get("type") == "FeatureCollection":
+        geojson = geojson["features"][0]
+    if geojson.get("type") == "Feature":
+        geojson = geojson["geometry"]
+    if geojson["type"] != "Polygon":
+        raise ValueError(f"{path}: expected a GeoJSON Polygon, got {geojson['type']}")
+    return [(lat, lon) for lon, lat in geojson["coordinates"][0]]
+
+
+# ---------------------------------------------------------------------------
+# Storage
+# ---------------------------------------------------------------------------
+
+
+class CoverageDB:
+    """SQLite store for crawled panoramas, with the crawl checkpoint.
+
+    Tables:
+        tiles:      one row per finished tile (the checkpoint)
+        panoramas:  one row per panorama ID, indexed by location
+        links:      navigation links between panoramas on the same tile
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS tiles (
+                x INTEGER NOT NULL,
+                y INTEGER NOT NULL,
+                panoramas INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (x, y)
+            );
+            CREATE TABLE IF NOT EXISTS panoramas (
+                id TEXT PRIMARY KEY,
+                lat REAL NOT NULL,
+                lon REAL NOT NULL,
+                heading_deg REAL,
+                pitch_deg REAL,
+                roll_deg REAL,
+                elevation REAL,
+                tile_x INTEGER NOT NULL,
+                tile_y INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS panoramas_location ON panoramas (lat, lon);
+            CREATE TABLE IF NOT EXISTS links (
+                src TEXT NOT NULL,
+                dst TEXT NOT NULL,
+                PRIMARY KEY (src, dst)
+            );
+            """
+        )
+
+    def done_tiles(self) -> Set[Tile]:
+        return set(self._db.execute("SELECT x, y FROM tiles").fetchall())
+
+    def record_tile(self, tile: Tile, panos: list) -> int:
+        """Store a tile's panoramas and mark it done, atomically.
+
+        Returns:
+            How many of the panoramas were new.
+        """
+        x, y = tile
+        self._db.execute("BEGIN")
+        new = self._db.executemany(
+            "INSERT OR IGNORE INTO panoramas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    p.id,
+                    p.lat,
+                    p.lon,
+                    _degrees(p.heading),
+                    _degrees(p.pitch),
+                    _degrees(p.roll),
+                    p.elevation,
+                    x,
+                    y,
+                )
+                for p in panos
+            ],
+        ).rowcount
+        self._db.executemany(
+            "INSERT OR IGNORE INTO links VALUES (?, ?)",
+            [(p.id, link.pano.id) for p in panos for link in (p.links or [])],
+        )
+        self._db.execute(
+            "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", (x, y, len(panos), time.time())
+        )
+        self._db.execute("COMMIT")
+        return new
+
+    def count_panoramas(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM panoramas").fetchone()[0]
+
+    def panoramas_in_bbox(
+        self, min_lat: float, min_lon: float, max_lat: float, max_lon: float
+    ) -> List[tuple]:
+        """Return ``(id, lat, lon)`` rows inside a bounding box."""
+        return self._db.execute(
+            "SELECT id, lat, lon FROM panoramas "
+            "WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?",
+            (min_lat, max_lat, min_lon, max_lon),
+        ).fetchall()
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def _degrees(radians: Optional[float]) -> Optional[float]:
+    return math.degrees(radians) if radians is not None else None
+
+
+# ---------------------------------------------------------------------------
+# Crawling
+# ---------------------------------------------------------------------------
+
+
+async def crawl_async(
+    tiles: Iterable[Tile],
+    db: CoverageDB,
+    client,
+    workers: Optional[int] = None,
+    show_progress: bool = True,
+) -> dict:
+    """Fetch coverage tiles concurrently and record them in ``db``.
+
+    Args:
+        tiles: Tiles to crawl; those already in ``db`` are skipped.
+        db: Output database and checkpoint.
+        client: An open ``StreetViewClient`` (rate limit and retries).
+        workers: Concurrent tile requests. Defaults to the client's
+            connection limit.
+        show_progress: Show a tqdm progress bar.
+
+    Returns:
+        Counts of ``tiles`` fetched, ``skipped`` (already done), ``failed``,
+        and ``new_panoramas``.
+    """
+    from tqdm import tqdm
+
+    done = db.done_tiles()
+    tiles = list(dict.fromkeys(tiles))
+    todo = [t for t in tiles if t not in done]
+    counts = {"tiles": 0, "skipped": len(tiles) - len(todo), "failed": 0, "new_panoramas": 0}
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for tile in todo:
+        queue.put_nowait(tile)
+    progress = tqdm(total=len(todo), desc="Coverage tiles", disable=not show_progress)
+
+    async def worker():
+        while True:
+            try:
+                tile = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                panos = await client.coverage_tile(*tile)
+            except Exception as e:
+                counts["failed"] += 1
+                progress.write(f"Tile {tile} failed: {type(e).__name__}: {e}")
+            else:
+                counts["new_panoramas"] += db.record_tile(tile, panos)
+                counts["tiles"] += 1
+            progress.update(1)
+            progress.set_postfix(panoramas=counts["new_panoramas"])
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(workers or client.concurrency)))
+    finally:
+        progress.close()
+    return counts
+
+
+def crawl(
+    tiles: Iterable[Tile],
+    db_path: str,
+    workers: Optional[int] = None,
+    show_progress: bool = True,
+    **client_kwargs,
+) -> dict:
+    """Blocking wrapper around ``crawl_async``.
+
+    Keyword arguments are passed to ``StreetViewClient`` (``rate``,
+    ``concurrency``, ``retries``, ...).
+    """
+    from .gsv_download import StreetViewClient
+
+    async def run():
+        db = CoverageDB(db_path)
+        try:
+            async with StreetViewClient(**client_kwargs) as client:
+                return await crawl_async(tiles, db, client, workers, show_progress)
+        finally:
+            db.close()
+
+    return asyncio.run(run())
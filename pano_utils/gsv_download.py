@@ -0,0 +1,438 @@
+"""Concurrent Street View downloader with rate limiting and resumable tiles.
+
+``streetview.download_panorama`` fetches one panorama at a time, and the
+demo's route loop waits a fixed ``time.sleep`` between them, so throughput is
+bound by latency. ``StreetViewDownloader`` fetches metadata and image tiles
+for many panoramas at once over a shared aiohttp connection pool:
+
+  - every request first takes a token from a ``TokenBucket``, which keeps the
+    request rate at ``rate`` per second (with bursts up to ``burst``) instead
+    of sleeping blindly
+  - timeouts, connection errors, 429 and 5xx responses are retried with
+    exponential backoff (honoring ``Retry-After``)
+  - tiles are written to a ``.partial/`` directory as they arrive, so an
+    interrupted download resumes from the tiles it already has; finished
+    panoramas are skipped entirely
+
+``tile_url`` can point at a local stand-in server for testing (see
+``benchmarks/gsv_download.py``). With a ``pano_utils.gsv_cache.GSVCache``,
+metadata and tiles that were fetched before are served from the cache, and
+new ones are added to it.
+
+Example:
+    >>> from pano_utils.gsv_download import download_route
+    >>> results = download_route([(42.3601, -71.0868), ...], "assets/route", zoom=3)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import shutil
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import aiohttp
+from streetlevel import streetview
+from streetlevel.exif import save_with_metadata
+from streetlevel.streetview.streetview import _build_output_metadata_object
+from streetlevel.util import stitch_equirectangular_tiles
+
+from .batch import temp_path, write_atomic
+from .gsv_cache import GSVCache, location_key, tile_key
+
+TILE_URL = (
+    "https://streetviewpixels-pa.googleapis.com/v1/tile"
+    "?cb_client=maps_sv.tactile&panoid={pano_id}&x={x}&y={y}&zoom={zoom}"
+)
+
+# Same headers streetlevel sends for tile requests.
+TILE_HEADERS = {
+    "Origin": "https://www.google.com",
+    "Referer": "https://www.google.com/",
+    "User-Agent": "Mozilla/5.0 (Windows NT 11.0; Win64; x64; rv:151.0) Gecko/20100101 Firefox/151.0",
+}
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_MISSING = object()
+
+
+class TokenBucket:
+    """Async token bucket: ``rate`` tokens per second, up to ``burst`` saved.
+
+    Args:
+        rate: Sustained requests per second.
+        burst: Maximum tokens that can accumulate while idle. Defaults to
+            ``rate`` (one second's worth).
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """Wait until ``tokens`` are available and take them."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class RetryableStatus(Exception):
+    """An HTTP response that should be retried (429 / 5xx)."""
+
+    def __init__(self, status: int, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+@dataclass
+class DownloadStats:
+    """Counters for one client session."""
+
+    requests: int = 0
+    retries: int = 0
+    bytes: int = 0
+    tiles_downloaded: int = 0
+    tiles_resumed: int = 0
+    panoramas_downloaded: int = 0
+    panoramas_skipped: int = 0
+    failures: int = 0
+
+
+class StreetViewClient:
+    """Rate-limited, retrying access to Street View metadata.
+
+    Use as an async context manager; it owns the aiohttp session. Every
+    request goes through ``_retrying``, so all requests of one client share
+    the token bucket.
+
+    Args:
+        concurrency: Maximum open connections.
+        rate: Maximum requests per second.
+        burst: Token bucket size. Defaults to ``rate``.
+        retries: Retries per request after the first attempt.
+        backoff: Base delay in seconds; doubles on each retry, with jitter.
+        timeout: Per-request timeout in seconds.
+        cache: Optional ``GSVCache`` for metadata.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 16,
+        rate: float = 20.0,
+        burst: Optional[float] = None,
+        retries: int = 5,
+        backoff: float = 0.5,
+        timeout: float = 30.0,
+        cache: Optional[GSVCache] = None,
+    ):
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = cache
+        self.bucket = TokenBucket(rate, burst)
+        self.stats = DownloadStats()
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.session.close()
+        self.session = None
+
+    async def _retrying(self, make_request):
+        """Run ``make_request()`` under the rate limit, retrying transient errors."""
+        for attempt in range(self.retries + 1):
+            await self.bucket.acquire()
+            self.stats.requests += 1
+            try:
+                return await make_request()
+            except (RetryableStatus, aiohttp.ClientConnectionError,
+                    aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                if attempt == self.retries:
+                    raise
+                self.stats.retries += 1
+                delay = self.backoff * 2**attempt * random.uniform(0.5, 1.5)
+                if isinstance(e, RetryableStatus) and e.retry_after is not None:
+                    delay = max(delay, e.retry_after)
+                await asyncio.sleep(delay)
+
+    async def _cached_metadata(self, key: str, make_request):
+        if self.cache is not None:
+            value = self.cache.get_metadata(key, _MISSING)
+            if value is not _MISSING:
+                return value
+        value = await self._retrying(make_request)
+        if self.cache is not None:
+            self.cache.put_metadata(key, value)
+        return value
+
+    async def find(self, lat: float, lon: float, radius: int = 50):
+        """Find the nearest panorama to a point (``streetview.find_panorama``)."""
+        return await self._cached_metadata(
+            location_key(lat, lon, radius),
+            lambda: streetview.find_panorama_async(lat, lon, self.session, radius=radius),
+        )
+
+    async def find_by_id(self, pano_id: str):
+        """Fetch full metadata for a panorama ID (``streetview.find_panorama_by_id``)."""
+        return await self._cached_metadata(
+            f"pano/{pano_id}",
+            lambda: streetview.find_panorama_by_id_async(pano_id, self.session),
+        )
+
+    async def coverage_tile(self, tile_x: int, tile_y: int) -> list:
+        """Panoramas on a zoom-17 map tile (``streetview.get_coverage_tile``).
+
+        Not cached: coverage changes as new imagery is published.
+        """
+        return await self._retrying(
+            lambda: streetview.get_coverage_tile_async(tile_x, tile_y, self.session)
+        )
+
+
+class StreetViewDownloader(StreetViewClient):
+    """Download many Street View panoramas concurrently.
+
+    Use as an async context manager; it owns the aiohttp session::
+
+        async with StreetViewDownloader("assets/route", zoom=3) as dl:
+            pano = await dl.find(lat, lon)
+            path = await dl.download(pano)
+
+    Args:
+        output_dir: Directory for finished panoramas and ``.partial/`` tiles.
+        zoom: Zoom level to download (0-5).
+        tile_url: Tile URL template with ``{pano_id}``, ``{x}``, ``{y}`` and
+            ``{zoom}`` fields.
+        headers: Headers sent with tile requests.
+        cache: Optional ``GSVCache`` for metadata and tiles. Cached tiles
+            make ``.partial/`` unnecessary, so it is not used.
+        max_panoramas: Panoramas ``download_many`` / ``download_points``
+            download at once. A panorama's tiles stay in memory until it is
+            stitched, so this bounds memory however long the list is.
+        **kwargs: Rate limit and retry settings for ``StreetViewClient``.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        zoom: int = 4,
+        tile_url: str = TILE_URL,
+        headers: Optional[Dict[str, str]] = None,
+        cache: Optional[GSVCache] = None,
+        max_panoramas: int = 8,
+        **kwargs,
+    ):
+        super().__init__(cache=cache, **kwargs)
+        self.output_dir = output_dir
+        self.zoom = zoom
+        self.tile_url = tile_url
+        self.headers = TILE_HEADERS if headers is None else headers
+        self.max_panoramas = max_panoramas
+        # Shared by every download_many / download_points call, so legs
+        # downloaded side by side (gsv_route) share the bound too.
+        self._in_flight = asyncio.Semaphore(max_panoramas)
+        # One download per (panorama, zoom) at a time; later requests for the
+        # same panorama (two waypoints snapping to it) await the first.
+        self._downloads: Dict[Tuple[str, int], asyncio.Future] = {}
+
+    async def __aenter__(self) -> "StreetViewDownloader":
+        os.makedirs(self.output_dir, exist_ok=True)
+        return await super().__aenter__()
+
+    async def _get_bytes(self, url: str) -> bytes:
+        async def request() -> bytes:
+            async with self.session.get(url, headers=self.headers) as response:
+                if response.status in RETRY_STATUSES:
+                    retry_after = response.headers.get("Retry-After")
+                    raise RetryableStatus(
+                        response.status,
+                        float(retry_after) if retry_after and retry_after.isdigit() else None,
+                    )
+                response.raise_for_status()
+                data = await response.read()
+                self.stats.bytes += len(data)
+                return data
+
+        return await self._retrying(request)
+
+    # -- panoramas ---------------------------------------------------------
+
+    def output_path(self, pano) -> str:
+        return os.path.join(self.output_dir, f"{pano.id}.jpg")
+
+    async def download(self, pano, path: Optional[str] = None) -> str:
+        """Download one panorama's tiles concurrently and stitch them.
+
+        Tiles already in ``.partial/`` (or the cache) are reused; a panorama
+        whose output file exists is not downloaded again, and one that is
+        being downloaded is waited for rather than downloaded twice.
+
+        Returns:
+            Path of the stitched equirectangular JPEG.
+        """
+        path = path or self.output_path(pano)
+        key = (pano.id, self.zoom)
+        task = self._downloads.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._download(pano, path))
+            self._downloads[key] = task
+            task.add_done_callback(lambda _: self._downloads.pop(key, None))
+        written = await asyncio.shield(task)
+        if written != path and not os.path.exists(path):
+            tmp_path = temp_path(path)
+            shutil.copyfile(written, tmp_path)
+            os.replace(tmp_path, path)
+        return path
+
+    async def _download(self, pano, path: str) -> str:
+        if os.path.exists(path):
+            self.stats.panoramas_skipped += 1
+            return path
+
+        if pano.is_third_party or not pano.image_sizes or pano.tile_size is None:
+            # Single-image or metadata-less panoramas: let streetlevel handle
+            # them, still rate-limited and retried.
+            if not pano.image_sizes:
+                pano = await self.find_by_id(pano.id)
+            await self._retrying(
+                lambda: streetview.download_panorama_async(pano, path, self.session, zoom=self.zoom)
+            )
+            self.stats.panoramas_downloaded += 1
+            return path
+
+        zoom = min(self.zoom, len(pano.image_sizes) - 1)
+        size = pano.image_sizes[zoom]
+        tile_w, tile_h = pano.tile_size.x, pano.tile_size.y
+        cols = -(-size.x // tile_w)
+        rows = -(-size.y // tile_h)
+
+        parts_dir = os.path.join(self.output_dir, ".partial", f"{pano.id}_z{zoom}")
+        if self.cache is None:
+            os.makedirs(parts_dir, exist_ok=True)
+
+        async def fetch_tile(x: int, y: int) -> Tuple[Tuple[int, int], bytes]:
+            tile_path = os.path.join(parts_dir, f"{x}_{y}.jpg")
+            if self.cache is not None:
+                data = self.cache.get_tile(tile_key(pano.id, zoom, x, y))
+                if data is not None:
+                    self.stats.tiles_resumed += 1
+                    return (x, y), data
+            elif os.path.exists(tile_path):
+                self.stats.tiles_resumed += 1
+                with open(tile_path, "rb") as f:
+                    return (x, y), f.read()
+
+            url = self.tile_url.format(pano_id=pano.id, x=x, y=y, zoom=zoom)
+            data = await self._get_bytes(url)
+            if self.cache is not None:
+                self.cache.put_tile(tile_key(pano.id, zoom, x, y), data)
+            else:
+                write_atomic(tile_path, data)
+            self.stats.tiles_downloaded += 1
+            return (x, y), data
+
+        tiles = dict(
+            await asyncio.gather(*(fetch_tile(x, y) for x in range(cols) for y in range(rows)))
+        )
+
+        # Decoding and encoding are CPU-bound; keep them off the event loop.
+        await asyncio.to_thread(self._stitch, pano, tiles, size, tile_w, tile_h, path)
+        shutil.rmtree(parts_dir, ignore_errors=True)
+        self.stats.panoramas_downloaded += 1
+        return path
+
+    @staticmethod
+    def _stitch(pano, tiles, size, tile_w, tile_h, path) -> None:
+        image = stitch_equirectangular_tiles(tiles, size.x, size.y, tile_w, tile_h)
+        root, ext = os.path.splitext(path)
+        tmp_path = temp_path(root) + ext
+        try:
+            save_with_metadata(
+                image, tmp_path, {}, _build_output_metadata_object(pano, size.x, size.y)
+            )
+        except Exception:
+            # Metadata is a nicety (pyexiv2 may be missing); the pixels are not.
+            image.save(tmp_path)
+        os.replace(tmp_path, path)
+
+    async def download_many(self, panos: Iterable) -> List[Tuple[object, Optional[str], Optional[Exception]]]:
+        """Download panoramas concurrently, ``max_panoramas`` at a time.
+
+        Returns:
+            ``(pano, path, error)`` per panorama, in input order; ``path`` is
+            None if the download failed after all retries.
+        """
+
+        async def one(pano):
+            try:
+                async with self._in_flight:
+                    return pano, await self.download(pano), None
+            except Exception as e:
+                self.stats.failures += 1
+                return pano, None, e
+
+        return list(await asyncio.gather(*(one(p) for p in panos)))
+
+    async def download_points(
+        self, points: Sequence[Tuple[float, float]], radius: int = 50
+    ) -> List[Tuple[object, Optional[str], Optional[Exception]]]:
+        """Find and download the nearest panorama to each point, concurrently.
+
+        Lookups run under the rate limit only; downloads ``max_panoramas``
+        at a time.
+
+        Returns:
+            ``(pano, path, error)`` per point, in input order; ``pano`` is
+            None where no panorama was found.
+        """
+
+        async def one(lat, lon):
+            try:
+                pano = await self.find(lat, lon, radius=radius)
+                if pano is None:
+                    return None, None, None
+                async with self._in_flight:
+                    return pano, await self.download(pano), None
+            except Exception as e:
+                self.stats.failures += 1
+                return None, None, e
+
+        return list(await asyncio.gather(*(one(lat, lon) for lat, lon in points)))
+
+
+def download_route(
+    points: Sequence[Tuple[float, float]], output_dir: str, **kwargs
+) -> List[Tuple[object, Optional[str], Optional[Exception]]]:
+    """Blocking wrapper around ``StreetViewDownloader.download_points``.
+
+    Keyword arguments are passed to ``StreetViewDownloader``.
+    """
+
+    async def run():
+        async with StreetViewDownloader(output_dir, **kwargs) as downloader:
+            return await downloader.download_points(points)
+
+    return asyncio.run(run())
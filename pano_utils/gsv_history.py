@@ -0,0 +1,640 @@
+"""Find what changed between Street View's historical captures.
+
+``gsv_demo.py`` shows the current and the oldest capture of a location side
+by side. Following storefront and signage turnover across a neighborhood
+means reading every capture of every location, although most of a street
+looks the same from one capture to the next. Here captures are compared
+cheaply first, and only what changed is read again:
+
+  - ``streetview_captures`` lists a location's captures (the panorama and
+    its ``historical`` ones) oldest first, with their headings
+  - views are defined by compass bearing instead of panorama yaw and turned
+    into each capture's yaw with its heading, so a view looks at the same
+    facade in every capture
+  - ``view_changes`` scores each view on small projections of the low-zoom
+    panoramas: views are aligned within ``margin`` degrees and compared
+    per color channel after removing mean and spread, so exposure, white
+    balance and the few meters between capture positions count for little
+    and a replaced sign for a lot
+  - only views scoring over ``threshold`` are read again, from just the
+    full-zoom tiles under them; the other views keep the detections of the
+    last capture that read them
+  - each changed view's new detections are matched with its previous ones
+    by text (or label) and bearing, giving what was ``added`` and ``removed``
+
+``track_history`` writes one JSONL record per capture, fsync'ed like
+``batch.run_batch`` output. A rerun replays the records and carries on from
+each location's last capture, so a capture Google adds later is compared
+with the results of earlier runs instead of reprocessing the history.
+
+Example:
+    >>> from pano_utils.gsv_history import OCRViews, track_history
+    >>>
+    >>> counts = track_history(OCRViews(pano_ocr), panos, "history.jsonl")
+    >>> for record in read_jsonl("history.jsonl"):
+    ...     for change in record["added"]:
+    ...         print(record["date"], "new:", change["key"], change["bearing"])
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import math
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from .batch import read_jsonl
+from .coarse_to_fine import ArrayTiles, StreetViewTiles, TileSource, render_view, view_tiles
+from .dedup import unit_vectors, wrap_degrees
+from .panorama import Panorama
+from .projection import RemapCache, project
+from .tracing import NULL_TRACER
+
+# Channels with less spread than this (in gray levels) are featureless
+# (sky, fog, a blank wall); they are not stretched to unit spread.
+_FLAT_STD = 2.0
+
+
+# ---------------------------------------------------------------------------
+# Captures
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class Capture:
+    """One capture of a location.
+
+    Attributes:
+        id: Panorama ID.
+        date: Capture date as sortable text, e.g. ``2019-07``.
+        heading: Compass bearing of the panorama center (yaw 0), in degrees.
+        coarse: Returns the low-resolution panorama as an RGB array.
+        fine: Returns the tile source of the full-resolution panorama.
+    """
+
+    id: str
+    date: str
+    heading: float
+    coarse: Callable[[], np.ndarray] = field(repr=False)
+    fine: Callable[[], TileSource] = field(repr=False)
+
+
+def streetview_captures(
+    pano, gsv=None, coarse_zoom: int = 2, fine_zoom: int = 4, max_age: Optional[float] = 0
+) -> List[Capture]:
+    """Every Street View capture of a location, oldest first.
+
+    Args:
+        pano: Street View panorama or panorama ID; its ``historical`` list
+            gives the other captures.
+        gsv: ``CachedStreetView``. Defaults to the shared cache.
+        coarse_zoom: Zoom of the panoramas the views are compared on.
+        fine_zoom: Zoom the changed views are read at.
+        max_age: Refetch the location's metadata if cached longer ago than
+            this many seconds. Its ``historical`` list grows when Google adds
+            imagery, so by default it is always fetched; None uses ``gsv``'s
+            ``max_age``. The other captures' metadata does not change and is
+            read from the cache.
+    """
+    from .gsv_cache import CachedStreetView
+
+    if gsv is None:
+        gsv = CachedStreetView()
+    full = gsv.find_panorama_by_id(pano if isinstance(pano, str) else pano.id, max_age=max_age)
+    if full is None:
+        return []
+
+    captures = {}
+    for entry in [full, *full.historical]:
+        meta = full if entry.id == full.id else gsv.find_panorama_by_id(entry.id)
+        # Third-party panoramas are not tiled; without a heading they can't be aligned.
+        if meta is None or meta.is_third_party or meta.heading is None or meta.id in captures:
+            continue
+        captures[meta.id] = (
+            (meta.date.year, meta.date.month),
+            Capture(
+                id=meta.id,
+                date=str(meta.date),
+                heading=math.degrees(meta.heading),
+                coarse=lambda meta=meta: np.asarray(gsv.get_panorama(meta, zoom=coarse_zoom).convert("RGB")),
+                fine=lambda meta=meta: StreetViewTiles(meta, fine_zoom, gsv),
+            ),
+        )
+    return [capture for _, capture in sorted(captures.values(), key=lambda dc: dc[0])]
+
+
+def image_capture(
+    path: str, heading: float = 0.0, date: str = "", capture_id: Optional[str] = None, coarse_width: int = 1024
+) -> Capture:
+    """Capture from a panorama file, e.g. repeat shots of a place of your own.
+
+    Args:
+        path: Equirectangular panorama.
+        heading: Compass bearing of its center, in degrees.
+        date: Sortable capture date.
+        capture_id: Defaults to the file path.
+        coarse_width: Width of the copy the views are compared on.
+    """
+    return Capture(
+        id=capture_id or path,
+        date=date,
+        heading=heading,
+        coarse=lambda: Panorama(path).resized(coarse_width),
+        fine=lambda: ArrayTiles(Panorama(path)),
+    )
+
+
+# ---------------------------------------------------------------------------
+# View change scores
+# ---------------------------------------------------------------------------
+
+
+def in_capture(perspective, heading: float):
+    """A view given by compass bearing, as a view of a capture with ``heading``."""
+    return dataclasses.replace(perspective, yaw_offset=wrap_degrees(perspective.yaw_offset - heading))
+
+
+def _small_view(perspective, heading: float, size: int, margin: float = 0.0):
+    """``in_capture`` view ``size`` px wide, widened by ``margin`` degrees on each side."""
+    h_fov, v_fov = perspective.horizontal_fov, perspective.vertical_fov
+    height = size * perspective.pixel_height / perspective.pixel_width
+
+    def widen(fov: float, pixels: float) -> Tuple[float, int]:
+        wide = min(fov + 2 * margin, 179.0)
+        return wide, max(1, round(pixels * math.tan(math.radians(wide) / 2) / math.tan(math.radians(fov) / 2)))
+
+    h_fov, width = widen(h_fov, size)
+    v_fov, height = widen(v_fov, height)
+    return dataclasses.replace(
+        in_capture(perspective, heading),
+        pixel_width=width,
+        pixel_height=height,
+        horizontal_fov=h_fov,
+        vertical_fov=v_fov,
+    )
+
+
+def _standardize(view: np.ndarray) -> np.ndarray:
+    """Blurred view with each channel at zero mean and unit spread."""
+    view = cv2.GaussianBlur(view.astype(np.float32), (0, 0), 1.0)
+    return (view - view.mean(axis=(0, 1))) / np.maximum(view.std(axis=(0, 1)), _FLAT_STD)
+
+
+def view_changes(
+    before: np.ndarray,
+    before_heading: float,
+    after: np.ndarray,
+    after_heading: float,
+    perspectives: Sequence,
+    *,
+    size: int = 96,
+    margin: float = 4.0,
+    cell: int = 4,
+    cache: Optional[RemapCache] = None,
+) -> np.ndarray:
+    """How much each view changed between two captures.
+
+    Each view of ``after`` is projected ``size`` px wide and aligned with
+    the same view of ``before``, widened by ``margin`` degrees on each side
+    to absorb heading error and the offset between capture positions. Both
+    are brought to zero mean and unit spread per color channel, which
+    cancels exposure and white balance. The score is the largest mean
+    absolute difference over ``cell`` px squares, in standard deviations,
+    so one replaced sign stands out however much of the view is unchanged.
+    Unchanged views score around 0.2–0.3 and a replaced sign about 1 or
+    more; passing cars and pedestrians, and parallax from capture
+    positions far apart, also score high.
+
+    Args:
+        before: Earlier capture, as a (low-resolution) RGB panorama.
+        before_heading: Its heading in degrees.
+        after: Later capture.
+        after_heading: Its heading in degrees.
+        perspectives: Views, with ``yaw_offset`` as a compass bearing.
+        size: Width the views are compared at.
+        margin: Misalignment tolerated, in degrees.
+        cell: Size of the squares differences are averaged over, in pixels.
+        cache: RemapCache for the small views. Defaults to the shared cache.
+
+    Returns:
+        Array of scores, one per view.
+    """
+    scores = np.zeros(len(perspectives), dtype=np.float64)
+    for i, perspective in enumerate(perspectives):
+        wide = _standardize(project(before, _small_view(perspective, before_heading, size, margin), cache))
+        view = _standardize(project(after, _small_view(perspective, after_heading, size), cache))
+        height, width = view.shape[:2]
+        correlation = cv2.matchTemplate(wide.mean(axis=2), view.mean(axis=2), cv2.TM_CCOEFF_NORMED)
+        if np.isfinite(correlation).all():
+            _, _, _, (left, top) = cv2.minMaxLoc(correlation)
+        else:  # a featureless view: no alignment to find
+            top, left = (wide.shape[0] - height) // 2, (wide.shape[1] - width) // 2
+        difference = np.abs(wide[top : top + height, left : left + width] - view).mean(axis=2)
+        cells = cv2.resize(
+            difference,
+            (max(1, width // cell), max(1, height // cell)),
+            interpolation=cv2.INTER_AREA,
+        )
+        scores[i] = float(cells.max())
+    return scores
+
+
+# ---------------------------------------------------------------------------
+# Detectors
+# ---------------------------------------------------------------------------
+
+
+class OCRViews:
+    """Read single views with a PanoOCR engine.
+
+    Detections are ``SphereOCRResult`` dicts in the capture's yaw.
+
+    Args:
+        pano_ocr: Configured ``panoocr.PanoOCR``; its views are the default.
+        min_text_similarity: Normalized Levenshtein similarity for two reads
+            to be the same text.
+    """
+
+    def __init__(self, pano_ocr, min_text_similarity: float = 0.6):
+        self.pano_ocr = pano_ocr
+        self.perspectives = list(pano_ocr.perspectives)
+        self.min_text_similarity = min_text_similarity
+
+    def detect(self, view: Image.Image, perspective, index: int) -> List[dict]:
+        return [
+            flat.to_sphere(
+                horizontal_fov=perspective.horizontal_fov,
+                vertical_fov=perspective.vertical_fov,
+                yaw_offset=perspective.yaw_offset,
+                pitch_offset=perspective.pitch_offset,
+            ).to_dict()
+            for flat in self.pano_ocr.engine.recognize(view)
+        ]
+
+    def describe(self, detection: dict) -> Tuple[str, float, float, float]:
+        """``(key, score, yaw, pitch)`` of a detection."""
+        return detection["text"], detection["confidence"], detection["yaw"], detection["pitch"]
+
+    def similar(self, key: str, other: str) -> bool:
+        from .streaming import similar_text
+
+        return similar_text(key, other, self.min_text_similarity)
+
+
+class SegmentationViews:
+    """Segment single views with PanoSAM for one prompt.
+
+    Detections are ``SphereMaskResult`` dicts in the capture's yaw, keyed
+    by label.
+
+    Args:
+        client: Configured ``panosam.PanoSAM``; its views are the default.
+        prompt: Text prompt, e.g. ``"storefront sign"``.
+        options: SegmentationOptions; defaults to the client's.
+    """
+
+    def __init__(self, client, prompt: str, options=None):
+        from .sam_embeddings import PromptSegmenter
+
+        self.prompt = prompt
+        self.options = options or client.default_options
+        self.perspectives = list(client._perspectives)
+        self._segmenter = PromptSegmenter(client.engine)
+
+    def detect(self, view: Image.Image, perspective, index: int) -> List[dict]:
+        from .pipeline import _masks_to_sphere
+
+        masks = self._segmenter.segment(
+            view,
+            [self.prompt],
+            threshold=self.options.threshold,
+            mask_threshold=self.options.mask_threshold,
+            simplify_tolerance=self.options.simplify_tolerance,
+        )[self.prompt]
+        return [m.to_dict() for m in _masks_to_sphere(masks, perspective, index, self.prompt)]
+
+    def describe(self, detection: dict) -> Tuple[str, float, float, float]:
+        """``(key, score, yaw, pitch)`` of a detection."""
+        return (
+            detection.get("label") or self.prompt,
+            detection["score"],
+            detection["center_yaw"],
+            detection["center_pitch"],
+        )
+
+    def similar(self, key: str, other: str) -> bool:
+        return key == other
+
+
+# ---------------------------------------------------------------------------
+# Diffing detections
+# ---------------------------------------------------------------------------
+
+
+def _changes(detector, detections: Sequence[dict], heading: float, view: int, capture: str) -> List[dict]:
+    """Detections as change entries, with their compass bearing."""
+    entries = []
+    for detection in detections:
+        key, score, yaw, pitch = detector.describe(detection)
+        entries.append(
+            {
+                "view": view,
+                "capture": capture,
+                "key": key,
+                "score": score,
+                "bearing": round(wrap_degrees(yaw + heading) % 360.0, 3),
+                "pitch": pitch,
+                "detection": detection,
+            }
+        )
+    return entries
+
+
+def match_changes(detector, before: Sequence[dict], after: Sequence[dict], match_angle: float) -> List[Tuple[int, int]]:
+    """``(before index, after index)`` pairs of the same thing, closest first.
+
+    Two entries match when their keys are ``detector.similar`` and their
+    bearing / pitch are within ``match_angle`` degrees; each entry is used
+    at most once.
+    """
+    if not before or not after:
+        return []
+    a = unit_vectors([e["bearing"] for e in before], [e["pitch"] for e in before])
+    b = unit_vectors([e["bearing"] for e in after], [e["pitch"] for e in after])
+    angle = np.degrees(np.arccos(np.clip(a @ b.T, -1.0, 1.0)))
+    pairs, used_a, used_b = [], set(), set()
+    for i, j in sorted(np.argwhere(angle <= match_angle).tolist(), key=lambda ij: angle[ij[0], ij[1]]):
+        if i in used_a or j in used_b:
+            continue
+        if detector.similar(before[i]["key"], after[j]["key"]):
+            pairs.append((i, j))
+            used_a.add(i)
+            used_b.add(j)
+    return pairs
+
+
+def _unique(detector, entries: List[dict], match_angle: float) -> List[dict]:
+    """Keep the best-scored of entries that match (a sign seen by two overlapping views)."""
+    entries = sorted(entries, key=lambda e: e["score"], reverse=True)
+    if len(entries) < 2:
+        return entries
+    vectors = unit_vectors([e["bearing"] for e in entries], [e["pitch"] for e in entries])
+    angle = np.degrees(np.arccos(np.clip(vectors @ vectors.T, -1.0, 1.0)))
+    kept: List[int] = []
+    for j in range(len(entries)):
+        if not any(
+            angle[i, j] <= match_angle and detector.similar(entries[i]["key"], entries[j]["key"]) for i in kept
+        ):
+            kept.append(j)
+    return [entries[j] for j in kept]
+
+
+# ---------------------------------------------------------------------------
+# Comparing captures
+# ---------------------------------------------------------------------------
+
+
+def compare_captures(
+    detector,
+    captures: Sequence[Capture],
+    *,
+    perspectives: Optional[Sequence] = None,
+    state: Optional[Dict[int, dict]] = None,
+    previous: Optional[Capture] = None,
+    threshold: float = 0.6,
+    size: int = 96,
+    margin: float = 4.0,
+    match_angle: float = 3.0,
+    cache: Optional[RemapCache] = None,
+    tracer=None,
+) -> Iterator[dict]:
+    """Yield a change record for each capture of one location, in order.
+
+    The first capture without a ``previous`` one is the baseline: all of
+    its views are read, and everything it found counts as added.
+
+    Args:
+        detector: ``OCRViews`` or ``SegmentationViews``.
+        captures: Captures to process, oldest first.
+        perspectives: Views, with ``yaw_offset`` as a compass bearing.
+            Defaults to the detector's views (bearings relative to north).
+        state: ``{view: {"capture", "heading", "detections"}}`` of the
+            captures already processed (see ``replay_state``). Updated in
+            place.
+        previous: Last capture already processed, which the first of
+            ``captures`` is compared with.
+        threshold: Change score (see ``view_changes``) over which a view is
+            read again.
+        size: Width the views are compared at.
+        margin: Misalignment tolerated by the comparison, in degrees.
+        match_angle: Distance in degrees within which a detection of the
+            new capture is the same as one of the old.
+        cache: RemapCache for the small comparison views.
+        tracer: Optional ``tracing.Tracer``; records ``coarse``,
+            ``view_diff``, ``fetch_tiles``, ``project``, ``inference`` and
+            ``diff`` spans and ``views`` / ``views_read`` counters.
+
+    Yields:
+        Dicts with ``capture``, ``date``, ``heading``, ``previous``,
+        ``scores`` (None for the baseline), ``changed_views``, ``views``
+        (the new detections of each changed view), and ``added`` /
+        ``removed`` change entries with ``view``, ``capture``, ``key``,
+        ``score``, ``bearing``, ``pitch`` and ``detection``.
+    """
+    tracer = tracer or NULL_TRACER
+    perspectives = list(perspectives) if perspectives is not None else detector.perspectives
+    state = state if state is not None else {}
+    previous_coarse = None
+
+    for capture in captures:
+        with tracer.span("coarse", capture=capture.id):
+            coarse = capture.coarse()
+        if previous is None:
+            scores = None
+            changed = list(range(len(perspectives)))
+        else:
+            if previous_coarse is None:
+                with tracer.span("coarse", capture=previous.id):
+                    previous_coarse = previous.coarse()
+            with tracer.span("view_diff", capture=capture.id) as args:
+                scores = view_changes(
+                    previous_coarse,
+                    previous.heading,
+                    coarse,
+                    capture.heading,
+                    perspectives,
+                    size=size,
+                    margin=margin,
+                    cache=cache,
+                )
+                changed = [i for i, score in enumerate(scores) if score > threshold]
+                args["changed"] = len(changed)
+        tracer.count("views", len(perspectives))
+        tracer.count("views_read", len(changed))
+
+        views = {}
+        if changed:
+            fine = capture.fine()
+            local = {i: in_capture(perspectives[i], capture.heading) for i in changed}
+            with tracer.span("fetch_tiles", capture=capture.id) as args:
+                tiles = fine.get_tiles(set().union(*(view_tiles(fine, v) for v in local.values())))
+                args["tiles"] = len(tiles)
+            for i, view in local.items():
+                with tracer.span("project", view=i):
+                    image = Image.fromarray(render_view(fine, view, tiles))
+                with tracer.span("inference", view=i) as args:
+                    views[i] = detector.detect(image, view, i)
+                    args["detections"] = len(views[i])
+
+        with tracer.span("diff", capture=capture.id):
+            added, removed = [], []
+            for i, detections in views.items():
+                new = _changes(detector, detections, capture.heading, i, capture.id)
+                old_state = state.get(i)
+                old = (
+                    _changes(detector, old_state["detections"], old_state["heading"], i, old_state["capture"])
+                    if old_state is not None
+                    else []
+                )
+                pairs = match_changes(detector, old, new, match_angle)
+                matched_old = {a for a, _ in pairs}
+                matched_new = {b for _, b in pairs}
+                removed.extend(e for k, e in enumerate(old) if k not in matched_old)
+                added.extend(e for k, e in enumerate(new) if k not in matched_new)
+                state[i] = {"capture": capture.id, "heading": capture.heading, "detections": detections}
+
+        yield {
+            "capture": capture.id,
+            "date": capture.date,
+            "heading": capture.heading,
+            "previous": previous.id if previous is not None else None,
+            "scores": [round(float(s), 4) for s in scores] if scores is not None else None,
+            "changed_views": changed,
+            "views": {str(i): detections for i, detections in views.items()},
+            "added": _unique(detector, added, match_angle),
+            "removed": _unique(detector, removed, match_angle),
+        }
+        previous, previous_coarse = capture, coarse
+
+
+def replay_state(records: Iterable[dict]) -> Dict[int, dict]:
+    """Rebuild ``compare_captures`` state from its records, in order."""
+    state: Dict[int, dict] = {}
+    for record in records:
+        for view, detections in record["views"].items():
+            state[int(view)] = {
+                "capture": record["capture"],
+                "heading": record["heading"],
+                "detections": detections,
+            }
+    return state
+
+
+# ---------------------------------------------------------------------------
+# Many locations
+# ---------------------------------------------------------------------------
+
+
+def track_history(
+    detector,
+    panos: Iterable,
+    output_path: str,
+    *,
+    gsv=None,
+    coarse_zoom: int = 2,
+    fine_zoom: int = 4,
+    max_age: Optional[float] = 0,
+    resume: bool = True,
+    on_record: Optional[Callable[[dict], None]] = None,
+    tracer=None,
+    **compare_kwargs,
+) -> dict:
+    """Compare the historical captures of many Street View locations.
+
+    Each location's captures go through ``compare_captures`` and each
+    record is appended to ``output_path`` with the location's panorama ID
+    as ``location``. With ``resume``, captures already in the file are
+    skipped and the next ones are compared with the last one recorded;
+    captures dated before it (imagery Google added later) are left out.
+
+    Args:
+        detector: ``OCRViews`` or ``SegmentationViews``.
+        panos: Street View panoramas or panorama IDs, one per location.
+        output_path: JSONL file to append records to.
+        gsv: ``CachedStreetView``. Defaults to the shared cache.
+        coarse_zoom: Zoom the views are compared at.
+        fine_zoom: Zoom changed views are read at.
+        max_age: Refetch each location's metadata cached longer ago than this
+            many seconds (see ``streetview_captures``). The default, 0,
+            finds captures added since the last run.
+        resume: Continue from the records already in ``output_path``.
+        on_record: Called with each record after it is written.
+        tracer: Optional ``tracing.Tracer``.
+        **compare_kwargs: ``compare_captures`` options (``perspectives``,
+            ``threshold``, ``size``, ``margin``, ``match_angle``).
+
+    Returns:
+        Counters: ``locations``, ``captures``, ``skipped``, ``views``,
+        ``views_read``, ``added``, ``removed``.
+    """
+    from .gsv_cache import CachedStreetView
+
+    if gsv is None:
+        gsv = CachedStreetView()
+    done: Dict[str, List[dict]] = {}
+    if resume:
+        for record in read_jsonl(output_path):
+            done.setdefault(record["location"], []).append(record)
+
+    perspectives = compare_kwargs.get("perspectives") or detector.perspectives
+    cache = RemapCache(maxsize=max(64, 2 * len(perspectives)))
+    counts = {"locations": 0, "captures": 0, "skipped": 0, "views": 0, "views_read": 0, "added": 0, "removed": 0}
+
+    directory = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(directory, exist_ok=True)
+    with open(output_path, "a") as out:
+        for pano in panos:
+            location = pano if isinstance(pano, str) else pano.id
+            captures = streetview_captures(pano, gsv, coarse_zoom, fine_zoom, max_age)
+            records = done.get(location, [])
+            previous = None
+            if records:
+                last = records[-1]["capture"]
+                previous = next((c for c in captures if c.id == last), None)
+                if previous is None:
+                    # The last capture is gone from Street View; start over.
+                    records = []
+            processed = {r["capture"] for r in records}
+            todo = [
+                c for c in captures if c.id not in processed and (previous is None or c.date >= previous.date)
+            ]
+            counts["locations"] += 1
+            counts["skipped"] += len(captures) - len(todo)
+
+            for record in compare_captures(
+                detector,
+                todo,
+                state=replay_state(records),
+                previous=previous,
+                cache=cache,
+                tracer=tracer,
+                **compare_kwargs,
+            ):
+                record = {"location": location, **record}
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                os.fsync(out.fileno())
+                counts["captures"] += 1
+                counts["views"] += len(perspectives)
+                counts["views_read"] += len(record["changed_views"])
+                counts["added"] += len(record["added"])
+                counts["removed"] += len(record["removed"])
+                if on_record is not None:
+                    on_record(record)
+    return counts
@@ -0,0 +1,256 @@
+"""Walk the Street View panorama graph along a route.
+
+Looking up the nearest panorama for each waypoint costs one search per point
+and only returns the panoramas at those points: sparse waypoints skip the
+panoramas in between, and dense ones return the same panorama repeatedly.
+``find_panorama_by_id`` already returns each panorama's ``links`` (the
+navigation arrows) and ``neighbors``, so a route can instead be walked on
+that graph:
+
+  - greedy best-first (or A*) search from the start panorama towards each
+    waypoint, with great-circle distance as both edge cost and heuristic
+  - node metadata is fetched once and kept for the whole walk (and in a
+    ``GSVCache`` if the client has one); the most promising frontier nodes
+    are fetched ahead of time, concurrently
+  - once a leg is found, its panoramas start downloading in the background
+    while the next leg is searched
+
+The result is every panorama along the way, in order, without duplicates.
+
+Example:
+    >>> from pano_utils.gsv_route import walk_route
+    >>> for pano, path, error in walk_route(waypoints, "assets/route", zoom=3):
+    ...     print(pano.id, path)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def distance_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle (haversine) distance in meters."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _edges(pano) -> list:
+    """Panoramas reachable from ``pano``: navigation links first, then neighbors."""
+    seen = set()
+    edges = []
+    for other in [link.pano for link in (pano.links or [])] + list(pano.neighbors or []):
+        if other.id in seen or other.id == pano.id or other.lat is None or other.lon is None:
+            continue
+        seen.add(other.id)
+        edges.append(other)
+    return edges
+
+
+class RouteWalker:
+    """Search the panorama graph with a ``StreetViewClient``.
+
+    Args:
+        client: An open ``StreetViewClient`` (or ``StreetViewDownloader``).
+        strategy: ``"greedy"`` always expands the node closest to the
+            target: about one metadata request per panorama on the route.
+            ``"astar"`` finds the shortest path on the graph, but on street
+            grids expands several times more nodes.
+        arrive_within: A waypoint is reached at a panorama this close (m).
+        max_expansions: Give up on a leg after this many expanded nodes and
+            end it at the panorama closest to the waypoint.
+        prefetch: Frontier nodes to fetch ahead of time. Higher hides more
+            latency at the cost of some requests for nodes never expanded.
+
+    Attributes:
+        expansions: Nodes expanded so far, across legs.
+    """
+
+    def __init__(
+        self,
+        client,
+        strategy: str = "greedy",
+        arrive_within: float = 10.0,
+        max_expansions: int = 500,
+        prefetch: int = 2,
+    ):
+        if strategy not in ("astar", "greedy"):
+            raise ValueError(f"Unknown strategy {strategy!r}")
+        self.client = client
+        self.strategy = strategy
+        self.arrive_within = arrive_within
+        self.max_expansions = max_expansions
+        self.prefetch = prefetch
+        self.expansions = 0
+        self._nodes: Dict[str, asyncio.Task] = {}
+
+    def _load(self, pano_id: str) -> asyncio.Task:
+        """Start (or reuse) the metadata request for a panorama."""
+        if pano_id not in self._nodes:
+            task = asyncio.ensure_future(self.client.find_by_id(pano_id))
+            # Prefetched nodes may never be awaited; don't warn about their errors.
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._nodes[pano_id] = task
+        return self._nodes[pano_id]
+
+    async def node(self, pano_id: str):
+        """Full metadata (with links and neighbors) for a panorama."""
+        return await self._load(pano_id)
+
+    async def find_path(self, start, target: Tuple[float, float]) -> list:
+        """Panoramas from ``start`` to the one nearest ``target``, in order.
+
+        Args:
+            start: Start panorama (only its ID is used).
+            target: Waypoint ``(lat, lon)``.
+
+        Returns:
+            Full-metadata panoramas, starting with ``start``.
+        """
+        lat, lon = target
+        start = await self.node(start.id)
+        g = {start.id: 0.0}
+        parent: Dict[str, Optional[str]] = {start.id: None}
+        positions = {start.id: (start.lat, start.lon)}
+        counter = itertools.count()
+        # Ties (common on street grids) go to the node closer to the target.
+        frontier = [(0.0, 0.0, next(counter), start.id)]
+        closed = set()
+        best_id, best_distance = start.id, math.inf
+        expansions = 0
+
+        while frontier and expansions < self.max_expansions:
+            *_, pano_id = heapq.heappop(frontier)
+            if pano_id in closed:
+                continue
+            closed.add(pano_id)
+
+            here = distance_m(*positions[pano_id], lat, lon)
+            if here < best_distance:
+                best_id, best_distance = pano_id, here
+            if here <= self.arrive_within:
+                break
+
+            # Fetch the next likely expansions while this one is processed.
+            for *_, upcoming in heapq.nsmallest(self.prefetch, frontier):
+                if upcoming not in closed:
+                    self._load(upcoming)
+
+            try:
+                pano = await self.node(pano_id)
+            except Exception:
+                pano = None
+            expansions += 1
+            if pano is None:
+                continue
+            for other in _edges(pano):
+                step = distance_m(pano.lat, pano.lon, other.lat, other.lon)
+                cost = g[pano_id] + step
+                if cost >= g.get(other.id, math.inf):
+                    continue
+                g[other.id] = cost
+                parent[other.id] = pano_id
+                positions[other.id] = (other.lat, other.lon)
+                h = distance_m(other.lat, other.lon, lat, lon)
+                priority = h if self.strategy == "greedy" else cost + h
+                heapq.heappush(frontier, (round(priority, 3), h, next(counter), other.id))
+
+        self.expansions += expansions
+
+        ids = []
+        pano_id = best_id
+        while pano_id is not None:
+            ids.append(pano_id)
+            pano_id = parent[pano_id]
+        return list(await asyncio.gather(*(self.node(i) for i in reversed(ids))))
+
+    async def walk(self, waypoints: Sequence[Tuple[float, float]], on_leg=None) -> list:
+        """Walk through all waypoints, starting at the panorama nearest the first.
+
+        Args:
+            waypoints: ``(lat, lon)`` points, at least one.
+            on_leg: Called with each leg's new panoramas as soon as it is found.
+
+        Returns:
+            Panoramas along the route, in order, each once.
+        """
+        start = await self.client.find(*waypoints[0])
+        if start is None:
+            raise LookupError(f"No panorama found near {waypoints[0]}")
+        start = await self.node(start.id)
+
+        route = [start]
+        seen = {start.id}
+        if on_leg:
+            on_leg([start])
+        current = start
+        for waypoint in waypoints[1:]:
+            leg = await self.find_path(current, waypoint)
+            current = leg[-1]
+            new = [p for p in leg if p.id not in seen]
+            seen.update(p.id for p in new)
+            route.extend(new)
+            if on_leg and new:
+                on_leg(new)
+        return route
+
+
+async def walk_route_async(
+    downloader,
+    waypoints: Sequence[Tuple[float, float]],
+    **walker_kwargs,
+) -> List[Tuple[object, Optional[str], Optional[Exception]]]:
+    """Walk a route and download its panoramas, one leg behind the search.
+
+    Args:
+        downloader: An open ``StreetViewDownloader``; metadata and images
+            share its rate limit.
+        waypoints: ``(lat, lon)`` points.
+        **walker_kwargs: Passed to ``RouteWalker``.
+
+    Returns:
+        ``(pano, path, error)`` for every panorama along the route, in order.
+    """
+    walker = RouteWalker(downloader, **walker_kwargs)
+    downloads: List[asyncio.Task] = []
+    await walker.walk(
+        waypoints,
+        on_leg=lambda leg: downloads.append(
+            asyncio.ensure_future(downloader.download_many(leg))
+        ),
+    )
+    results = []
+    for leg in await asyncio.gather(*downloads):
+        results.extend(leg)
+    return results
+
+
+def walk_route(
+    waypoints: Sequence[Tuple[float, float]],
+    output_dir: str,
+    strategy: str = "greedy",
+    arrive_within: float = 10.0,
+    **kwargs,
+) -> List[Tuple[object, Optional[str], Optional[Exception]]]:
+    """Blocking wrapper around ``walk_route_async``.
+
+    Other keyword arguments are passed to ``StreetViewDownloader`` (``zoom``,
+    ``rate``, ``cache``, ...).
+    """
+    from .gsv_download import StreetViewDownloader
+
+    async def run():
+        async with StreetViewDownloader(output_dir, **kwargs) as downloader:
+            return await walk_route_async(
+                downloader, waypoints, strategy=strategy, arrive_within=arrive_within
+            )
+
+    return asyncio.run(run())
@@ -0,0 +1,328 @@
+"""Level-of-detail label tiles for the 3D preview.
+
+The OCR preview builds a Three.js group, plane and canvas texture per
+detection. That is fine for a few hundred detections, but a dense
+storefront panorama or a merged video walk has thousands, and every one of
+them is loaded, drawn and kept in GPU memory whatever the view.
+``export_label_tiles`` turns the detections of one panorama into a tile
+pyramid the preview can stream instead:
+
+  - level ``L`` splits the sphere into ``(90 / 2^L)``° yaw/pitch tiles
+    (4 × 2 tiles at level 0)
+  - detections are placed, most important first (confidence × angular
+    size), on the coarsest level whose tile still has room for them, at
+    most ``max_per_tile`` per tile; the finest level takes the rest
+  - each tile is a JSON file plus one label atlas PNG: every label is
+    pre-rendered in the preview's style and packed into shelves, so a tile
+    is one texture and one draw call
+
+The preview loads the levels up to the current zoom, and of those only the
+tiles facing the camera, and drops the others. How many labels are in
+memory then depends on the screen, not on the detection count.
+
+Layout::
+
+    <output>/index.json        levels, and the non-empty tiles of each
+    <output>/<L>/<col>_<row>.json
+    <output>/<L>/<col>_<row>.png
+
+Example:
+    >>> from pano_utils.label_tiles import export_label_tiles
+    >>>
+    >>> stats = export_label_tiles("assets/cambridge-central-square-ocr.json",
+    ...                            "assets/cambridge-central-square-tiles")
+
+Command line::
+
+    python -m pano_utils.label_tiles assets/cambridge-central-square-ocr.json \\
+        assets/cambridge-central-square-tiles
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import math
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+from .batch import read_jsonl, write_atomic
+
+TILE_FORMAT_VERSION = 1
+
+# Yaw/pitch size of a level-0 tile.
+TILE_DEGREES = 90.0
+
+# Label style of the preview's createTextSprite(): 2x canvas scale,
+# 40 px text on a 60 px high, 60% black box, 20 px side padding.
+LABEL_HEIGHT = 60
+LABEL_PADDING = 20
+FONT_SIZE = 40
+TEXT_BASELINE = 44
+
+# ---------------------------------------------------------------------------
+# Reading detections
+# ---------------------------------------------------------------------------
+
+
+def _as_dicts(results) -> List[dict]:
+    """Result dicts from an OCRResult, a ``to_dict()`` dict or a list."""
+    if hasattr(results, "to_dict"):
+        results = results.to_dict()
+    if isinstance(results, dict):
+        results = results["results"]
+    return [r.to_dict() if hasattr(r, "to_dict") else r for r in results]
+
+
+def read_detections(path: str) -> Dict[str, List[dict]]:
+    """Detections per panorama in a results file.
+
+    Reads ``OCRResult.save_json`` and ``columnar`` files, ``batch_ocr.py``
+    JSONL (one entry per panorama) and ``stream_ocr.py`` JSONL, whose
+    tracks are merged into a single entry keyed by the file name.
+    """
+    from .text_index import panorama_id, read_results
+
+    if path.endswith(".jsonl"):
+        tracks = []
+        panoramas = {}
+        for record in read_jsonl(path):
+            if "detection" in record:
+                tracks.append(record["detection"])
+            elif record.get("status", "ok") == "ok" and "result" in record:
+                panoramas[panorama_id(record["image"])] = record["result"]["results"]
+        if tracks:
+            panoramas[panorama_id(path)] = tracks
+        return panoramas
+    return {panorama_id(image): results for image, results in read_results(path)}
+
+
+# ---------------------------------------------------------------------------
+# Pyramid
+# ---------------------------------------------------------------------------
+
+
+def tile_degrees(level: int) -> float:
+    """Yaw/pitch size of a tile at ``level``."""
+    return TILE_DEGREES / (1 << level)
+
+
+def tile_of(yaw: float, pitch: float, level: int) -> Tuple[int, int]:
+    """``(col, row)`` of the tile holding a direction; row 0 is at the zenith."""
+    size = tile_degrees(level)
+    cols = 4 << level
+    rows = 2 << level
+    col = int(math.floor((yaw + 180.0) / size)) % cols
+    row = min(rows - 1, max(0, int(math.floor((90.0 - pitch) / size))))
+    return col, row
+
+
+def importance(result: dict) -> float:
+    """Placement priority: confident, large detections go to coarse levels."""
+    size = math.sqrt(max(result.get("width", 0.0), 0.0) * max(result.get("height", 0.0), 0.0))
+    return result.get("confidence", 1.0) * size
+
+
+def build_pyramid(
+    results: Sequence[dict], max_per_tile: int = 24, max_level: int = 4
+) -> Dict[Tuple[int, int, int], List[dict]]:
+    """Place every detection in exactly one tile of the pyramid.
+
+    Args:
+        results: Detection dicts with yaw, pitch, width, height, confidence.
+        max_per_tile: Labels per tile on every level but the finest.
+        max_level: Finest level; its tiles take all remaining detections.
+
+    Returns:
+        ``{(level, col, row): detections}``, most important first.
+    """
+    tiles: Dict[Tuple[int, int, int], List[dict]] = {}
+    for result in sorted(results, key=importance, reverse=True):
+        for level in range(max_level + 1):
+            key = (level, *tile_of(result["yaw"], result["pitch"], level))
+            labels = tiles.setdefault(key, [])
+            if level == max_level or len(labels) < max_per_tile:
+                labels.append(result)
+                break
+    return {key: labels for key, labels in tiles.items() if labels}
+
+
+# ---------------------------------------------------------------------------
+# Label atlases
+# ---------------------------------------------------------------------------
+
+
+def label_text(result: dict) -> str:
+    """Label as the preview shows it: text and confidence."""
+    return f"{result['text']} ({result.get('confidence', 1.0) * 100:.0f}%)"
+
+
+def load_font(path: Optional[str] = None, size: int = FONT_SIZE):
+    """TrueType font at ``path``, or Pillow's built-in scalable font."""
+    if path:
+        return ImageFont.truetype(path, size)
+    return ImageFont.load_default(size=size)
+
+
+def render_atlas(
+    texts: Sequence[str], font, max_width: int = 2048
+) -> Tuple[Image.Image, List[List[int]]]:
+    """Render labels into shelves of one gray + alpha image.
+
+    Args:
+        texts: Label texts.
+        font: PIL font (see ``load_font``).
+        max_width: Atlas width limit; longer labels are cut off.
+
+    Returns:
+        Tuple of (atlas image, ``[x, y, w, h]`` pixel rectangle per label).
+    """
+    widths = [min(max_width, math.ceil(font.getlength(t)) + 2 * LABEL_PADDING) for t in texts]
+    rects = []
+    x = y = 0
+    for w in widths:
+        if x + w > max_width:
+            x, y = 0, y + LABEL_HEIGHT
+        rects.append([x, y, w, LABEL_HEIGHT])
+        x += w
+    width = max((r[0] + r[2] for r in rects), default=1)
+    height = max(y + LABEL_HEIGHT, 1) if rects else 1
+
+    atlas = Image.new("LA", (width, height), (0, 0))
+    draw = ImageDraw.Draw(atlas)
+    for text, (x, y, w, h) in zip(texts, rects):
+        # A cut-off label fills its shelf, so its text runs off the atlas edge
+        # rather than into a neighbor.
+        draw.rectangle((x, y, x + w - 1, y + h - 1), fill=(0, 153))
+        draw.text((x + LABEL_PADDING // 2, y + TEXT_BASELINE), text, font=font, fill=(255, 255), anchor="ls")
+    return atlas, rects
+
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+
+def export_label_tiles(
+    results,
+    output_dir: str,
+    *,
+    max_per_tile: int = 24,
+    max_level: int = 4,
+    min_confidence: float = 0.0,
+    atlas_width: int = 2048,
+    font: Optional[str] = None,
+) -> dict:
+    """Write the label tile pyramid of one panorama.
+
+    Args:
+        results: OCRResult, result dict / list, or a results file path
+            holding one panorama (see ``read_detections``).
+        output_dir: Tile directory; existing tiles are replaced.
+        max_per_tile: Labels per tile on the coarse levels.
+        max_level: Finest level (``90 / 2^max_level``° tiles).
+        min_confidence: Leave out detections below this confidence.
+        atlas_width: Width limit of the label atlases in pixels.
+        font: TrueType font file for the labels. Defaults to Pillow's.
+
+    Returns:
+        Counters: ``detections``, ``tiles``, ``levels``, ``bytes``.
+    """
+    if isinstance(results, str):
+        panoramas = read_detections(results)
+        if len(panoramas) != 1:
+            raise ValueError(f"{results} holds {len(panoramas)} panoramas; export them one at a time")
+        results = next(iter(panoramas.values()))
+    detections = [r for r in _as_dicts(results) if r.get("confidence", 1.0) >= min_confidence]
+    tiles = build_pyramid(detections, max_per_tile=max_per_tile, max_level=max_level)
+    levels = max((level for level, _, _ in tiles), default=0) + 1
+    label_font = load_font(font)
+
+    index = {
+        "format": "pano-label-tiles",
+        "version": TILE_FORMAT_VERSION,
+        "tile_degrees": TILE_DEGREES,
+        "levels": levels,
+        "max_per_tile": max_per_tile,
+        "detections": len(detections),
+        "tiles": {str(level): [] for level in range(levels)},
+    }
+    written = 0
+    for (level, col, row), labels in sorted(tiles.items()):
+        os.makedirs(os.path.join(output_dir, str(level)), exist_ok=True)
+        stem = os.path.join(output_dir, str(level), f"{col}_{row}")
+        atlas, rects = render_atlas([label_text(r) for r in labels], label_font, atlas_width)
+        buffer = io.BytesIO()
+        atlas.save(buffer, "PNG")
+        tile = {
+            "level": level,
+            "col": col,
+            "row": row,
+            "atlas": f"{col}_{row}.png",
+            "atlas_size": [atlas.width, atlas.height],
+            "labels": [
+                {
+                    "text": r["text"],
+                    "confidence": r.get("confidence", 1.0),
+                    "yaw": r["yaw"],
+                    "pitch": r["pitch"],
+                    "width": r.get("width", 0.0),
+                    "height": r.get("height", 0.0),
+                    "rect": rect,
+                }
+                for r, rect in zip(labels, rects)
+            ],
+        }
+        data = json.dumps(tile).encode()
+        write_atomic(f"{stem}.png", buffer.getvalue())
+        write_atomic(f"{stem}.json", data)
+        written += buffer.tell() + len(data)
+        index["tiles"][str(level)].append([col, row, len(labels)])
+
+    # Written last: a preview never sees an index that names missing tiles.
+    os.makedirs(output_dir, exist_ok=True)
+    data = json.dumps(index).encode()
+    write_atomic(os.path.join(output_dir, "index.json"), data)
+    return {"detections": len(detections), "tiles": len(tiles), "levels": levels, "bytes": written + len(data)}
+
+
+# ---------------------------------------------------------------------------
+# Command line
+# ---------------------------------------------------------------------------
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m pano_utils.label_tiles",
+        description="Export OCR results as level-of-detail label tiles for the 3D preview.",
+    )
+    parser.add_argument("results", help="OCR JSON, columnar, batch_ocr or stream_ocr JSONL file")
+    parser.add_argument("output", help="Tile directory (one subdirectory per panorama for batch JSONL)")
+    parser.add_argument("--max-per-tile", type=int, default=24)
+    parser.add_argument("--max-level", type=int, default=4)
+    parser.add_argument("--min-confidence", type=float, default=0.0)
+    parser.add_argument("--font", help="TrueType font file for the labels")
+    args = parser.parse_args(argv)
+
+    panoramas = read_detections(args.results)
+    for name, detections in panoramas.items():
+        output_dir = args.output if len(panoramas) == 1 else os.path.join(args.output, name)
+        stats = export_label_tiles(
+            detections,
+            output_dir,
+            max_per_tile=args.max_per_tile,
+            max_level=args.max_level,
+            min_confidence=args.min_confidence,
+            font=args.font,
+        )
+        print(
+            f"{name}: {stats['detections']:,} detections in {stats['tiles']} tiles "
+            f"on {stats['levels']} levels ({stats['bytes'] / 1e6:.1f} MB) → {output_dir}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""Skip outputs that are already up to date.
+
+Rerunning OCR or segmentation over a corpus recomputes every panorama, even
+when neither the image nor the settings changed. A ``Manifest`` records,
+for each output:
+
+  - the SHA-256 of the source image (plus its size and mtime, so unchanged
+    files are not re-hashed on every run)
+  - a digest of the pipeline configuration: engine class, the versions of
+    the packages behind it, its public settings, the perspective views and
+    any other options that change results
+
+An output is current when its source hashes the same and its configuration
+digest matches; anything else is recomputed. The manifest is an append-only
+JSONL file (later lines win), written and fsync'ed after each output like
+``batch.run_batch`` output, so a crash never marks an output current that
+was not written.
+
+Example:
+    >>> from pano_utils.manifest import Manifest, pipeline_config
+    >>>
+    >>> manifest = Manifest("assets/.ocr-manifest.jsonl")
+    >>> config = pipeline_config(engine, perspectives)
+    >>> if not manifest.is_current("pano-ocr.json", "pano.jpg", config):
+    ...     recognize_panorama(pano_ocr, "pano.jpg").save_json("pano-ocr.json")
+    ...     manifest.record("pano-ocr.json", "pano.jpg", config)
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import enum
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Sequence
+
+from .batch import read_jsonl
+
+# Bump when pano_utils changes what the pipelines produce for the same
+# inputs, so every output recorded before is recomputed.
+PIPELINE_VERSION = 1
+
+_CHUNK_SIZE = 1 << 20
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's contents, as hex."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Pipeline configuration
+# ---------------------------------------------------------------------------
+
+
+def _package_versions(module: str, extra: Sequence[str] = ()) -> Dict[str, str]:
+    """Installed versions of the packages a module path names (and ``extra``).
+
+    ``panoocr.engines.paddleocr`` gives the versions of ``panoocr`` and
+    ``paddleocr``: the wrapper and the engine behind it.
+    """
+    from importlib.metadata import PackageNotFoundError, version
+
+    versions = {}
+    for name in list(dict.fromkeys(module.split("."))) + list(extra):
+        try:
+            versions[name] = version(name)
+        except (PackageNotFoundError, ValueError):
+            continue
+    return versions
+
+
+def _jsonable(value):
+    """``value`` as plain JSON data, or None if it has no stable form."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, enum.Enum):
+        return _jsonable(value.value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return _jsonable(dataclasses.asdict(value))
+    if isinstance(value, (list, tuple)):
+        items = [_jsonable(v) for v in value]
+        return None if any(i is None and v is not None for i, v in zip(items, value)) else items
+    if isinstance(value, dict):
+        items = {str(k): _jsonable(v) for k, v in value.items()}
+        return None if any(items[str(k)] is None and v is not None for k, v in value.items()) else items
+    return None
+
+
+def describe_engine(engine, packages: Sequence[str] = ()) -> dict:
+    """Class, package versions and public settings of an OCR / SAM engine.
+
+    Args:
+        engine: An engine instance, or its class (settings are then omitted).
+        packages: Further distributions whose versions change results, e.g.
+            ``("transformers",)``.
+    """
+    cls = engine if isinstance(engine, type) else type(engine)
+    description = {
+        "class": f"{cls.__module__}.{cls.__qualname__}",
+        "versions": _package_versions(cls.__module__, packages),
+    }
+    if not isinstance(engine, type):
+        settings = {}
+        for name, value in vars(engine).items():
+            value = _jsonable(value) if not name.startswith("_") else None
+            if value is not None:
+                settings[name] = value
+        description["settings"] = settings
+    return description
+
+
+def describe_perspectives(perspectives) -> list:
+    """Views as ``[width, height, h_fov, v_fov, yaw, pitch]`` lists (presets by name)."""
+    if isinstance(perspectives, (enum.Enum, str)) or not isinstance(perspectives, (list, tuple)):
+        perspectives = [perspectives]
+    described = []
+    for p in perspectives:
+        if hasattr(p, "pixel_width"):
+            described.append(
+                [
+                    int(p.pixel_width),
+                    int(p.pixel_height),
+                    float(p.horizontal_fov),
+                    float(p.vertical_fov),
+                    float(p.yaw_offset),
+                    float(p.pitch_offset),
+                ]
+            )
+        else:
+            described.append(_jsonable(p))
+    return described
+
+
+def pipeline_config(engine, perspectives, packages: Sequence[str] = (), **settings) -> dict:
+    """Everything about a run that changes its outputs, as JSON data.
+
+    Args:
+        engine: Engine instance or class (see ``describe_engine``).
+        perspectives: PerspectiveMetadata list, or a preset / list of presets.
+        packages: Further distributions whose versions matter.
+        **settings: Other options that change results (dedup options,
+            prompts, pruner threshold, ...). Dataclasses and enums are
+            converted; values without a JSON form raise ``TypeError``.
+    """
+    config = {
+        "pipeline_version": PIPELINE_VERSION,
+        "engine": describe_engine(engine, packages),
+        "perspectives": describe_perspectives(perspectives),
+    }
+    for name, value in settings.items():
+        data = _jsonable(value)
+        if data is None and value is not None:
+            raise TypeError(f"setting {name!r} has no JSON form: {value!r}")
+        config[name] = data
+    return config
+
+
+def config_digest(config: dict) -> str:
+    """Stable digest of a configuration (key order does not matter)."""
+    canonical = json.dumps(config, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+# ---------------------------------------------------------------------------
+# Manifest
+# ---------------------------------------------------------------------------
+
+
+class Manifest:
+    """Append-only record of which source and configuration made each output.
+
+    Thread-safe. Keys are output identifiers: usually the output path, or
+    the image path for outputs that are lines of a shared JSONL file.
+
+    Args:
+        path: Manifest JSONL file (created on the first record).
+
+    Attributes:
+        entries: Latest entry per key.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        for entry in read_jsonl(path):
+            self.entries[entry["key"]] = entry
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def source_digest(self, key: str, source: str) -> str:
+        """SHA-256 of ``source``, reusing the recorded one if size and mtime match."""
+        stat = os.stat(source)
+        entry = self.entries.get(key)
+        if (
+            entry is not None
+            and entry.get("source") == source
+            and entry.get("size") == stat.st_size
+            and entry.get("mtime_ns") == stat.st_mtime_ns
+        ):
+            return entry["sha256"]
+        return file_digest(source)
+
+    def is_current(
+        self, key: str, source: str, config: dict, output: Optional[str] = None
+    ) -> bool:
+        """Whether ``key`` was made from this exact source and configuration.
+
+        Args:
+            key: Output identifier.
+            source: Source image path.
+            config: ``pipeline_config`` of the run that would recompute it.
+            output: Output file that must still exist. Defaults to ``key``;
+                pass ``""`` when the output is not a file of its own.
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry["config"] != config_digest(config):
+            return False
+        output = key if output is None else output
+        if output and not os.path.exists(output):
+            return False
+        if not os.path.exists(source):
+            return False
+        return self.source_digest(key, source) == entry["sha256"]
+
+    def record(
+        self, key: str, source: str, config: dict, sha256: Optional[str] = None
+    ) -> dict:
+        """Mark ``key`` as made from ``source`` with ``config``; call after writing it.
+
+        Args:
+            sha256: Source digest if already known (e.g. hashed by a worker).
+        """
+        stat = os.stat(source)
+        entry = {
+            "key": key,
+            "source": source,
+            "sha256": sha256 or self.source_digest(key, source),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "config": config_digest(config),
+            "recorded_at": round(time.time(), 3),
+        }
+        with self._lock:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.entries[key] = entry
+        return entry
+
+    def compact(self) -> None:
+        """Rewrite the file with only the latest entry per key, atomically."""
+        with self._lock:
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry) + "\n")
+            os.replace(tmp_path, self.path)
+
+
+def load_segmentation_json(path: str):
+    """Read a ``SegmentationResult.save_json`` file back (PanoSAM has no loader)."""
+    import panosam as ps
+
+    with open(path) as f:
+        data = json.load(f)
+    return ps.SegmentationResult(
+        prompt=data.get("prompt"),
+        masks=[ps.SphereMaskResult.from_dict(m) for m in data["masks"]],
+        image_path=data.get("image_path"),
+        perspective_preset=data.get("perspective_preset"),
+        perspective_presets=data.get("perspective_presets"),
+    )
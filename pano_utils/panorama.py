@@ -0,0 +1,195 @@
+"""Decode a panorama once and share it, at the resolution each step needs.
+
+A demo run used to decode the same JPEG three times: ``Image.open`` for the
+size, again inside ``recognize``, and again for the plot. And a full decode
+of a 72 MP capture is over 200 MB before anything else happens. A
+``Panorama`` handle:
+
+  - reads the size from the file header without decoding
+  - decodes the full image at most once, and keeps it
+  - serves reduced copies (for pruning, coarse passes and previews) with
+    JPEG draft mode, which decodes at 1/2, 1/4 or 1/8 scale directly
+  - decodes only the rows a set of views can sample: the decoder stops
+    after the band's bottom row, and only the band is kept
+
+The pipelines accept a ``Panorama`` (or a path, which they wrap in one) and
+project from the band, so views are identical to projecting the full image
+while a worker holds a fraction of it.
+
+Example:
+    >>> from pano_utils.panorama import Panorama
+    >>> from pano_utils.pipeline import recognize_panorama
+    >>>
+    >>> pano = Panorama("pano.jpg")
+    >>> print(pano.width, pano.height)           # header only
+    >>> result = recognize_panorama(pano_ocr, pano)  # decodes the needed band
+    >>> plt.imshow(pano.resized(2048))            # draft-mode decode at 1/4
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from .projection import RemapCache, row_range
+
+_READ_SIZE = 1 << 16
+
+
+class Panorama:
+    """Lazily decoded equirectangular panorama.
+
+    Thread-safe: concurrent callers share one decode.
+
+    Args:
+        source: Path to an image file, PIL image, or RGB numpy array.
+
+    Attributes:
+        path: Source path, or None for in-memory images.
+        width: Full-resolution width in pixels.
+        height: Full-resolution height in pixels.
+        decodes: Number of times the source file was decoded (any size).
+    """
+
+    def __init__(self, source: Union[str, Image.Image, np.ndarray]):
+        self.path: Optional[str] = source if isinstance(source, str) else None
+        self._array: Optional[np.ndarray] = None
+        self._image: Optional[Image.Image] = None
+        self._resized: Dict[int, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self.decodes = 0
+
+        if isinstance(source, np.ndarray):
+            self._array = source
+            self.height, self.width = source.shape[:2]
+        elif isinstance(source, Image.Image):
+            self._image = source
+            self.width, self.height = source.size
+        else:
+            with Image.open(source) as image:
+                self.width, self.height = image.size
+
+    def __repr__(self) -> str:
+        return f"Panorama({self.path or 'in memory'}, {self.width}x{self.height})"
+
+    @property
+    def is_decoded(self) -> bool:
+        """Whether the full-resolution array is held in memory."""
+        return self._array is not None
+
+    @property
+    def array(self) -> np.ndarray:
+        """Full-resolution RGB array, decoded on first use."""
+        with self._lock:
+            if self._array is None:
+                image = self._image if self._image is not None else self._open()
+                if image.mode != "RGB":
+                    image = image.convert("RGB")
+                self._array = np.asarray(image)
+                self._image = None
+            return self._array
+
+    def image(self) -> Image.Image:
+        """Full-resolution PIL image (for ``PanoOCR.recognize`` / ``PanoSAM.segment``)."""
+        return Image.fromarray(self.array)
+
+    def _open(self) -> Image.Image:
+        self.decodes += 1
+        return Image.open(self.path)
+
+    def resized(self, width: int) -> np.ndarray:
+        """RGB array scaled to ``width`` (never enlarged), cached per width.
+
+        Decodes the file in JPEG draft mode at the smallest scale that is
+        still at least ``width`` wide, unless the full array is already held.
+        """
+        if width >= self.width:
+            return self.array
+        height = max(1, round(width * self.height / self.width))
+        with self._lock:
+            if width in self._resized:
+                return self._resized[width]
+            if self._array is not None or self._image is not None:
+                source = self._array if self._array is not None else np.asarray(self._image.convert("RGB"))
+            else:
+                image = self._open()
+                image.draft("RGB", (width, height))
+                source = np.asarray(image.convert("RGB"))
+            array = cv2.resize(source, (width, height), interpolation=cv2.INTER_AREA)
+            self._resized[width] = array
+            return array
+
+    def rows(self, top: int, bottom: int) -> np.ndarray:
+        """Full-resolution rows ``[top, bottom)``.
+
+        Slices the held array if there is one. Otherwise decodes only up to
+        ``bottom`` (baseline JPEG; other files are decoded whole) and keeps
+        nothing but the band.
+        """
+        top, bottom = max(0, top), min(self.height, bottom)
+        if self._array is not None or self._image is not None or top == 0 and bottom == self.height:
+            return self.array[top:bottom]
+        image = self._decode_top(bottom)
+        if image is None:
+            return self.array[top:bottom]
+        return np.asarray(image.crop((0, top, self.width, bottom)))
+
+    def _decode_top(self, bottom: int) -> Optional[Image.Image]:
+        """Decode the first ``bottom`` rows of a baseline JPEG, or None if not possible."""
+        image = self._open()
+        if (
+            image.format != "JPEG"
+            or image.mode != "RGB"
+            or image.info.get("progressive")
+            or len(image.tile) != 1
+        ):
+            return None
+        try:
+            # The same steps as ImageFile.load, with the image cut short: the
+            # decoder stops once the last requested row is written.
+            tile = image.tile[0]
+            image._size = (self.width, bottom)
+            image.load_prepare()
+            decoder = Image._getdecoder(image.mode, tile[0], tile[3], image.decoderconfig)
+            decoder.setimage(image.im, (0, 0, self.width, bottom))
+            image.fp.seek(tile[2])
+            data = b""
+            while True:
+                chunk = image.fp.read(_READ_SIZE)
+                data += chunk
+                consumed, _ = decoder.decode(data)
+                if consumed < 0:
+                    break
+                if not chunk:
+                    raise OSError("image file is truncated")
+                data = data[consumed:]
+            decoder.cleanup()
+            image.tile = []
+        except (AttributeError, TypeError, ValueError):
+            # Pillow internals changed; fall back to a full decode.
+            return None
+        return image
+
+    def band(
+        self, perspectives: Sequence, cache: Optional[RemapCache] = None
+    ) -> Tuple[np.ndarray, int]:
+        """The rows every perspective samples, and the index of the first.
+
+        Returns:
+            ``(rows, top)``, to project with ``project(rows, p, row_offset=top,
+            pano_height=self.height)``.
+        """
+        top, bottom = row_range(self.width, self.height, perspectives, cache)
+        return self.rows(top, bottom), top
+
+    def release(self) -> None:
+        """Drop every decoded copy (the handle stays usable)."""
+        with self._lock:
+            if self.path is not None:
+                self._array = None
+                self._image = None
+            self._resized.clear()
@@ -0,0 +1,489 @@
+"""PanoOCR / PanoSAM pipelines on top of cached projection.
+
+``recognize_panorama`` and ``segment_panorama`` do the same work as
+``PanoOCR.recognize`` and ``PanoSAM.segment`` — project each view, run the
+engine, convert to spherical coordinates, deduplicate — but project views
+through ``pano_utils.projection`` so the sampling grids are reused across
+panoramas of the same size.
+
+``segment_panorama`` also takes a list of prompts, encoding each view once
+for all of them (``pano_utils.sam_embeddings``).
+
+Deduplication goes through ``pano_utils.dedup``'s spherical index instead
+of the libraries' pairwise comparison.
+
+Projection also runs ahead of the engine on a small thread pool: while the
+engine works on view N, views N+1..N+prefetch are already being resampled
+(``cv2.remap`` releases the GIL), so the engine never waits on projection.
+
+Given a path or a ``pano_utils.panorama.Panorama``, only the band of rows
+the views sample is decoded (``Panorama.band``), and views are projected
+from that band.
+
+Pass ``tracer=pano_utils.tracing.Tracer()`` to time each stage and view.
+
+Example:
+    >>> from panoocr import PanoOCR
+    >>> from pano_utils.pipeline import recognize_panorama
+    >>>
+    >>> pano_ocr = PanoOCR(engine, perspectives=perspectives)
+    >>> result = recognize_panorama(pano_ocr, "panorama.jpg")
+    >>> result.save_json("results.json")
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+from .dedup import deduplicate_masks, deduplicate_ocr_results
+from .panorama import Panorama
+from .projection import RemapCache, project, row_range
+from .tracing import NULL_TRACER
+
+PanoramaInput = Union[str, Image.Image, np.ndarray, Panorama]
+
+
+def load_panorama_array(image: PanoramaInput, tracer=None) -> np.ndarray:
+    """Load a panorama path, PIL image, array or ``Panorama`` as an RGB uint8 array."""
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, Panorama) and image.is_decoded:
+        return image.array
+    with (tracer or NULL_TRACER).span("decode") as args:
+        if isinstance(image, Panorama):
+            array = image.array
+        else:
+            if isinstance(image, str):
+                image = Image.open(image)
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            array = np.asarray(image)
+        args["shape"] = list(array.shape)
+    return array
+
+
+def load_view_band(
+    image: PanoramaInput, perspectives: Sequence, cache: Optional[RemapCache] = None, tracer=None
+) -> Tuple[np.ndarray, int, int]:
+    """Load the pixels needed to project ``perspectives``.
+
+    Paths and ``Panorama`` handles decode only the rows the views sample;
+    arrays and PIL images are used whole.
+
+    Returns:
+        ``(rows, row_offset, pano_height)`` for ``iter_views`` / ``project``.
+    """
+    if isinstance(image, str):
+        image = Panorama(image)
+    if not isinstance(image, Panorama) or image.is_decoded:
+        array = load_panorama_array(image, tracer)
+        return array, 0, array.shape[0]
+    tracer = tracer or NULL_TRACER
+    # Finding the band builds every view's remap table; on a cold cache that
+    # costs more than the decode itself, so it is traced on its own.
+    with tracer.span("remap", views=len(perspectives)):
+        top, bottom = row_range(image.width, image.height, perspectives, cache)
+    with tracer.span("decode") as args:
+        rows = image.rows(top, bottom)
+        args["shape"] = list(rows.shape)
+        args["rows"] = [top, top + len(rows)]
+    return rows, top, image.height
+
+
+def _render_view(
+    pano_array: np.ndarray,
+    perspective,
+    cache: Optional[RemapCache],
+    tracer=NULL_TRACER,
+    index=None,
+    row_offset: int = 0,
+    pano_height: Optional[int] = None,
+) -> Image.Image:
+    with tracer.span("project", view=index):
+        return Image.fromarray(
+            project(pano_array, perspective, cache, row_offset=row_offset, pano_height=pano_height)
+        )
+
+
+def iter_views(
+    pano_array: np.ndarray,
+    perspectives: Sequence,
+    cache: Optional[RemapCache] = None,
+    workers: int = 2,
+    prefetch: int = 4,
+    tracer=None,
+    row_offset: int = 0,
+    pano_height: Optional[int] = None,
+) -> Iterator[Tuple[object, Image.Image]]:
+    """Yield ``(perspective, view)`` pairs in order, projecting ahead.
+
+    At most ``prefetch`` views are in flight or waiting at any time, which
+    bounds memory to a few perspective images regardless of the view count.
+
+    Args:
+        pano_array: Equirectangular panorama as a numpy array.
+        perspectives: Perspectives to render, in the order to yield them.
+        cache: RemapCache to project with. Defaults to the shared cache.
+        workers: Projection threads. 0 projects inline, one view at a time.
+        prefetch: Maximum number of views rendered ahead of the consumer.
+        tracer: Optional ``tracing.Tracer``; records a ``project`` span per
+            view and a ``wait`` span whenever the consumer waits on one.
+        row_offset: Panorama row of ``pano_array``'s first row, when it is
+            a band from ``load_view_band``.
+        pano_height: Full panorama height, when ``pano_array`` is a band.
+    """
+    tracer = tracer or NULL_TRACER
+    band = (row_offset, pano_height)
+    if workers <= 0:
+        for i, perspective in enumerate(perspectives):
+            yield perspective, _render_view(pano_array, perspective, cache, tracer, i, *band)
+        return
+
+    prefetch = max(1, prefetch)
+    remaining = enumerate(perspectives)
+    with ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="pano-projection"
+    ) as pool:
+        pending = deque()
+
+        def submit_next() -> None:
+            i, perspective = next(remaining, (None, None))
+            if perspective is not None:
+                future = pool.submit(
+                    _render_view, pano_array, perspective, cache, tracer, i, *band
+                )
+                pending.append((i, perspective, future))
+
+        for _ in range(prefetch):
+            submit_next()
+
+        while pending:
+            i, perspective, future = pending.popleft()
+            if future.done():
+                view = future.result()
+            else:
+                with tracer.span("wait", view=i):
+                    view = future.result()
+            submit_next()
+            yield perspective, view
+
+
+def recognize_panorama(
+    pano_ocr,
+    image: PanoramaInput,
+    cache: Optional[RemapCache] = None,
+    show_progress: bool = True,
+    workers: int = 2,
+    prefetch: int = 4,
+    perspectives: Optional[Sequence] = None,
+    pruner=None,
+    tracer=None,
+):
+    """Run ``PanoOCR.recognize`` with cached perspective projection.
+
+    Args:
+        pano_ocr: Configured ``panoocr.PanoOCR`` instance (engine, perspectives
+            and dedup options are taken from it).
+        image: Path to panorama image, PIL Image, or numpy array.
+        cache: RemapCache to project with. Defaults to the shared cache.
+        show_progress: Whether to show a progress bar.
+        workers: Projection threads running ahead of the engine (0 = serial).
+        prefetch: Maximum number of views projected ahead of the engine.
+        perspectives: Views to run instead of ``pano_ocr.perspectives``.
+        pruner: Optional ``view_pruning.ViewPruner``; views it scores under
+            its threshold are skipped.
+        tracer: Optional ``tracing.Tracer`` to record per-stage timings.
+
+    Returns:
+        panoocr.OCRResult containing deduplicated sphere OCR results.
+    """
+    from panoocr import OCRResult
+
+    tracer = tracer or NULL_TRACER
+    image_path = image if isinstance(image, str) else getattr(image, "path", None)
+    if isinstance(image, str):
+        image = Panorama(image)
+    if perspectives is None:
+        perspectives = pano_ocr.perspectives
+    if pruner is not None:
+        with tracer.span("prune", views=len(perspectives)) as args:
+            perspectives = [
+                perspectives[i] for i in pruner.select(_pruning_array(image, pruner), perspectives)
+            ]
+            args["kept"] = len(perspectives)
+
+    rows, row_offset, pano_height = load_view_band(image, perspectives, cache, tracer)
+    views = iter_views(
+        rows, perspectives, cache, workers, prefetch, tracer, row_offset, pano_height
+    )
+    if show_progress:
+        views = tqdm(
+            views,
+            total=len(perspectives),
+            desc="Processing perspectives",
+            unit="perspective",
+        )
+
+    all_sphere_results = []
+    result_views = []
+    for i, (perspective, view) in enumerate(views):
+        with tracer.span("inference", view=i) as args:
+            flat_results = pano_ocr.engine.recognize(view)
+            args["detections"] = len(flat_results)
+        with tracer.span("to_sphere", view=i):
+            all_sphere_results.extend(
+                result.to_sphere(
+                    horizontal_fov=perspective.horizontal_fov,
+                    vertical_fov=perspective.vertical_fov,
+                    yaw_offset=perspective.yaw_offset,
+                    pitch_offset=perspective.pitch_offset,
+                )
+                for result in flat_results
+            )
+            result_views.extend([i] * len(flat_results))
+        tracer.count("views")
+        tracer.count("detections", len(flat_results))
+
+    with tracer.span("dedup", detections=len(all_sphere_results)) as args:
+        results = deduplicate_ocr_results(all_sphere_results, pano_ocr.dedup_options, result_views)
+        args["kept"] = len(results)
+    tracer.count("detections_kept", len(results))
+
+    return OCRResult(
+        results=results,
+        image_path=image_path,
+        perspective_preset=pano_ocr._preset_name,
+    )
+
+
+def segment_panorama(
+    client,
+    panorama: PanoramaInput,
+    prompt: Union[str, Sequence[str]],
+    *,
+    options=None,
+    dedup=None,
+    cache: Optional[RemapCache] = None,
+    embedding_cache=None,
+    pruner=None,
+    show_progress: bool = True,
+    workers: int = 2,
+    prefetch: int = 4,
+    tracer=None,
+):
+    """Run ``PanoSAM.segment`` with cached perspective projection.
+
+    Given a list of prompts, each view is projected and run through the SAM 3
+    image encoder once, and every prompt is decoded on that embedding (see
+    ``pano_utils.sam_embeddings``).
+
+    Args:
+        client: Configured ``panosam.PanoSAM`` instance.
+        panorama: Path to panorama image, PIL Image, or numpy array.
+        prompt: Text prompt describing the objects to segment, or a list of them.
+        options: SegmentationOptions; defaults to the client's.
+        dedup: DedupOptions; defaults to the client's.
+        cache: RemapCache to project with. Defaults to the shared cache.
+        embedding_cache: Optional ``EmbeddingCache``; image embeddings are
+            loaded from / stored in it, so later prompts on the same panorama
+            skip the image encoder.
+        pruner: Optional ``view_pruning.ViewPruner``; views it scores under
+            its threshold are skipped.
+        show_progress: Whether to show a progress bar.
+        workers: Projection threads running ahead of the engine (0 = serial).
+        prefetch: Maximum number of views projected ahead of the engine.
+        tracer: Optional ``tracing.Tracer`` to record per-stage timings.
+
+    Returns:
+        panosam.SegmentationResult with deduplicated sphere masks, or for a
+        list of prompts, a ``{prompt: SegmentationResult}`` dict.
+    """
+    from .sam_embeddings import PromptSegmenter, source_digest
+
+    tracer = tracer or NULL_TRACER
+    prompts = [prompt] if isinstance(prompt, str) else list(dict.fromkeys(prompt))
+    opts = options or client.default_options
+    dopt = dedup or client.default_dedup
+    image_path = panorama if isinstance(panorama, str) else getattr(panorama, "path", None)
+    if isinstance(panorama, str):
+        panorama = Panorama(panorama)
+
+    view_ids = list(range(len(client._perspectives)))
+    if pruner is not None:
+        with tracer.span("prune", views=len(view_ids)) as args:
+            view_ids = pruner.select(_pruning_array(panorama, pruner), client._perspectives)
+            args["kept"] = len(view_ids)
+    perspectives = [client._perspectives[i] for i in view_ids]
+
+    segmenter = PromptSegmenter(client.engine, embedding_cache)
+    image_key = source_digest(panorama) if embedding_cache is not None and segmenter.shares_embeddings else None
+    rows, row_offset, pano_height = load_view_band(panorama, perspectives, cache, tracer)
+    sphere_masks = segment_views(
+        segmenter,
+        rows,
+        perspectives,
+        prompts,
+        opts,
+        view_ids=view_ids,
+        image_key=image_key,
+        cache=cache,
+        show_progress=show_progress,
+        workers=workers,
+        prefetch=prefetch,
+        tracer=tracer,
+        row_offset=row_offset,
+        pano_height=pano_height,
+    )
+
+    results = {
+        p: build_segmentation_result(client, p, sphere_masks[p], dopt, image_path, tracer)
+        for p in prompts
+    }
+    return results[prompt] if isinstance(prompt, str) else results
+
+
+def segment_views(
+    segmenter,
+    pano_array: np.ndarray,
+    perspectives: Sequence,
+    prompts: Sequence[str],
+    options,
+    *,
+    view_ids: Optional[Sequence[int]] = None,
+    image_key: Optional[str] = None,
+    cache: Optional[RemapCache] = None,
+    show_progress: bool = True,
+    workers: int = 2,
+    prefetch: int = 4,
+    desc: str = "Segmenting perspectives",
+    tracer=None,
+    row_offset: int = 0,
+    pano_height: Optional[int] = None,
+) -> Dict[str, List]:
+    """Segment some views of a panorama, without deduplicating.
+
+    Args:
+        segmenter: ``sam_embeddings.PromptSegmenter`` wrapping the engine.
+        pano_array: Equirectangular panorama as a numpy array.
+        perspectives: Views to segment.
+        prompts: Text prompts.
+        options: panosam SegmentationOptions.
+        view_ids: Index of each view in the full view list, used in mask IDs.
+            Defaults to 0, 1, 2, ...
+        image_key: ``sam_embeddings.source_digest`` of the panorama, which
+            keys its views in the embedding cache. Defaults to a hash of
+            ``pano_array``, which only matches runs that had the same pixels.
+        cache: RemapCache to project with. Defaults to the shared cache.
+        show_progress: Whether to show a progress bar.
+        workers: Projection threads running ahead of the engine (0 = serial).
+        prefetch: Maximum number of views projected ahead of the engine.
+        desc: Progress bar label.
+        tracer: Optional ``tracing.Tracer`` to record per-stage timings.
+        row_offset: Panorama row of ``pano_array``'s first row, when it is
+            a band from ``load_view_band``.
+        pano_height: Full panorama height, when ``pano_array`` is a band.
+
+    Returns:
+        ``{prompt: [SphereMaskResult]}`` from all views.
+    """
+    from .projection import perspective_key
+    from .sam_embeddings import image_digest
+
+    embedding_cache = segmenter.embedding_cache if segmenter.shares_embeddings else None
+    digest = image_key
+    if embedding_cache is not None and digest is None:
+        # A band is identified by its pixels and where it sits in the panorama.
+        digest = image_digest(pano_array) + (f"@{row_offset}" if row_offset else "")
+    pano_width = pano_array.shape[1]
+    pano_height = pano_height or pano_array.shape[0]
+    if view_ids is None:
+        view_ids = range(len(perspectives))
+
+    tracer = tracer or NULL_TRACER
+    views = iter_views(
+        pano_array, perspectives, cache, workers, prefetch, tracer, row_offset, pano_height
+    )
+    if show_progress:
+        views = tqdm(views, total=len(perspectives), desc=desc, unit="view")
+
+    sphere_masks: Dict[str, List] = {p: [] for p in prompts}
+    for view_id, (perspective, view) in zip(view_ids, views):
+        cache_key = (
+            embedding_cache.key(
+                digest, perspective_key(pano_width, pano_height, perspective), segmenter.version
+            )
+            if embedding_cache is not None
+            else None
+        )
+        with tracer.span("inference", view=view_id, prompts=len(prompts)) as args:
+            flat_masks = segmenter.segment(
+                view,
+                prompts,
+                threshold=options.threshold,
+                mask_threshold=options.mask_threshold,
+                simplify_tolerance=options.simplify_tolerance,
+                cache_key=cache_key,
+            )
+            args["masks"] = sum(len(masks) for masks in flat_masks.values())
+        with tracer.span("to_sphere", view=view_id):
+            for p, masks in flat_masks.items():
+                sphere_masks[p].extend(_masks_to_sphere(masks, perspective, view_id, p))
+        tracer.count("views")
+        tracer.count("masks", args["masks"])
+    return sphere_masks
+
+
+def build_segmentation_result(
+    client, prompt: str, sphere_masks: list, dedup, image_path=None, tracer=None
+):
+    """Deduplicate sphere masks into a ``panosam.SegmentationResult`` for ``client``."""
+    from panosam import SegmentationResult, SphereMaskDeduplicationEngine
+
+    tracer = tracer or NULL_TRACER
+    deduper = (
+        client._deduper
+        if getattr(client._deduper, "min_iou", None) == dedup.min_iou
+        else SphereMaskDeduplicationEngine(min_iou=dedup.min_iou)
+    )
+    with tracer.span("dedup", prompt=prompt, masks=len(sphere_masks)) as args:
+        masks = deduplicate_masks(sphere_masks, deduper, use_union=dedup.use_union)
+        args["kept"] = len(masks)
+    tracer.count("masks_kept", len(masks))
+    return SegmentationResult(
+        prompt=prompt,
+        image_path=image_path,
+        perspective_preset=client._preset,
+        perspective_presets=client._presets,
+        masks=masks,
+    )
+
+
+def _pruning_array(image: PanoramaInput, pruner) -> np.ndarray:
+    """Panorama for the pruner to score; a draft-mode decode for ``Panorama`` handles."""
+    if isinstance(image, Panorama):
+        return image.resized(pruner.width)
+    return load_panorama_array(image)
+
+
+def _masks_to_sphere(flat_masks, perspective, view_index: int, prompt: str) -> list:
+    """Convert one view's flat masks to sphere masks with view-unique IDs."""
+    sphere_masks = []
+    for flat_mask in flat_masks:
+        sphere_mask = flat_mask.to_sphere(
+            horizontal_fov=perspective.horizontal_fov,
+            vertical_fov=perspective.vertical_fov,
+            yaw_offset=perspective.yaw_offset,
+            pitch_offset=perspective.pitch_offset,
+        )
+        if sphere_mask.mask_id:
+            sphere_mask.mask_id = f"p{view_index:02d}_{sphere_mask.mask_id}"
+        else:
+            sphere_mask.mask_id = f"p{view_index:02d}_{prompt}_{len(sphere_masks)}"
+        sphere_masks.append(sphere_mask)
+    return sphere_masks
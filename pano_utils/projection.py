@@ -0,0 +1,336 @@
+"""Cached equirectangular → perspective projection.
+
+PanoOCR and PanoSAM project every view with ``py360convert.e2p``, which
+recomputes the per-pixel spherical sampling grid on every call. The grid only
+depends on the panorama size and the perspective (FOV, resolution, yaw, pitch),
+so for a batch of same-size panoramas it can be built once and reused: the
+projection itself then becomes a single ``cv2.remap`` gather.
+
+Remap tables live in an in-memory LRU and, optionally, as ``.npy`` files on
+disk that are memory-mapped on load, so separate processes and later runs
+share them too.
+
+Example:
+    >>> from panoocr.image.perspectives import generate_perspectives
+    >>> from pano_utils.projection import RemapCache, project
+    >>>
+    >>> cache = RemapCache(cache_dir="~/.cache/pano-remap")
+    >>> for p in generate_perspectives(fov=90, resolution=2000, overlap=0.5):
+    ...     view = project(panorama_array, p, cache=cache)
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import math
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+# Bump when the table layout or the projection math changes, so stale files
+# in a shared cache directory are never picked up.
+REMAP_TABLE_VERSION = 1
+
+# cv2's fixed-point maps store pixel coordinates as int16.
+_FIXED_POINT_LIMIT = 32767
+
+
+@dataclass(frozen=True)
+class RemapTable:
+    """Precomputed sampling maps for one (panorama size, perspective) pair.
+
+    Attributes:
+        map1: First ``cv2.remap`` map (fixed-point xy, or float x).
+        map2: Second ``cv2.remap`` map (interpolation table, or float y).
+    """
+
+    map1: np.ndarray
+    map2: np.ndarray
+
+    @property
+    def nbytes(self) -> int:
+        return self.map1.nbytes + self.map2.nbytes
+
+
+def perspective_key(
+    pano_width: int, pano_height: int, perspective
+) -> Tuple[int, int, int, int, float, float, float, float]:
+    """Build the cache key for a perspective on a panorama of a given size.
+
+    Works with both ``panoocr`` and ``panosam`` PerspectiveMetadata.
+    """
+    return (
+        int(pano_width),
+        int(pano_height),
+        int(perspective.pixel_width),
+        int(perspective.pixel_height),
+        float(perspective.horizontal_fov),
+        float(perspective.vertical_fov),
+        float(perspective.yaw_offset),
+        float(perspective.pitch_offset),
+    )
+
+
+def sample_sphere_grid(perspective) -> Tuple[np.ndarray, np.ndarray]:
+    """Compute the world yaw/pitch (radians) seen by every perspective pixel.
+
+    Uses the same camera model as ``panoocr.geometry.perspective_to_sphere``,
+    so detections converted with ``to_sphere()`` line up with these views.
+
+    Returns:
+        Tuple of (yaw, pitch) arrays with shape (pixel_height, pixel_width).
+    """
+    width = int(perspective.pixel_width)
+    height = int(perspective.pixel_height)
+
+    # Pixel centers, centered on the optical axis; y points up.
+    x = (np.arange(width, dtype=np.float64) + 0.5) / width - 0.5
+    y = 0.5 - (np.arange(height, dtype=np.float64) + 0.5) / height
+
+    x_local = x * 2 * math.tan(math.radians(perspective.horizontal_fov) / 2)
+    y_local = y * 2 * math.tan(math.radians(perspective.vertical_fov) / 2)
+    x_local, y_local = np.meshgrid(x_local, y_local)
+    z_local = np.ones_like(x_local)
+
+    norm = np.sqrt(x_local**2 + y_local**2 + 1.0)
+    x_local /= norm
+    y_local /= norm
+    z_local /= norm
+
+    pitch = math.radians(perspective.pitch_offset)
+    yaw = math.radians(perspective.yaw_offset)
+
+    # Rotation by pitch (around X axis)
+    y_pitched = y_local * math.cos(pitch) + z_local * math.sin(pitch)
+    z_pitched = -y_local * math.sin(pitch) + z_local * math.cos(pitch)
+
+    # Rotation by yaw (around Y axis)
+    x_world = x_local * math.cos(yaw) + z_pitched * math.sin(yaw)
+    z_world = -x_local * math.sin(yaw) + z_pitched * math.cos(yaw)
+
+    world_yaw = np.arctan2(x_world, z_world)
+    world_pitch = np.arcsin(np.clip(y_pitched, -1.0, 1.0))
+    return world_yaw, world_pitch
+
+
+def pixels_for_fov(fov: float, pano_width: int) -> int:
+    """View pixels across ``fov`` degrees at a panorama's own density (at the view center)."""
+    return max(1, round(2 * math.tan(math.radians(fov) / 2) * pano_width / (2 * math.pi)))
+
+
+def scale_perspectives(perspectives: Sequence, pano_width: int) -> list:
+    """The same views at the pixel density of a (smaller) panorama.
+
+    Views are never enlarged: upsampling a small panorama adds no detail.
+    """
+    scaled = []
+    for p in perspectives:
+        width = min(p.pixel_width, pixels_for_fov(p.horizontal_fov, pano_width))
+        height = max(1, round(width * p.pixel_height / p.pixel_width))
+        scaled.append(dataclasses.replace(p, pixel_width=width, pixel_height=height))
+    return scaled
+
+
+def build_remap_table(pano_width: int, pano_height: int, perspective) -> RemapTable:
+    """Build the ``cv2.remap`` maps for one perspective.
+
+    Args:
+        pano_width: Width of the equirectangular panorama in pixels.
+        pano_height: Height of the equirectangular panorama in pixels.
+        perspective: PerspectiveMetadata describing the view.
+
+    Returns:
+        RemapTable, in cv2's compact fixed-point format when the panorama is
+        small enough for it.
+    """
+    world_yaw, world_pitch = sample_sphere_grid(perspective)
+
+    map_x = (world_yaw / (2 * math.pi) + 0.5) * pano_width - 0.5
+    map_y = (0.5 - world_pitch / math.pi) * pano_height - 0.5
+    # Keep the poles from bilinearly wrapping into the opposite edge; the yaw
+    # seam is handled by BORDER_WRAP in project().
+    map_y = np.clip(map_y, 0, pano_height - 1)
+
+    map_x = map_x.astype(np.float32)
+    map_y = map_y.astype(np.float32)
+
+    if max(pano_width, pano_height) > _FIXED_POINT_LIMIT:
+        return RemapTable(map1=map_x, map2=map_y)
+
+    map1, map2 = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+    return RemapTable(map1=map1, map2=map2)
+
+
+class RemapCache:
+    """LRU cache of remap tables, optionally backed by memory-mapped files.
+
+    Thread-safe, so a single cache can be shared by projection worker threads.
+
+    Attributes:
+        maxsize: Maximum number of tables kept in memory.
+        cache_dir: Directory for ``.npy`` tables, or None for memory only.
+        hits: Lookups served from memory.
+        disk_hits: Lookups served by memory-mapping a file from ``cache_dir``.
+        misses: Lookups that had to build a new table.
+    """
+
+    def __init__(self, maxsize: int = 64, cache_dir: Optional[str] = None):
+        self.maxsize = maxsize
+        self.cache_dir = os.path.expanduser(cache_dir) if cache_dir else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._tables: "OrderedDict[tuple, RemapTable]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._tables)
+
+    def get(self, pano_width: int, pano_height: int, perspective) -> RemapTable:
+        """Return the remap table for a perspective, building it if needed."""
+        key = perspective_key(pano_width, pano_height, perspective)
+
+        with self._lock:
+            table = self._tables.get(key)
+            if table is not None:
+                self._tables.move_to_end(key)
+                self.hits += 1
+                return table
+
+        table = self._load(key)
+        if table is not None:
+            self.disk_hits += 1
+        else:
+            table = build_remap_table(pano_width, pano_height, perspective)
+            self.misses += 1
+            self._save(key, table)
+
+        with self._lock:
+            self._tables[key] = table
+            self._tables.move_to_end(key)
+            while len(self._tables) > self.maxsize:
+                self._tables.popitem(last=False)
+
+        return table
+
+    def clear(self) -> None:
+        """Drop all in-memory tables (files in ``cache_dir`` are kept)."""
+        with self._lock:
+            self._tables.clear()
+
+    def _paths(self, key: tuple) -> Tuple[str, str]:
+        digest = hashlib.sha1(repr((REMAP_TABLE_VERSION, key)).encode()).hexdigest()
+        stem = os.path.join(self.cache_dir, digest[:20])
+        return f"{stem}.map1.npy", f"{stem}.map2.npy"
+
+    def _load(self, key: tuple) -> Optional[RemapTable]:
+        if not self.cache_dir:
+            return None
+        map1_path, map2_path = self._paths(key)
+        if not (os.path.exists(map1_path) and os.path.exists(map2_path)):
+            return None
+        try:
+            return RemapTable(
+                map1=np.load(map1_path, mmap_mode="r"),
+                map2=np.load(map2_path, mmap_mode="r"),
+            )
+        except (OSError, ValueError):
+            # Truncated or foreign file: rebuild and overwrite it.
+            return None
+
+    def _save(self, key: tuple, table: RemapTable) -> None:
+        if not self.cache_dir:
+            return
+        for path, array in zip(self._paths(key), (table.map1, table.map2)):
+            # Write to a temp file and rename, so concurrent workers never
+            # memory-map a half-written table.
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, path)
+
+
+default_cache = RemapCache(cache_dir=os.environ.get("PANO_REMAP_CACHE_DIR"))
+"""RemapCache used when no cache is passed. Set ``PANO_REMAP_CACHE_DIR`` to
+persist its tables across runs."""
+
+
+def _source_rows(table: RemapTable) -> Tuple[int, int]:
+    """First and last panorama row a table samples (bilinear neighbors included)."""
+    if table.map1.ndim == 3:  # fixed point: integer part of y in map1
+        rows = table.map1[..., 1]
+        return int(rows.min()), int(rows.max()) + 1
+    return int(np.floor(table.map2.min())), int(np.floor(table.map2.max())) + 1
+
+
+def row_range(
+    pano_width: int,
+    pano_height: int,
+    perspectives: Sequence,
+    cache: Optional[RemapCache] = None,
+) -> Tuple[int, int]:
+    """Rows ``[top, bottom)`` of a panorama that any of the perspectives samples.
+
+    Views only read a latitude band of the panorama (a ring of pitch-0 views
+    never reaches the poles), so only those rows need to be decoded.
+    """
+    if cache is None:
+        cache = default_cache
+    top, bottom = pano_height, 0
+    for perspective in perspectives:
+        first, last = _source_rows(cache.get(pano_width, pano_height, perspective))
+        top, bottom = min(top, first), max(bottom, last + 1)
+    return max(0, top), min(pano_height, bottom)
+
+
+def project(
+    image_array: np.ndarray,
+    perspective,
+    cache: Optional[RemapCache] = None,
+    row_offset: int = 0,
+    pano_height: Optional[int] = None,
+) -> np.ndarray:
+    """Project an equirectangular panorama to a perspective view.
+
+    Drop-in replacement for ``py360convert.e2p`` with bilinear sampling.
+
+    Args:
+        image_array: Equirectangular panorama as (H, W) or (H, W, C) array,
+            or a band of its rows (see ``row_offset``).
+        perspective: PerspectiveMetadata describing the view.
+        cache: RemapCache to use. Defaults to ``default_cache``.
+        row_offset: Panorama row of ``image_array``'s first row, when it
+            holds only a band covering ``row_range`` for this view.
+        pano_height: Height of the full panorama. Defaults to the height
+            of ``image_array``.
+
+    Returns:
+        Perspective view as an array with the same dtype and channels.
+    """
+    if cache is None:
+        cache = default_cache
+    pano_width = image_array.shape[1]
+    table = cache.get(pano_width, pano_height or image_array.shape[0], perspective)
+    map1, map2 = table.map1, table.map2
+    if row_offset:
+        if map1.ndim == 3:
+            # cv2.subtract is several times faster than numpy on int16 pairs.
+            map1 = cv2.subtract(map1, (0, row_offset, 0, 0))
+        else:
+            map2 = map2 - np.float32(row_offset)
+    return cv2.remap(
+        image_array,
+        map1,
+        map2,
+        interpolation=cv2.INTER_LINEAR,
+        borderMode=cv2.BORDER_WRAP,
+    )
@@ -0,0 +1,362 @@
+"""Rasterize spherical masks onto equirectangular images in one pass.
+
+``ps.visualize_sphere_masks`` draws each mask into its own full-resolution
+array and alpha-composites a full RGBA copy of the panorama per mask, so a
+72 MP capture with fifty masks allocates tens of gigabytes along the way. It
+also maps polygon vertices straight to pixels, so a mask crossing the ±180°
+yaw seam is filled across the whole panorama and one around a pole is torn.
+
+Here every polygon of every mask is converted at once:
+
+  - edges are densified along great circles (the shape a straight edge in a
+    perspective view has on the sphere)
+  - yaw is unwrapped along each ring and the ring is drawn again shifted by
+    one panorama width, which splits it cleanly at the seam
+  - rings that wind around a pole are closed along the top or bottom row
+  - vertices are filled with sub-pixel precision at any output width
+
+Results come back as a compact label map (one small integer per pixel), as
+COCO-style run-length encodings (one per mask, overlaps kept), or blended
+onto the panorama. Label maps are cached per (masks, resolution), so
+re-blending with another ``alpha`` does not rasterize again.
+
+Example:
+    >>> from pano_utils.rasterize import overlay_masks, rasterize_labels, rasterize_rle
+    >>>
+    >>> preview = overlay_masks(panorama, result.masks, alpha=0.5, width=4096)
+    >>> labels = rasterize_labels(result.masks, width=2048)  # 0 = background
+    >>> rles = rasterize_rle(result.masks, width=8192)       # pycocotools-compatible
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from .dedup import unit_vectors, wrap_degrees
+
+# Fixed-point bits used for polygon vertices (1/16 pixel).
+SHIFT = 4
+
+# Label maps kept in memory by ``rasterize_labels``.
+LABEL_CACHE_SIZE = 8
+
+_label_cache: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+_label_cache_lock = threading.Lock()
+
+
+# ---------------------------------------------------------------------------
+# Sphere → pixel rings
+# ---------------------------------------------------------------------------
+
+
+def _pack(masks: Sequence) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Concatenate all polygons into one point array.
+
+    Returns:
+        ``(points, ring_starts, ring_masks)``: (n, 2) yaw/pitch points,
+        (r + 1,) offsets of each ring into ``points``, and the mask index of
+        each ring. Rings with fewer than three points are dropped.
+    """
+    rings, ring_masks = [], []
+    for i, mask in enumerate(masks):
+        for polygon in mask.polygons:
+            polygon = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+            if len(polygon) >= 3:
+                rings.append(polygon)
+                ring_masks.append(i)
+    lengths = [len(ring) for ring in rings]
+    ring_starts = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    points = np.concatenate(rings) if rings else np.zeros((0, 2))
+    return points, ring_starts, np.asarray(ring_masks, dtype=np.int64)
+
+
+def _densify(
+    points: np.ndarray, ring_starts: np.ndarray, max_step: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Insert points along each edge's great circle, at most ``max_step`` degrees apart."""
+    n = len(points)
+    ring_of = np.repeat(np.arange(len(ring_starts) - 1), np.diff(ring_starts))
+    following = np.arange(1, n + 1)
+    ring_ends = ring_starts[1:] - 1
+    following[ring_ends] = ring_starts[:-1]
+
+    v0 = unit_vectors(points[:, 0], points[:, 1])
+    v1 = v0[following]
+    angle = np.arccos(np.clip(np.einsum("ij,ij->i", v0, v1), -1.0, 1.0))
+    steps = np.maximum(1, np.ceil(np.degrees(angle) / max_step)).astype(np.int64)
+
+    edge = np.repeat(np.arange(n), steps)
+    first = np.concatenate(([0], np.cumsum(steps)[:-1]))
+    t = (np.arange(len(edge)) - first[edge]) / steps[edge]
+    a = angle[edge]
+    sin_a = np.sin(a)
+    curved = sin_a > 1e-9
+    w0 = np.where(curved, np.sin((1 - t) * a) / np.where(curved, sin_a, 1), 1 - t)
+    w1 = np.where(curved, np.sin(t * a) / np.where(curved, sin_a, 1), t)
+    v = w0[:, None] * v0[edge] + w1[:, None] * v1[edge]
+    v /= np.linalg.norm(v, axis=1, keepdims=True)
+
+    # Original vertices keep their exact yaw (it is undefined at the poles).
+    yaw = np.where(t == 0, points[edge, 0], np.degrees(np.arctan2(v[:, 0], v[:, 2])))
+    pitch = np.degrees(np.arcsin(np.clip(v[:, 1], -1.0, 1.0)))
+    ring_lengths = np.bincount(ring_of, weights=steps, minlength=len(ring_starts) - 1)
+    new_starts = np.concatenate(([0], np.cumsum(ring_lengths))).astype(np.int64)
+    return np.column_stack((yaw, pitch)), new_starts
+
+
+def pixel_rings(
+    masks: Sequence, width: int, height: Optional[int] = None, max_step: float = 1.0
+) -> List[List[np.ndarray]]:
+    """Convert every mask's polygons to equirectangular pixel rings.
+
+    Each ring is a float (k, 2) array of x/y pixel coordinates (pixel centers
+    at +0.5). Yaw is unwrapped along the ring, so x may run past either edge
+    of the image; draw such rings again shifted by ``width`` (see
+    ``_draw_rings``). Rings winding around a pole are closed along the top or
+    bottom edge.
+
+    Args:
+        masks: Objects with a ``polygons`` list of (yaw, pitch) rings, e.g.
+            ``SphereMaskResult`` or the masks of a ``MaskTable``.
+        width: Output width in pixels.
+        height: Output height. Defaults to ``width // 2``.
+        max_step: Longest edge, in degrees, before it is densified.
+
+    Returns:
+        One list of rings per mask.
+    """
+    height = height or width // 2
+    rings: List[List[np.ndarray]] = [[] for _ in masks]
+    points, ring_starts, ring_masks = _pack(masks)
+    if not len(points):
+        return rings
+    points, ring_starts = _densify(points, ring_starts, max_step)
+
+    # Unwrap yaw along each ring: cumulative wrapped steps, restarted per ring.
+    starts = ring_starts[:-1]
+    steps = wrap_degrees(np.diff(points[:, 0], prepend=points[0, 0]))
+    steps[starts] = 0.0
+    total = np.cumsum(steps)
+    ring_of = np.repeat(np.arange(len(starts)), np.diff(ring_starts))
+    yaw = points[starts, 0][ring_of] + total - total[starts][ring_of]
+
+    x = (yaw + 180.0) / 360.0 * width
+    y = (90.0 - points[:, 1]) / 180.0 * height
+    for r, mask_index in enumerate(ring_masks):
+        lo, hi = ring_starts[r], ring_starts[r + 1]
+        ring = np.column_stack((x[lo:hi], y[lo:hi]))
+        winding = yaw[hi - 1] - yaw[lo] + wrap_degrees(yaw[lo] - yaw[hi - 1])
+        if abs(winding) > 180.0:
+            # Encloses a pole: finish the lap at the first vertex one turn
+            # over, then run along the pole's row back to where it began.
+            pole_y = 0.0 if points[lo:hi, 1].mean() > 0 else float(height)
+            lap_x = ring[0, 0] + np.sign(winding) * width
+            ring = np.vstack(
+                (ring, [[lap_x, ring[0, 1]], [lap_x, pole_y], [ring[0, 0], pole_y]])
+            )
+        rings[mask_index].append(ring)
+    return rings
+
+
+def _fixed(ring: np.ndarray, dx: float = 0.0, dy: float = 0.0) -> np.ndarray:
+    shifted = (ring - 0.5 + (dx, dy)) * (1 << SHIFT)
+    return np.round(shifted).astype(np.int32)
+
+
+def _draw_rings(
+    canvas: np.ndarray, rings: Sequence[np.ndarray], value, width: int, x0: int = 0, y0: int = 0
+) -> None:
+    """Fill ``rings`` into ``canvas`` (whose top-left is pixel ``(x0, y0)``), across the seam."""
+    for ring in rings:
+        for dx in (-width, 0, width):
+            if ring[:, 0].max() + dx <= x0 or ring[:, 0].min() + dx >= x0 + canvas.shape[1]:
+                continue
+            cv2.fillPoly(canvas, [_fixed(ring, dx - x0, -y0)], value, shift=SHIFT)
+
+
+def _digest(masks: Sequence) -> str:
+    points, ring_starts, ring_masks = _pack(masks)
+    digest = hashlib.blake2b(digest_size=16)
+    for array in (points, ring_starts, ring_masks, np.array([len(masks)])):
+        digest.update(np.ascontiguousarray(array).data)
+    return digest.hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Outputs
+# ---------------------------------------------------------------------------
+
+
+def _label_dtype(count: int):
+    if count < 2**8:
+        return np.uint8
+    if count < 2**16:
+        return np.uint16
+    return np.int32
+
+
+def rasterize_labels(
+    masks: Sequence, width: int, height: Optional[int] = None, max_step: float = 1.0
+) -> np.ndarray:
+    """Render masks as a label map.
+
+    Args:
+        masks: Masks with ``polygons`` in (yaw, pitch) degrees.
+        width: Output width in pixels.
+        height: Output height. Defaults to ``width // 2``.
+        max_step: Longest edge, in degrees, before it is densified.
+
+    Returns:
+        Read-only (height, width) array: 0 for background, ``i + 1`` where
+        mask ``i`` is on top (later masks cover earlier ones). The dtype is
+        the smallest unsigned type that fits. Arrays are cached, so the same
+        masks at the same size are only rasterized once.
+    """
+    height = height or width // 2
+    key = (_digest(masks), width, height, max_step)
+    with _label_cache_lock:
+        if key in _label_cache:
+            _label_cache.move_to_end(key)
+            return _label_cache[key]
+
+    labels = np.zeros((height, width), dtype=_label_dtype(len(masks)))
+    for i, rings in enumerate(pixel_rings(masks, width, height, max_step)):
+        _draw_rings(labels, rings, i + 1, width)
+    labels.setflags(write=False)
+
+    with _label_cache_lock:
+        _label_cache[key] = labels
+        while len(_label_cache) > LABEL_CACHE_SIZE:
+            _label_cache.popitem(last=False)
+    return labels
+
+
+def _encode_rle(crop: np.ndarray, x0: int, y0: int, width: int, height: int) -> List[int]:
+    """COCO run lengths (column-major) of a full image that is zero outside ``crop``."""
+    columns = np.pad(crop.T.astype(np.int8), ((0, 0), (1, 1)))
+    changes = np.diff(columns, axis=1)
+    col, start = np.nonzero(changes == 1)
+    _, end = np.nonzero(changes == -1)
+    # Global column-major indices of each run's first and one-past-last pixel.
+    base = (x0 + col) * height + y0
+    begins, ends = base + start, base + end
+
+    # Runs touching across a column boundary are one run in the flat order.
+    keep_begin = np.ones(len(begins), dtype=bool)
+    keep_end = np.ones(len(ends), dtype=bool)
+    joined = begins[1:] == ends[:-1]
+    keep_begin[1:] &= ~joined
+    keep_end[:-1] &= ~joined
+    bounds = np.column_stack((begins[keep_begin], ends[keep_end])).ravel()
+    edges = np.concatenate(([0], bounds, [width * height]))
+    return np.diff(edges).tolist()
+
+
+def rasterize_rle(
+    masks: Sequence, width: int, height: Optional[int] = None, max_step: float = 1.0
+) -> List[Dict]:
+    """Render each mask as an uncompressed COCO run-length encoding.
+
+    Each mask is filled only within its own bounding box, so memory stays
+    proportional to the mask, not the panorama. Overlapping masks keep their
+    full extent (unlike a label map).
+
+    Args:
+        masks: Masks with ``polygons`` in (yaw, pitch) degrees.
+        width: Output width in pixels.
+        height: Output height. Defaults to ``width // 2``.
+        max_step: Longest edge, in degrees, before it is densified.
+
+    Returns:
+        One ``{"size": [height, width], "counts": [...]}`` per mask, in
+        order; ``pycocotools.mask.frPyObjects`` accepts them as they are.
+    """
+    height = height or width // 2
+    encoded = []
+    for rings in pixel_rings(masks, width, height, max_step):
+        if not rings:
+            encoded.append({"size": [height, width], "counts": [width * height]})
+            continue
+        points = np.concatenate(rings)
+        spans_seam = points[:, 0].min() < 0 or points[:, 0].max() > width
+        x0 = 0 if spans_seam else max(0, int(np.floor(points[:, 0].min())))
+        x1 = width if spans_seam else min(width, int(np.ceil(points[:, 0].max())) + 1)
+        y0 = max(0, int(np.floor(points[:, 1].min())))
+        y1 = min(height, int(np.ceil(points[:, 1].max())) + 1)
+        crop = np.zeros((max(1, y1 - y0), max(1, x1 - x0)), dtype=np.uint8)
+        _draw_rings(crop, rings, 1, width, x0, y0)
+        encoded.append(
+            {"size": [height, width], "counts": _encode_rle(crop, x0, y0, width, height)}
+        )
+    return encoded
+
+
+def decode_rle(rle: Dict) -> np.ndarray:
+    """Expand an uncompressed COCO RLE to a (height, width) boolean mask."""
+    height, width = rle["size"]
+    counts = np.asarray(rle["counts"], dtype=np.int64)
+    values = np.arange(len(counts)) % 2 == 1
+    return np.repeat(values, counts).reshape(width, height).T
+
+
+def mask_colors(count: int) -> np.ndarray:
+    """Distinct RGB colors for ``count`` masks, spread over a rainbow map."""
+    ramp = np.linspace(0, 255, max(count, 1)).astype(np.uint8).reshape(-1, 1)
+    return cv2.applyColorMap(ramp, cv2.COLORMAP_RAINBOW)[:, 0, ::-1][:count]
+
+
+def overlay_masks(
+    panorama,
+    masks: Sequence,
+    alpha: float = 0.5,
+    width: Optional[int] = None,
+    colors: Optional[np.ndarray] = None,
+    max_step: float = 1.0,
+) -> Image.Image:
+    """Blend masks onto a panorama; a fast ``ps.visualize_sphere_masks``.
+
+    Only pixels under a mask are touched, and no per-mask image is ever
+    allocated. Where masks overlap, the later one is shown.
+
+    Args:
+        panorama: Equirectangular panorama (PIL image or RGB array).
+        masks: Masks with ``polygons`` in (yaw, pitch) degrees.
+        alpha: Opacity of the mask colors (0-1).
+        width: Output width; the panorama is resized to it. Defaults to the
+            panorama's own width.
+        colors: (n, 3) uint8 RGB colors, one per mask. Defaults to
+            ``mask_colors(len(masks))``.
+        max_step: Longest edge, in degrees, before it is densified.
+
+    Returns:
+        RGB image of the blended panorama.
+    """
+    if isinstance(panorama, Image.Image) and panorama.mode != "RGB":
+        panorama = panorama.convert("RGB")
+    image = np.array(panorama)  # the one full-size copy
+    if width and width != image.shape[1]:
+        height = round(width * image.shape[0] / image.shape[1])
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+    if not len(masks):
+        return Image.fromarray(image)
+
+    height, width = image.shape[:2]
+    labels = rasterize_labels(masks, width, height, max_step)
+    palette = np.asarray(colors if colors is not None else mask_colors(len(masks)), np.uint16)
+    weight = int(round(alpha * 256))
+
+    # Blend in bands of rows to keep temporaries small on 72 MP images.
+    for top in range(0, height, 256):
+        band, band_labels = image[top : top + 256], labels[top : top + 256]
+        covered = band_labels > 0
+        under = band[covered].astype(np.uint16)
+        color = palette[band_labels[covered] - 1]
+        band[covered] = ((under * (256 - weight) + color * weight) >> 8).astype(np.uint8)
+    return Image.fromarray(image)
@@ -0,0 +1,358 @@
+"""Encode each view once, segment many prompts: shared SAM 3 image embeddings.
+
+``SAM3Engine.segment`` runs the whole model per call, so segmenting "sign",
+"tree", "window" and "person" runs the expensive image encoder four times on
+every view. SAM 3 splits cleanly into a per-image vision encoder and a light
+prompt-conditioned decoder, and ``Sam3Model`` accepts precomputed
+``vision_embeds``, so:
+
+  - ``PromptSegmenter`` encodes a view once and decodes every prompt on the
+    same embedding; its masks match ``SAM3Engine.segment`` prompt by prompt
+  - ``EmbeddingCache`` keeps embeddings on disk, keyed by (panorama hash,
+    perspective, model version), so re-prompting a processed panorama later
+    costs only the decoder steps
+
+``pipeline.segment_panorama`` uses both when given a list of prompts or an
+``embedding_cache``. Engines without a SAM 3 ``model`` / ``processor`` fall
+back to one ``segment`` call per prompt.
+
+Example:
+    >>> from pano_utils.pipeline import segment_panorama
+    >>> from pano_utils.sam_embeddings import EmbeddingCache
+    >>>
+    >>> results = segment_panorama(
+    ...     client, "pano.jpg", ["sign", "tree", "window"], embedding_cache=EmbeddingCache()
+    ... )
+    >>> results["tree"].save_json("trees.panosam.json")
+"""
+
+from __future__ import annotations
+
+import hashlib
+import importlib
+import os
+import pickle
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Bump when the stored embedding format changes.
+EMBEDDING_CACHE_VERSION = 2
+
+DEFAULT_CACHE_DIR = os.path.join("~", ".cache", "pano_utils", "sam3-embeddings")
+DEFAULT_MAX_BYTES = 20 * 1024**3
+
+# Errors of a missing, torn or foreign cache file (a plain miss).
+_UNREADABLE = (
+    OSError,
+    EOFError,
+    RuntimeError,
+    pickle.UnpicklingError,
+    KeyError,
+    TypeError,
+    ValueError,
+    AttributeError,
+    ImportError,
+)
+
+
+def image_digest(image_array: np.ndarray) -> str:
+    """Content hash of a panorama array (shape included)."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((image_array.shape, str(image_array.dtype))).encode())
+    digest.update(np.ascontiguousarray(image_array).data)
+    return digest.hexdigest()
+
+
+def source_digest(panorama) -> str:
+    """Identify a panorama by its source, whatever part of it is decoded.
+
+    Files (paths and ``Panorama`` handles opened from one) are identified by
+    their contents, other images by their pixels. Unlike hashing the pixels a
+    run happened to decode, this is the same for every view subset, pruner
+    and row band, so their embeddings are shared.
+    """
+    path = panorama if isinstance(panorama, str) else getattr(panorama, "path", None)
+    if path is not None:
+        from .manifest import file_digest
+
+        return f"file:{file_digest(path)}"
+    if hasattr(panorama, "array"):  # an in-memory Panorama
+        panorama = panorama.array
+    elif hasattr(panorama, "convert"):  # a PIL image
+        panorama = panorama if panorama.mode == "RGB" else panorama.convert("RGB")
+    return image_digest(np.asarray(panorama))
+
+
+def model_version(engine) -> str:
+    """Identify the weights and code an engine's embeddings come from."""
+    import transformers
+
+    config = engine.model.config
+    return "|".join(
+        str(part)
+        for part in (
+            getattr(config, "_name_or_path", type(engine.model).__name__),
+            getattr(config, "_commit_hash", None),
+            getattr(engine.model, "dtype", None),
+            transformers.__version__,
+        )
+    )
+
+
+def _pack(embeds) -> dict:
+    """Embedding as plain tensors, loadable with ``weights_only=True``.
+
+    ``get_vision_features`` returns a transformers ``ModelOutput``; it is
+    stored as its class name and fields, never pickled.
+    """
+    import torch
+
+    if isinstance(embeds, torch.Tensor):
+        return {"class": None, "value": embeds}
+    cls = type(embeds)
+    return {"class": f"{cls.__module__}:{cls.__qualname__}", "value": dict(embeds.items())}
+
+
+def _unpack(data: dict):
+    if data["class"] is None:
+        return data["value"]
+    module, _, name = data["class"].partition(":")
+    if not module.startswith("transformers."):
+        raise ValueError(f"unexpected embedding class {data['class']}")
+    return getattr(importlib.import_module(module), name)(**data["value"])
+
+
+class EmbeddingCache:
+    """On-disk store of SAM 3 image embeddings, bounded by total size.
+
+    Each embedding is one ``torch.save`` file of plain tensors, written
+    atomically and loaded with ``weights_only=True``, so a shared cache
+    directory can't run code through a crafted file. When the
+    store exceeds ``max_bytes``, the least recently used files are removed.
+    Safe to share between threads; separate processes may share a directory.
+
+    Args:
+        cache_dir: Cache directory. Defaults to ``$PANO_SAM_EMBEDDING_CACHE_DIR``
+            or ``~/.cache/pano_utils/sam3-embeddings``.
+        max_bytes: Size limit of the store. SAM 3 embeddings are tens of
+            megabytes per view.
+
+    Attributes:
+        stats: ``hits``, ``misses`` and ``evicted`` counters.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        cache_dir = (
+            cache_dir or os.environ.get("PANO_SAM_EMBEDDING_CACHE_DIR") or DEFAULT_CACHE_DIR
+        )
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_bytes = max_bytes
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "evicted": 0}
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._total_bytes = sum(os.path.getsize(path) for path in self._files())
+
+    @staticmethod
+    def key(image_digest: str, perspective_key: tuple, model_version: str) -> str:
+        """Cache key for one view of one panorama under one model."""
+        raw = repr((EMBEDDING_CACHE_VERSION, image_digest, perspective_key, model_version))
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pt")
+
+    def _files(self) -> List[str]:
+        return [
+            os.path.join(root, name)
+            for root, _, names in os.walk(self.cache_dir)
+            for name in names
+            if name.endswith(".pt")
+        ]
+
+    def get(self, key: str, device=None):
+        """Return the stored embedding on ``device``, or None."""
+        import torch
+
+        path = self._path(key)
+        try:
+            embeds = _unpack(torch.load(path, map_location=device, weights_only=True))
+            os.utime(path)  # mark as recently used
+        except _UNREADABLE:
+            # Missing, truncated by a crash, or not a file this cache wrote:
+            # recompute and overwrite.
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        with self._lock:
+            self.stats["hits"] += 1
+        return embeds
+
+    def put(self, key: str, embeds) -> None:
+        """Store an embedding."""
+        import torch
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        torch.save(_pack(embeds), tmp_path)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._total_bytes = self._evict(int(self.max_bytes * 0.9))
+
+    def _evict(self, target_bytes: int) -> int:
+        """Remove least recently used files until the store fits ``target_bytes``.
+
+        Returns:
+            The new size of the store.
+        """
+        files = []
+        for path in self._files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= target_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.stats["evicted"] += 1
+        return total
+
+
+class PromptSegmenter:
+    """Segment several text prompts on one image with a single encoder pass.
+
+    Args:
+        engine: ``panosam.engines.sam3.SAM3Engine``, or any engine with a
+            ``segment`` method (used once per prompt, without sharing).
+        embedding_cache: Optional ``EmbeddingCache`` for the image embeddings.
+
+    Attributes:
+        encoded: Views run through the image encoder.
+        reused: Views whose embedding came from ``embedding_cache``.
+    """
+
+    def __init__(self, engine, embedding_cache: Optional[EmbeddingCache] = None):
+        self.engine = engine
+        self.embedding_cache = embedding_cache
+        self.shares_embeddings = hasattr(getattr(engine, "model", None), "get_vision_features")
+        self.version = model_version(engine) if self.shares_embeddings else None
+        self.encoded = 0
+        self.reused = 0
+        self._text_inputs: Dict[str, object] = {}
+
+    def encode(self, image, cache_key: Optional[str] = None):
+        """Image embedding of a view, from the cache when possible."""
+        import torch
+
+        if cache_key and self.embedding_cache is not None:
+            embeds = self.embedding_cache.get(cache_key, self.engine.device)
+            if embeds is not None:
+                self.reused += 1
+                return embeds
+
+        inputs = self.engine.processor(images=image, return_tensors="pt").to(self.engine.device)
+        with torch.no_grad():
+            embeds = self.engine.model.get_vision_features(pixel_values=inputs.pixel_values)
+        self.encoded += 1
+
+        if cache_key and self.embedding_cache is not None:
+            self.embedding_cache.put(cache_key, embeds)
+        return embeds
+
+    def _prompt_inputs(self, prompt: str):
+        if prompt not in self._text_inputs:
+            self._text_inputs[prompt] = self.engine.processor(
+                text=prompt, return_tensors="pt"
+            ).to(self.engine.device)
+        return self._text_inputs[prompt]
+
+    def segment(
+        self,
+        image,
+        prompts: Sequence[str],
+        threshold: float = 0.5,
+        mask_threshold: float = 0.5,
+        simplify_tolerance: float = 0.005,
+        cache_key: Optional[str] = None,
+    ) -> Dict[str, list]:
+        """Segment every prompt on one view.
+
+        Args:
+            image: View as a PIL image.
+            prompts: Text prompts.
+            threshold: Confidence threshold for detections (0-1).
+            mask_threshold: Threshold for binary mask generation (0-1).
+            simplify_tolerance: Tolerance for polygon simplification (0-1).
+            cache_key: ``EmbeddingCache.key`` of this view, to load or store
+                its embedding.
+
+        Returns:
+            ``{prompt: [FlatMaskResult]}``, in the order of ``prompts``.
+        """
+        if not self.shares_embeddings or (len(prompts) == 1 and cache_key is None):
+            # Nothing to share: one plain engine call per prompt.
+            return {
+                prompt: self.engine.segment(
+                    image=image,
+                    text_prompt=prompt,
+                    threshold=threshold,
+                    mask_threshold=mask_threshold,
+                    simplify_tolerance=simplify_tolerance,
+                )
+                for prompt in prompts
+            }
+
+        import torch
+
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        embeds = self.encode(image, cache_key)
+
+        results = {}
+        for prompt in prompts:
+            with torch.no_grad():
+                outputs = self.engine.model(vision_embeds=embeds, **self._prompt_inputs(prompt))
+            instances = self.engine.processor.post_process_instance_segmentation(
+                outputs,
+                threshold=threshold,
+                mask_threshold=mask_threshold,
+                target_sizes=[(image.height, image.width)],
+            )[0]
+            results[prompt] = _flat_masks(instances, prompt, simplify_tolerance)
+        return results
+
+
+def _flat_masks(instances: dict, prompt: str, simplify_tolerance: float) -> list:
+    """Convert post-processed instances to FlatMaskResults, as ``SAM3Engine.segment`` does."""
+    from panosam import FlatMaskResult
+
+    flat_masks = []
+    for i, (mask, score) in enumerate(zip(instances.get("masks", []), instances.get("scores", []))):
+        mask_np = mask.cpu().numpy() if hasattr(mask, "cpu") else np.asarray(mask)
+        if mask_np.ndim > 2:
+            mask_np = mask_np.squeeze()
+        flat_mask = FlatMaskResult.from_binary_mask(
+            mask=mask_np,
+            score=float(score),
+            label=prompt,
+            mask_id=f"{prompt}_{i}",
+            simplify_tolerance=simplify_tolerance,
+        )
+        if flat_mask.polygons and any(len(p) >= 3 for p in flat_mask.polygons):
+            flat_masks.append(flat_mask)
+    return flat_masks
@@ -0,0 +1,423 @@
+"""Stream 360° video and interval-shot sequences through PanoOCR / PanoSAM.
+
+A walk recorded as equirectangular video (``.insv`` exported from Insta360
+Studio) or as an interval-shooting session is thousands of nearly identical
+frames. Reading every frame independently repeats the same work, and the
+same sign comes back once per frame. Here frames are streamed instead:
+
+  - ``iter_frames`` yields frames lazily from a video file, a directory of
+    frames or a manifest, so only one frame is held at a time
+  - ``FrameSkipper`` compares a small grayscale copy of each frame with the
+    last *processed* frame and skips frames that barely changed
+  - ``OCRTracker`` / ``MaskTracker`` follow detections from frame to frame in
+    yaw/pitch, so each sign or object is reported once, as a ``Track`` with
+    the frame range it was visible in and its best detection
+
+``stream_ocr`` and ``stream_segmentation`` put these together around the
+pipelines in ``pano_utils.pipeline`` and yield each track as soon as it has
+not been seen for ``max_gap`` processed frames.
+
+Example:
+    >>> from pano_utils.streaming import stream_ocr
+    >>>
+    >>> for track in stream_ocr(pano_ocr, "walk.mp4", every=15):
+    ...     print(track.key, track.first_frame, track.last_frame, track.yaw)
+"""
+
+from __future__ import annotations
+
+import os
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from .batch import find_panoramas
+from .dedup import unit_vectors
+from .panorama import Panorama
+from .pipeline import recognize_panorama, segment_panorama
+from .tracing import NULL_TRACER
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".mkv", ".avi", ".webm")
+
+Frame = Tuple[int, float, Panorama]
+
+# ---------------------------------------------------------------------------
+# Frame sources
+# ---------------------------------------------------------------------------
+
+
+def iter_frames(
+    source: Union[str, Iterable[str]], every: int = 1, interval: float = 1.0
+) -> Iterator[Frame]:
+    """Yield ``(index, seconds, Panorama)`` for each frame of a sequence.
+
+    Args:
+        source: A video file, a directory of frames (sorted by path), a
+            manifest accepted by ``batch.find_panoramas``, or a list of paths.
+        every: Yield only every ``every``-th frame. Video frames in between
+            are grabbed but not converted.
+        interval: Seconds between image frames (the camera's interval
+            setting); videos use their own timestamps.
+    """
+    if isinstance(source, str) and source.lower().endswith(VIDEO_EXTENSIONS):
+        yield from _video_frames(source, every)
+        return
+    paths = find_panoramas(source) if isinstance(source, str) else list(source)
+    for index in range(0, len(paths), every):
+        yield index, index * interval, Panorama(paths[index])
+
+
+def _video_frames(path: str, every: int) -> Iterator[Frame]:
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise OSError(f"cannot open video {path}")
+    try:
+        index = 0
+        while capture.grab():
+            if index % every == 0:
+                seconds = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                yield index, seconds, Panorama(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            index += 1
+    finally:
+        capture.release()
+
+
+class FrameSkipper:
+    """Skip frames that look like the last processed frame.
+
+    Each frame is reduced to a ``width`` px grayscale copy (a draft-mode
+    decode for JPEG frames) and compared with the copy of the last frame
+    that was processed, so slow drift still adds up to a new frame.
+
+    Args:
+        threshold: Mean absolute gray-level difference (0–255) below which a
+            frame is skipped. 0 processes every frame.
+        width: Width of the comparison copy.
+        max_skipped: Process a frame after this many skips in a row even if
+            nothing changed (None for no limit).
+
+    Attributes:
+        difference: Difference of the last frame checked.
+        processed: Frames processed so far.
+        skipped: Frames skipped so far.
+    """
+
+    def __init__(self, threshold: float = 2.0, width: int = 256, max_skipped: Optional[int] = None):
+        self.threshold = threshold
+        self.width = width
+        self.max_skipped = max_skipped
+        self.difference: Optional[float] = None
+        self.processed = 0
+        self.skipped = 0
+        self._last: Optional[np.ndarray] = None
+        self._run = 0
+
+    def _thumbnail(self, panorama: Panorama) -> np.ndarray:
+        gray = cv2.cvtColor(panorama.resized(self.width), cv2.COLOR_RGB2GRAY)
+        # Blur away sensor noise and compression artifacts.
+        return cv2.GaussianBlur(gray, (5, 5), 0).astype(np.int16)
+
+    def changed(self, panorama: Panorama) -> bool:
+        """Whether ``panorama`` should be processed; updates the reference if so."""
+        thumbnail = self._thumbnail(panorama)
+        if self._last is None or self._last.shape != thumbnail.shape:
+            self.difference = None
+        else:
+            self.difference = float(np.abs(thumbnail - self._last).mean())
+            forced = self.max_skipped is not None and self._run >= self.max_skipped
+            if self.difference < self.threshold and not forced:
+                self.skipped += 1
+                self._run += 1
+                return False
+        self._last = thumbnail
+        self.processed += 1
+        self._run = 0
+        return True
+
+
+# ---------------------------------------------------------------------------
+# Tracking
+# ---------------------------------------------------------------------------
+
+
+class Track:
+    """One sign or object followed across frames.
+
+    Attributes:
+        key: Text (OCR) or label (masks) of the best detection.
+        best: Best detection seen (``SphereOCRResult`` / ``SphereMaskResult``).
+        score: Confidence (OCR) or score (masks) of ``best``.
+        yaw: Yaw of the latest detection, in degrees.
+        pitch: Pitch of the latest detection, in degrees.
+        first_frame: Index of the first frame it was seen in.
+        last_frame: Index of the last frame it was seen in (or of the last
+            skipped frame after that, since those matched the frame it was
+            seen in).
+        first_time: Timestamp of ``first_frame`` in seconds.
+        last_time: Timestamp of ``last_frame`` in seconds.
+        hits: Number of processed frames it was detected in.
+    """
+
+    def __init__(self, detection, key: str, score: float, yaw: float, pitch: float, frame: int, seconds: float):
+        self.best = detection
+        self.key = key
+        self.score = score
+        self.yaw = yaw
+        self.pitch = pitch
+        self.first_frame = self.last_frame = frame
+        self.first_time = self.last_time = seconds
+        self.hits = 1
+        self._last_step = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"Track({self.key!r}, frames {self.first_frame}-{self.last_frame}, "
+            f"yaw {self.yaw:.1f}, pitch {self.pitch:.1f}, {self.hits} hits)"
+        )
+
+    @property
+    def frame_range(self) -> Tuple[int, int]:
+        return self.first_frame, self.last_frame
+
+    def to_dict(self) -> dict:
+        return {
+            "key": self.key,
+            "first_frame": self.first_frame,
+            "last_frame": self.last_frame,
+            "first_time": self.first_time,
+            "last_time": self.last_time,
+            "hits": self.hits,
+            "yaw": self.yaw,
+            "pitch": self.pitch,
+            "detection": self.best.to_dict(),
+        }
+
+
+def similar_text(text: str, other: str, min_similarity: float = 0.6) -> bool:
+    """Whether two OCR reads are the same text (case-insensitive Levenshtein)."""
+    import textdistance
+
+    if text.casefold() == other.casefold():
+        return True
+    return (
+        textdistance.levenshtein.normalized_similarity(text.casefold(), other.casefold())
+        >= min_similarity
+    )
+
+
+class TemporalTracker(ABC):
+    """Match detections of consecutive processed frames in yaw/pitch.
+
+    A detection continues a track when their keys are similar and its center
+    is within ``match_angle`` degrees of the track's last position per
+    processed frame since the track was last seen (the camera keeps moving
+    while a sign is missed). Matching is greedy, closest pairs first, one
+    detection per track. A track not seen for ``max_gap`` processed frames is
+    finished.
+
+    Subclasses define how to read a detection (``_describe``) and when two
+    keys name the same thing (``_similar``).
+
+    Args:
+        match_angle: Angular distance in degrees a detection may move
+            between two processed frames.
+        max_gap: Processed frames a track may go unseen before it is finished.
+        min_hits: Drop finished tracks seen in fewer processed frames
+            (single-frame misreads).
+    """
+
+    def __init__(self, match_angle: float = 5.0, max_gap: int = 3, min_hits: int = 1):
+        self.match_angle = match_angle
+        self.max_gap = max_gap
+        self.min_hits = min_hits
+        self.active: List[Track] = []
+        self._step = 0
+
+    @abstractmethod
+    def _describe(self, detection) -> Tuple[str, float, float, float]:
+        """``(key, score, yaw, pitch)`` of a detection."""
+
+    def _similar(self, key: str, other: str) -> bool:
+        return key == other
+
+    def extend(self, frame: int, seconds: float) -> None:
+        """Record a skipped frame: tracks seen in the last processed frame span it too."""
+        for track in self.active:
+            if track._last_step == self._step:
+                track.last_frame, track.last_time = frame, seconds
+
+    def update(self, frame: int, seconds: float, detections: Iterable) -> List[Track]:
+        """Add one processed frame's detections; return the tracks that finished."""
+        self._step += 1
+        described = [(d, *self._describe(d)) for d in detections]
+        matched = self._match(described)
+
+        for j, (detection, key, score, yaw, pitch) in enumerate(described):
+            track = matched.get(j)
+            if track is None:
+                track = Track(detection, key, score, yaw, pitch, frame, seconds)
+                self.active.append(track)
+            else:
+                track.yaw, track.pitch = yaw, pitch
+                track.last_frame, track.last_time = frame, seconds
+                track.hits += 1
+                if score > track.score:
+                    track.best, track.key, track.score = detection, key, score
+            track._last_step = self._step
+
+        finished = [t for t in self.active if self._step - t._last_step >= self.max_gap]
+        self.active = [t for t in self.active if self._step - t._last_step < self.max_gap]
+        return [t for t in finished if t.hits >= self.min_hits]
+
+    def finish(self) -> List[Track]:
+        """End the sequence; return every remaining track."""
+        finished, self.active = self.active, []
+        return [t for t in finished if t.hits >= self.min_hits]
+
+    def _match(self, described: list) -> dict:
+        """``{detection index: track}`` for detections that continue a track."""
+        if not described or not self.active:
+            return {}
+        tracks = unit_vectors([t.yaw for t in self.active], [t.pitch for t in self.active])
+        found = unit_vectors([d[3] for d in described], [d[4] for d in described])
+        angle = np.degrees(np.arccos(np.clip(found @ tracks.T, -1.0, 1.0)))
+        steps = np.array([self._step - t._last_step for t in self.active], dtype=np.float64)
+        candidates = np.argwhere(angle <= self.match_angle * steps)
+
+        matched, used = {}, set()
+        for j, i in sorted(candidates.tolist(), key=lambda ji: angle[ji[0], ji[1]]):
+            if j in matched or i in used:
+                continue
+            if self._similar(self.active[i].key, described[j][1]):
+                matched[j] = self.active[i]
+                used.add(i)
+        return matched
+
+
+class OCRTracker(TemporalTracker):
+    """Track ``SphereOCRResult`` detections by text and position.
+
+    Args:
+        min_text_similarity: Normalized Levenshtein similarity for two reads
+            to be the same text (partial reads of a passing sign differ).
+        **kwargs: ``TemporalTracker`` options.
+    """
+
+    def __init__(self, min_text_similarity: float = 0.6, **kwargs):
+        super().__init__(**kwargs)
+        self.min_text_similarity = min_text_similarity
+
+    def _describe(self, detection):
+        return detection.text, detection.confidence, detection.yaw, detection.pitch
+
+    def _similar(self, key: str, other: str) -> bool:
+        return similar_text(key, other, self.min_text_similarity)
+
+
+class MaskTracker(TemporalTracker):
+    """Track ``SphereMaskResult`` detections by label and center."""
+
+    def _describe(self, detection):
+        return detection.label or "", detection.score, detection.center_yaw, detection.center_pitch
+
+
+# ---------------------------------------------------------------------------
+# Pipelines
+# ---------------------------------------------------------------------------
+
+
+def _stream(frames, skipper, tracker, detect, tracer) -> Iterator[Track]:
+    tracer = tracer or NULL_TRACER
+    for frame, seconds, panorama in frames:
+        tracer.count("frames")
+        with tracer.span("frame_diff", frame=frame) as args:
+            process = skipper is None or skipper.changed(panorama)
+            args["difference"] = skipper.difference if skipper is not None else None
+        if not process:
+            tracer.count("frames_skipped")
+            tracker.extend(frame, seconds)
+            continue
+        detections = detect(panorama)
+        panorama.release()
+        finished = tracker.update(frame, seconds, detections)
+        tracer.count("tracks", len(finished))
+        yield from finished
+    finished = tracker.finish()
+    tracer.count("tracks", len(finished))
+    yield from finished
+
+
+def stream_ocr(
+    pano_ocr,
+    source: Union[str, Iterable[str]],
+    *,
+    every: int = 1,
+    interval: float = 1.0,
+    skipper: Optional[FrameSkipper] = None,
+    tracker: Optional[OCRTracker] = None,
+    tracer=None,
+    **pipeline_kwargs,
+) -> Iterator[Track]:
+    """OCR a frame sequence, yielding each sign once as a ``Track``.
+
+    Args:
+        pano_ocr: Configured ``panoocr.PanoOCR`` instance.
+        source: Video file, frame directory, manifest, or list of frame paths.
+        every: Consider only every ``every``-th frame.
+        interval: Seconds between image frames.
+        skipper: Frame change test. Defaults to ``FrameSkipper()``.
+        tracker: Defaults to ``OCRTracker()``.
+        tracer: Optional ``tracing.Tracer``; adds ``frame_diff`` spans and
+            ``frames`` / ``frames_skipped`` / ``tracks`` counters.
+        **pipeline_kwargs: Passed to ``recognize_panorama`` (``cache``,
+            ``pruner``, ``workers``, ...).
+
+    Yields:
+        Tracks as they finish, then the rest at the end of the sequence.
+    """
+    skipper = skipper if skipper is not None else FrameSkipper()
+    tracker = tracker if tracker is not None else OCRTracker()
+    pipeline_kwargs.setdefault("show_progress", False)
+
+    def detect(panorama):
+        return recognize_panorama(pano_ocr, panorama, tracer=tracer, **pipeline_kwargs).results
+
+    return _stream(iter_frames(source, every, interval), skipper, tracker, detect, tracer)
+
+
+def stream_segmentation(
+    client,
+    source: Union[str, Iterable[str]],
+    prompt,
+    *,
+    every: int = 1,
+    interval: float = 1.0,
+    skipper: Optional[FrameSkipper] = None,
+    tracker: Optional[MaskTracker] = None,
+    tracer=None,
+    **pipeline_kwargs,
+) -> Iterator[Track]:
+    """Segment a frame sequence, yielding each object once as a ``Track``.
+
+    Same as ``stream_ocr``, with ``segment_panorama`` and a ``MaskTracker``;
+    ``prompt`` may be one prompt or several. The masks of several prompts
+    are tracked together, told apart by their labels.
+    """
+    skipper = skipper if skipper is not None else FrameSkipper()
+    tracker = tracker if tracker is not None else MaskTracker()
+    pipeline_kwargs.setdefault("show_progress", False)
+
+    def detect(panorama):
+        result = segment_panorama(client, panorama, prompt, tracer=tracer, **pipeline_kwargs)
+        if isinstance(result, dict):  # several prompts: {prompt: SegmentationResult}
+            return [mask for r in result.values() for mask in r.masks]
+        return result.masks
+
+    return _stream(iter_frames(source, every, interval), skipper, tracker, detect, tracer)
@@ -0,0 +1,655 @@
+"""Persistent text search over OCR results from many panoramas.
+
+A city-wide crawl (Chapter 4) OCR'd with ``batch_ocr.py`` is millions of
+detections across thousands of JSON / JSONL / columnar files; finding every
+"pizza" by scanning them all takes minutes. This module keeps one SQLite
+index instead:
+
+  - an inverted index from normalized words to detections (exact words)
+  - an inverted index from character trigrams to detections (substrings,
+    and fuzzy matches that survive OCR misreads)
+  - an R*Tree over panorama lat/lon (a plain B-tree index where SQLite was
+    built without R*Tree), for bounding-box and radius queries
+  - the yaw / pitch / confidence of every detection and the heading of its
+    panorama, for direction queries
+
+Text is normalized by Unicode compatibility folding, accent stripping and
+case folding, so "Café" matches "CAFE". Ingestion is incremental: files
+already ingested and unchanged are skipped, and a re-OCR'd panorama
+replaces its old detections. Panorama IDs are image file names without the
+extension, which for ``gsv_download`` is the Street View panorama ID, so
+locations can be taken from a ``gsv_crawl`` coverage database.
+
+Example:
+    >>> from pano_utils.text_index import TextIndex
+    >>>
+    >>> index = TextIndex("nyc-text.sqlite")
+    >>> index.ingest(["batch-ocr.jsonl"])
+    >>> index.add_coverage("nyc.sqlite")
+    >>> for m in index.search("pizza", near=(40.7128, -74.0060, 500)):
+    ...     print(m.panorama, m.text, m.yaw, m.pitch, m.confidence)
+
+From the command line::
+
+    python -m pano_utils.text_index ingest nyc-text.sqlite batch-ocr.jsonl --coverage nyc.sqlite
+    python -m pano_utils.text_index search nyc-text.sqlite "pizza" --near 40.7128 -74.0060 500
+"""
+
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import json
+import math
+import os
+import re
+import sqlite3
+import sys
+import time
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .batch import read_jsonl
+from .dedup import wrap_degrees
+from .gsv_route import EARTH_RADIUS_M, distance_m
+
+SEARCH_MODES = ("words", "substring", "fuzzy")
+
+_WORD = re.compile(r"\w+")
+
+
+# ---------------------------------------------------------------------------
+# Text normalization
+# ---------------------------------------------------------------------------
+
+
+def normalize(text: str) -> str:
+    """Fold case, compatibility forms and accents; collapse whitespace."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+def words(normalized: str) -> List[str]:
+    """Distinct words of normalized text."""
+    return list(dict.fromkeys(_WORD.findall(normalized)))
+
+
+def trigrams(normalized: str, padded: bool = True) -> List[str]:
+    """Distinct character trigrams of the words of normalized text.
+
+    Padded the way PostgreSQL's pg_trgm pads (two spaces before each word,
+    one after), so word starts and ends count and short words still have
+    trigrams. Unpadded trigrams lie inside words, so those of any substring
+    of a text are among the text's padded trigrams.
+    """
+    grams = {}
+    for word in words(normalized):
+        if padded:
+            word = f"  {word} "
+        for i in range(len(word) - 2):
+            grams[word[i : i + 3]] = None
+    return list(grams)
+
+
+def _wrap_degrees(angle: Optional[float]) -> Optional[float]:
+    """``dedup.wrap_degrees``, passing NULL / missing angles through."""
+    return None if angle is None else wrap_degrees(angle)
+
+
+# ---------------------------------------------------------------------------
+# Reading result files
+# ---------------------------------------------------------------------------
+
+
+def panorama_id(image_path: str) -> str:
+    """ID of a panorama: its file name without the extension."""
+    return os.path.splitext(os.path.basename(image_path))[0]
+
+
+def read_results(path: str) -> Iterator[Tuple[str, List[dict]]]:
+    """Yield ``(image path, result dicts)`` for each panorama in a results file.
+
+    Reads ``OCRResult.save_json`` files, ``batch_ocr.py`` JSONL (``ok`` lines
+    only) and ``columnar`` OCR files. Other files that share the extensions
+    (label tiles, manifests, segmentation results) have no ``results`` list
+    and yield nothing.
+    """
+    if path.endswith(".jsonl"):
+        for record in read_jsonl(path):
+            if not isinstance(record, dict) or record.get("status", "ok") != "ok":
+                continue
+            if _is_result(record.get("result")) and "image" in record:
+                yield record["image"], record["result"]["results"]
+        return
+
+    with open(path, "rb") as f:
+        head = f.read(8)
+    from .columnar import MAGIC, OCRTable, load_table
+
+    if head == MAGIC:
+        table = load_table(path)
+        if not isinstance(table, OCRTable):
+            return
+        data = table.to_result().to_dict()
+    else:
+        with open(path) as f:
+            data = json.load(f)
+    if _is_result(data):
+        yield data.get("image_path") or path, data["results"]
+
+
+def _is_result(data) -> bool:
+    return isinstance(data, dict) and isinstance(data.get("results"), list)
+
+
+# ---------------------------------------------------------------------------
+# Index
+# ---------------------------------------------------------------------------
+
+_SCHEMA = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+-- A large page cache keeps the inverted indexes' B-trees hot while ingesting.
+PRAGMA cache_size = -262144;
+CREATE TABLE IF NOT EXISTS panoramas (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    image TEXT,
+    lat REAL,
+    lon REAL,
+    heading_deg REAL,
+    indexed_at REAL
+);
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    pano INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    norm TEXT NOT NULL,
+    grams INTEGER NOT NULL,
+    confidence REAL,
+    yaw REAL,
+    pitch REAL,
+    width REAL,
+    height REAL
+);
+CREATE INDEX IF NOT EXISTS detections_pano ON detections (pano);
+CREATE TABLE IF NOT EXISTS words (
+    word TEXT NOT NULL,
+    detection INTEGER NOT NULL,
+    PRIMARY KEY (word, detection)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS trigrams (
+    gram TEXT NOT NULL,
+    detection INTEGER NOT NULL,
+    PRIMARY KEY (gram, detection)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    panoramas INTEGER NOT NULL
+);
+"""
+
+
+@dataclass
+class TextMatch:
+    """One detection returned by ``TextIndex.search``.
+
+    ``bearing`` is the compass direction of the text (panorama heading plus
+    yaw), when the panorama's heading is known. ``score`` is 1 for word and
+    substring matches and the trigram similarity for fuzzy ones.
+    """
+
+    panorama: str
+    image: Optional[str]
+    text: str
+    confidence: float
+    yaw: float
+    pitch: float
+    width: float
+    height: float
+    lat: Optional[float]
+    lon: Optional[float]
+    bearing: Optional[float]
+    score: float
+
+    def to_dict(self) -> dict:
+        return dataclasses.asdict(self)
+
+
+class TextIndex:
+    """SQLite inverted index over OCR detections, with a spatial index.
+
+    Tables:
+        panoramas:  one row per panorama ID, with location and heading
+        detections: one row per OCR detection
+        words:      normalized word → detection
+        trigrams:   normalized character trigram → detection
+        spatial:    R*Tree (or indexed table) of panorama lat/lon
+        sources:    ingested files, to skip unchanged ones
+
+    Args:
+        path: Index database file (created if missing).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.executescript(_SCHEMA)
+        try:
+            self._db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS spatial "
+                "USING rtree(id, min_lat, max_lat, min_lon, max_lon)"
+            )
+        except sqlite3.OperationalError:  # SQLite built without R*Tree
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS spatial (
+                    id INTEGER PRIMARY KEY, min_lat REAL, max_lat REAL, min_lon REAL, max_lon REAL
+                );
+                CREATE INDEX IF NOT EXISTS spatial_location ON spatial (min_lat, min_lon);
+                """
+            )
+        self._db.create_function("distance_m", 4, distance_m, deterministic=True)
+        self._db.create_function("wrap_degrees", 1, _wrap_degrees, deterministic=True)
+
+    def close(self) -> None:
+        self._db.close()
+
+    # -- ingestion ----------------------------------------------------------
+
+    def _panorama(self, key: str, image: Optional[str] = None) -> int:
+        self._db.execute(
+            "INSERT INTO panoramas (key, image) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET image = COALESCE(excluded.image, image)",
+            (key, image),
+        )
+        return self._db.execute("SELECT id FROM panoramas WHERE key = ?", (key,)).fetchone()[0]
+
+    def _remove_detections(self, pano: int) -> None:
+        # Delete index rows by primary key, recomputed from the stored text,
+        # so the index tables need no secondary index on detection.
+        rows = self._db.execute("SELECT id, norm FROM detections WHERE pano = ?", (pano,)).fetchall()
+        self._db.executemany(
+            "DELETE FROM words WHERE word = ? AND detection = ?",
+            [(w, i) for i, norm in rows for w in words(norm)],
+        )
+        self._db.executemany(
+            "DELETE FROM trigrams WHERE gram = ? AND detection = ?",
+            [(g, i) for i, norm in rows for g in trigrams(norm)],
+        )
+        self._db.execute("DELETE FROM detections WHERE pano = ?", (pano,))
+
+    def _add_panorama(self, image: str, results: Sequence[dict]) -> int:
+        pano = self._panorama(panorama_id(image), image)
+        self._remove_detections(pano)
+        # Assign detection IDs up front so every table is one executemany.
+        first = self._db.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM detections").fetchone()[0]
+        detection_rows, word_rows, gram_rows = [], [], []
+        for detection, r in enumerate(results, first):
+            norm = normalize(r["text"])
+            grams = trigrams(norm)
+            detection_rows.append(
+                (
+                    detection,
+                    pano,
+                    r["text"],
+                    norm,
+                    len(grams),
+                    r.get("confidence"),
+                    _wrap_degrees(r.get("yaw")),
+                    r.get("pitch"),
+                    r.get("width"),
+                    r.get("height"),
+                )
+            )
+            word_rows.extend((w, detection) for w in words(norm))
+            gram_rows.extend((g, detection) for g in grams)
+        self._db.executemany(
+            "INSERT INTO detections VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", detection_rows
+        )
+        self._db.executemany("INSERT OR IGNORE INTO words VALUES (?, ?)", word_rows)
+        self._db.executemany("INSERT OR IGNORE INTO trigrams VALUES (?, ?)", gram_rows)
+        self._db.execute("UPDATE panoramas SET indexed_at = ? WHERE id = ?", (time.time(), pano))
+        return len(results)
+
+    def add_results(self, image: str, results: Sequence[dict]) -> int:
+        """Index one panorama's result dicts, replacing any earlier ones.
+
+        Returns:
+            Number of detections indexed.
+        """
+        self._db.execute("BEGIN")
+        try:
+            count = self._add_panorama(image, results)
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+        return count
+
+    def ingest(self, paths: Iterable[str], force: bool = False) -> dict:
+        """Index result files, skipping files unchanged since they were ingested.
+
+        Each file is ingested in one transaction, so an interrupted run
+        leaves every file either fully indexed or not at all.
+
+        Args:
+            paths: Result files (JSON, batch JSONL or columnar) or
+                directories searched for them.
+            force: Re-ingest unchanged files too.
+
+        Returns:
+            Counts of ``files`` ingested, ``skipped``, ``panoramas`` and
+            ``detections``.
+        """
+        counts = {"files": 0, "skipped": 0, "panoramas": 0, "detections": 0}
+        for path in _result_files(paths):
+            stat = os.stat(path)
+            key = os.path.abspath(path)
+            seen = self._db.execute(
+                "SELECT size, mtime_ns FROM sources WHERE path = ?", (key,)
+            ).fetchone()
+            if not force and seen == (stat.st_size, stat.st_mtime_ns):
+                counts["skipped"] += 1
+                continue
+
+            self._db.execute("BEGIN")
+            try:
+                panoramas = 0
+                for image, results in read_results(path):
+                    counts["detections"] += self._add_panorama(image, results)
+                    panoramas += 1
+                self._db.execute(
+                    "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)",
+                    (key, stat.st_size, stat.st_mtime_ns, panoramas),
+                )
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            counts["files"] += 1
+            counts["panoramas"] += panoramas
+        return counts
+
+    def set_locations(self, locations: Iterable[Tuple[str, float, float, Optional[float]]]) -> int:
+        """Set ``(panorama ID, lat, lon, heading_deg)`` for panoramas.
+
+        Panoramas not indexed yet are created, so locations can be loaded
+        before or after their OCR results.
+
+        Returns:
+            Number of locations written.
+        """
+        count = 0
+        self._db.execute("BEGIN")
+        for key, lat, lon, heading in locations:
+            pano = self._panorama(key)
+            self._db.execute(
+                "UPDATE panoramas SET lat = ?, lon = ?, heading_deg = ? WHERE id = ?",
+                (lat, lon, heading, pano),
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO spatial VALUES (?, ?, ?, ?, ?)", (pano, lat, lat, lon, lon)
+            )
+            count += 1
+        self._db.execute("COMMIT")
+        return count
+
+    def add_coverage(self, coverage_path: str) -> int:
+        """Load locations and headings from a ``gsv_crawl`` coverage database."""
+        coverage = sqlite3.connect(coverage_path)
+        try:
+            rows = coverage.execute("SELECT id, lat, lon, heading_deg FROM panoramas").fetchall()
+        finally:
+            coverage.close()
+        return self.set_locations(rows)
+
+    def stats(self) -> Dict[str, int]:
+        """Number of panoramas, located panoramas, detections and distinct words."""
+        queries = {
+            "panoramas": "SELECT COUNT(*) FROM panoramas",
+            "located": "SELECT COUNT(*) FROM panoramas WHERE lat IS NOT NULL",
+            "detections": "SELECT COUNT(*) FROM detections",
+            "words": "SELECT COUNT(DISTINCT word) FROM words",
+        }
+        return {name: self._db.execute(sql).fetchone()[0] for name, sql in queries.items()}
+
+    # -- queries ------------------------------------------------------------
+
+    def search(
+        self,
+        query: str,
+        *,
+        mode: str = "words",
+        min_similarity: float = 0.5,
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+        near: Optional[Tuple[float, float, float]] = None,
+        yaw_range: Optional[Tuple[float, float]] = None,
+        bearing_range: Optional[Tuple[float, float]] = None,
+        min_confidence: float = 0.0,
+        limit: Optional[int] = 100,
+    ) -> List[TextMatch]:
+        """Find detections by text, location and direction.
+
+        Args:
+            query: Text to look for.
+            mode: ``"words"``: every word of the query appears as a word;
+                ``"substring"``: the query appears anywhere in the text;
+                ``"fuzzy"``: trigram similarity of at least ``min_similarity``.
+            min_similarity: Jaccard similarity of trigram sets, for fuzzy mode.
+            bbox: ``(min_lat, min_lon, max_lat, max_lon)``.
+            near: ``(lat, lon, radius_m)``.
+            yaw_range: ``(start, end)`` yaw in degrees relative to the
+                panorama center; ``start > end`` wraps across ±180°.
+            bearing_range: ``(start, end)`` compass bearing in degrees
+                (panorama heading + yaw), wrapping like ``yaw_range``.
+            min_confidence: Minimum OCR confidence.
+            limit: Maximum matches, best first (None for all).
+
+        Returns:
+            Matches ordered by score, then confidence.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"mode must be one of {SEARCH_MODES}, not {mode!r}")
+        norm = normalize(query)
+        hits = self._hits(norm, mode, min_similarity)
+        if hits is None:
+            return []
+        hits_sql, params = hits
+
+        where, join = ["d.confidence >= ?"], ""
+        params.append(min_confidence)
+        if near is not None:
+            lat, lon, radius = near
+            dlat = math.degrees(radius / EARTH_RADIUS_M)
+            dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+            bbox = _intersect(bbox, (lat - dlat, lon - dlon, lat + dlat, lon + dlon))
+            where.append("distance_m(p.lat, p.lon, ?, ?) <= ?")
+            params.extend((lat, lon, radius))
+        if bbox is not None:
+            join = "JOIN spatial s ON s.id = p.id"
+            where.append("s.max_lat >= ? AND s.min_lat <= ? AND s.max_lon >= ? AND s.min_lon <= ?")
+            params.extend((bbox[0], bbox[2], bbox[1], bbox[3]))
+        if yaw_range is not None:
+            _add_range(where, params, "d.yaw", yaw_range)
+        if bearing_range is not None:
+            _add_range(where, params, "wrap_degrees(p.heading_deg + d.yaw)", bearing_range)
+        if mode == "substring":
+            where.append("instr(d.norm, ?) > 0")
+            params.append(norm)
+
+        sql = f"""
+            WITH hits (detection, score) AS ({hits_sql})
+            SELECT p.key, p.image, d.text, d.confidence, d.yaw, d.pitch, d.width, d.height,
+                   p.lat, p.lon, wrap_degrees(p.heading_deg + d.yaw), hits.score
+            FROM hits
+            JOIN detections d ON d.id = hits.detection
+            JOIN panoramas p ON p.id = d.pano
+            {join}
+            WHERE {" AND ".join(where)}
+            ORDER BY hits.score DESC, d.confidence DESC
+        """
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [TextMatch(*row) for row in self._db.execute(sql, params)]
+
+    def _hits(self, norm: str, mode: str, min_similarity: float) -> Optional[Tuple[str, list]]:
+        """SQL selecting ``(detection, score)`` candidates, or None if nothing can match."""
+        grams = trigrams(norm, padded=mode == "fuzzy")
+        if mode == "words" or (mode == "substring" and not grams):
+            terms = words(norm)
+            if not terms:
+                return None
+            if mode == "substring":
+                # Too short for trigrams: match word prefixes instead.
+                return "SELECT DISTINCT detection, 1.0 FROM words WHERE word >= ? AND word < ?", [
+                    terms[0],
+                    terms[0] + "\U0010ffff",
+                ]
+            marks = ", ".join("?" * len(terms))
+            return (
+                f"SELECT detection, 1.0 FROM words WHERE word IN ({marks}) "
+                f"GROUP BY detection HAVING COUNT(*) = {len(terms)}",
+                list(terms),
+            )
+        if not grams:
+            return None
+        marks = ", ".join("?" * len(grams))
+        if mode == "substring":
+            return (
+                f"SELECT detection, 1.0 FROM trigrams WHERE gram IN ({marks}) "
+                f"GROUP BY detection HAVING COUNT(*) = {len(grams)}",
+                list(grams),
+            )
+        # Fuzzy: Jaccard similarity of the trigram sets. A detection needs at
+        # least this many shared trigrams to reach min_similarity at all.
+        least = max(1, math.ceil(min_similarity * len(grams)))
+        return (
+            f"""
+            SELECT t.detection, t.shared * 1.0 / ({len(grams)} + d2.grams - t.shared)
+            FROM (
+                SELECT detection, COUNT(*) AS shared FROM trigrams WHERE gram IN ({marks})
+                GROUP BY detection HAVING COUNT(*) >= {least}
+            ) t JOIN detections d2 ON d2.id = t.detection
+            WHERE t.shared * 1.0 / ({len(grams)} + d2.grams - t.shared) >= ?
+            """,
+            list(grams) + [min_similarity],
+        )
+
+
+def _result_files(paths: Iterable[str]) -> Iterator[str]:
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            # Label tile pyramids (label_tiles.py) are written next to the
+            # results as <name>-tiles/: thousands of JSON files, none of them OCR.
+            dirs[:] = sorted(d for d in dirs if not d.endswith("-tiles"))
+            for name in sorted(files):
+                if name.endswith((".json", ".jsonl", ".pcol")):
+                    yield os.path.join(root, name)
+
+
+def _add_range(where: list, params: list, column: str, bounds: Tuple[float, float]) -> None:
+    """Range condition on an angle stored in [-180, 180).
+
+    Bounds are wrapped the same way, so ``(170, 190)`` is ``(170, -170)``;
+    ``start > end`` then selects across ±180°.
+    """
+    start, end = bounds
+    if end - start >= 360.0:
+        return
+    start, end = wrap_degrees(start), wrap_degrees(end)
+    if start <= end:
+        where.append(f"{column} BETWEEN ? AND ?")
+    else:
+        where.append(f"({column} >= ? OR {column} <= ?)")
+    params.extend((start, end))
+
+
+def _intersect(a, b):
+    if a is None:
+        return b
+    return (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+
+
+# ---------------------------------------------------------------------------
+# Command line
+# ---------------------------------------------------------------------------
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m pano_utils.text_index", description="Index and search OCR results."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="Add result files to an index")
+    ingest.add_argument("index", help="Index database")
+    ingest.add_argument("paths", nargs="*", help="Result JSON / JSONL / columnar files or directories")
+    ingest.add_argument("--coverage", help="gsv_crawl database to take locations from")
+    ingest.add_argument("--force", action="store_true", help="Re-ingest unchanged files")
+
+    search = commands.add_parser("search", help="Search an index")
+    search.add_argument("index", help="Index database")
+    search.add_argument("query")
+    search.add_argument("--mode", choices=SEARCH_MODES, default="words")
+    search.add_argument("--min-similarity", type=float, default=0.5)
+    search.add_argument("--bbox", type=float, nargs=4, metavar=("MIN_LAT", "MIN_LON", "MAX_LAT", "MAX_LON"))
+    search.add_argument("--near", type=float, nargs=3, metavar=("LAT", "LON", "RADIUS_M"))
+    search.add_argument("--yaw", type=float, nargs=2, metavar=("START", "END"))
+    search.add_argument("--bearing", type=float, nargs=2, metavar=("START", "END"))
+    search.add_argument("--min-confidence", type=float, default=0.0)
+    search.add_argument("--limit", type=int, default=20)
+    search.add_argument("--json", action="store_true", help="Print matches as JSON lines")
+    args = parser.parse_args(argv)
+
+    index = TextIndex(args.index)
+    try:
+        if args.command == "ingest":
+            start = time.perf_counter()
+            counts = index.ingest(args.paths)
+            located = index.add_coverage(args.coverage) if args.coverage else 0
+            print(
+                f"Ingested {counts['detections']:,} detections from {counts['panoramas']:,} panoramas "
+                f"in {counts['files']} files ({counts['skipped']} unchanged), "
+                f"{located:,} locations, in {time.perf_counter() - start:.1f}s"
+            )
+            print(index.stats())
+            return
+
+        start = time.perf_counter()
+        matches = index.search(
+            args.query,
+            mode=args.mode,
+            min_similarity=args.min_similarity,
+            bbox=args.bbox,
+            near=args.near,
+            yaw_range=args.yaw,
+            bearing_range=args.bearing,
+            min_confidence=args.min_confidence,
+            limit=args.limit,
+        )
+        elapsed = time.perf_counter() - start
+        for m in matches:
+            if args.json:
+                print(json.dumps(m.to_dict()))
+            else:
+                where = f"{m.lat:.5f},{m.lon:.5f}" if m.lat is not None else "-"
+                print(
+                    f"{m.text[:30]:<32} {m.panorama:<24} {where:<22} "
+                    f"yaw {m.yaw:>6.1f} pitch {m.pitch:>5.1f} conf {m.confidence:.2f}"
+                )
+        print(f"{len(matches)} matches in {elapsed * 1000:.1f} ms", file=sys.stderr)
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Per-stage timing and tracing for the OCR / segmentation pipelines.
+
+When a panorama is slow, the question is *which* part: decoding the image,
+projecting views, the model itself, converting results to the sphere, or
+deduplication. The pipelines in ``pano_utils.pipeline`` accept a
+``tracer=`` that records:
+
+  - a span per stage and per view (``remap``, ``decode``, ``project``,
+    ``wait``, ``inference``, ``to_sphere``, ``dedup``), on the thread that
+    ran it
+  - counters: views processed, detections / masks before and after dedup
+  - the process's peak resident memory as it grows
+
+Every finished event is passed to the tracer's callbacks as it happens, so
+live dashboards or log lines can hook in. ``summary()`` aggregates spans per
+stage, and ``save_chrome_trace()`` writes a trace that ``chrome://tracing``
+or https://ui.perfetto.dev opens directly, with one row per thread.
+
+Without a tracer, the pipelines use ``NULL_TRACER``, which records nothing.
+
+Example:
+    >>> from pano_utils.pipeline import recognize_panorama
+    >>> from pano_utils.tracing import Tracer
+    >>>
+    >>> tracer = Tracer(callbacks=[lambda e: print(e["name"], e.get("dur"))])
+    >>> result = recognize_panorama(pano_ocr, "pano.jpg", tracer=tracer)
+    >>> tracer.summary()["inference"]
+    {'count': 16, 'total': 3.1, 'mean': 0.19, 'max': 0.4}
+    >>> tracer.save_chrome_trace("pano.trace.json")
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident memory of this process in MB (None where unavailable)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return rss / (1024**2 if sys.platform == "darwin" else 1024)
+
+
+class Tracer:
+    """Collect timed spans and counters from the pipelines.
+
+    Events use the Chrome trace event format: spans are complete (``"X"``)
+    events with ``ts`` / ``dur`` in microseconds since the tracer was created,
+    counters are ``"C"`` events. Safe to use from several threads.
+
+    Args:
+        callbacks: Functions called with each event dict as it is recorded.
+        track_memory: Record a ``peak_rss_mb`` counter whenever the process's
+            peak memory grows (checked at the end of each span).
+
+    Attributes:
+        events: Every recorded event, in order of completion.
+        counters: Current value of each counter.
+        peak_rss_mb: Highest peak memory seen, in MB.
+    """
+
+    def __init__(self, callbacks: Sequence[Callable[[dict], None]] = (), track_memory: bool = True):
+        self.callbacks: List[Callable[[dict], None]] = list(callbacks)
+        self.track_memory = track_memory
+        self.events: List[dict] = []
+        self.counters: Dict[str, float] = {}
+        self.peak_rss_mb: Optional[float] = None
+        self._origin = time.perf_counter_ns()
+        self._threads: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def _now(self) -> float:
+        return (time.perf_counter_ns() - self._origin) / 1000.0
+
+    def _record(self, event: dict) -> None:
+        thread = threading.current_thread()
+        event.setdefault("pid", os.getpid())
+        event.setdefault("tid", thread.ident)
+        with self._lock:
+            self._threads.setdefault(thread.ident, thread.name)
+            self.events.append(event)
+        for callback in self.callbacks:
+            callback(event)
+
+    @contextlib.contextmanager
+    def span(self, name: str, cat: str = "pipeline", **args) -> Iterator[dict]:
+        """Time the enclosed block as one stage.
+
+        Yields the event's ``args`` dict, so the block can attach results
+        (e.g. ``args["detections"] = len(results)``).
+        """
+        start = self._now()
+        try:
+            yield args
+        finally:
+            self._record(
+                {"name": name, "cat": cat, "ph": "X", "ts": start, "dur": self._now() - start, "args": args}
+            )
+            if self.track_memory:
+                self._check_memory()
+
+    def count(self, name: str, value: float = 1) -> None:
+        """Add ``value`` to a counter and record its new total."""
+        with self._lock:
+            total = self.counters[name] = self.counters.get(name, 0) + value
+        self._record({"name": name, "cat": "counter", "ph": "C", "ts": self._now(), "args": {name: total}})
+
+    def _check_memory(self) -> None:
+        peak = peak_rss_mb()
+        if peak is None or (self.peak_rss_mb is not None and peak <= self.peak_rss_mb):
+            return
+        self.peak_rss_mb = peak
+        self._record(
+            {"name": "peak_rss_mb", "cat": "memory", "ph": "C", "ts": self._now(), "args": {"peak_rss_mb": round(peak, 1)}}
+        )
+
+    def spans(self, name: Optional[str] = None) -> List[dict]:
+        """Recorded spans, optionally only those called ``name``."""
+        with self._lock:
+            return [e for e in self.events if e["ph"] == "X" and (name is None or e["name"] == name)]
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Per-stage ``count`` and ``total`` / ``mean`` / ``max`` seconds."""
+        stages: Dict[str, List[float]] = {}
+        for event in self.spans():
+            stages.setdefault(event["name"], []).append(event["dur"] / 1e6)
+        return {
+            name: {
+                "count": len(durations),
+                "total": sum(durations),
+                "mean": sum(durations) / len(durations),
+                "max": max(durations),
+            }
+            for name, durations in stages.items()
+        }
+
+    def chrome_trace(self) -> dict:
+        """The events as a Chrome trace object, with thread names."""
+        pid = os.getpid()
+        with self._lock:
+            names = [
+                {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                for tid, name in self._threads.items()
+            ]
+            events = list(self.events)
+        return {"traceEvents": names + events, "displayTimeUnit": "ms"}
+
+    def save_chrome_trace(self, path: str) -> None:
+        """Write the trace as JSON for chrome://tracing or Perfetto."""
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+class _NullTracer:
+    """Tracer stand-in that records nothing."""
+
+    @contextlib.contextmanager
+    def span(self, name: str, cat: str = "pipeline", **args) -> Iterator[dict]:
+        yield args
+
+    def count(self, name: str, value: float = 1) -> None:
+        pass
+
+
+NULL_TRACER = _NullTracer()
@@ -0,0 +1,284 @@
+"""Split capture sessions into perspective views for 3D reconstruction.
+
+COLMAP, Polycam, Postshot and friends want pinhole photos, so every
+equirectangular panorama of a scan gets cut into 6–18 perspective views.
+Doing that with ``generate_perspective_image`` per view recomputes the
+spherical sampling grid for every view of every panorama. Here:
+
+  - all same-size panoramas share one remap table per view
+    (``projection.RemapCache``), so a view is a single ``cv2.remap``
+  - panoramas are split on a thread pool; decoding, remapping and JPEG
+    encoding all release the GIL, and each view is written to disk as soon
+    as it is encoded, so memory stays at a few panoramas
+  - only the rows the views sample are decoded (``Panorama.band``)
+  - a rerun skips panoramas whose views all exist
+  - ``write_colmap_rig`` writes the exact pinhole intrinsics and the rotation
+    of every view relative to the first, as a COLMAP rig config and a
+    ``cameras.txt``, so COLMAP (3.12+) can solve each panorama's views as
+    one rigid rig instead of as unrelated photos
+
+Views are written as ``<output>/<view name>/<panorama name>.jpg``: one
+folder per virtual camera, the layout COLMAP's rig tools expect.
+
+Example:
+    >>> from pano_utils.view_export import export_views, rig_perspectives
+    >>>
+    >>> views = rig_perspectives(yaws=range(0, 360, 60), pitches=(30, 0, -30), fov=90, resolution=1000)
+    >>> stats = export_views("my_panoramas/", "perspective_views/", views, workers=8)
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+from .batch import find_panoramas, write_atomic
+from .panorama import Panorama
+from .projection import RemapCache, project
+
+# ---------------------------------------------------------------------------
+# Views
+# ---------------------------------------------------------------------------
+
+
+def rig_perspectives(
+    yaws: Iterable[float] = (0, 60, 120, 180, 240, 300),
+    pitches: Iterable[float] = (30, 0, -30),
+    fov: float = 90,
+    resolution: int = 1000,
+) -> list:
+    """Square views at every (pitch, yaw) combination.
+
+    Pitch is degrees above the horizon (pano-splitter's 60° / 90° / 120° are
+    30 / 0 / -30 here); yaw is degrees clockwise from the panorama's center.
+
+    Returns:
+        ``panoocr`` PerspectiveMetadata list, pitch-major.
+    """
+    from panoocr.image.models import PerspectiveMetadata
+
+    return [
+        PerspectiveMetadata(
+            pixel_width=resolution,
+            pixel_height=resolution,
+            horizontal_fov=fov,
+            vertical_fov=fov,
+            yaw_offset=float(yaw),
+            pitch_offset=float(pitch),
+        )
+        for pitch in pitches
+        for yaw in yaws
+    ]
+
+
+def view_name(perspective) -> str:
+    """Folder name for a view, e.g. ``yaw060_pitch+30``."""
+    return f"yaw{perspective.yaw_offset % 360:03.0f}_pitch{perspective.pitch_offset:+03.0f}"
+
+
+def frame_names(paths: Sequence[str]) -> List[str]:
+    """Output file stem for each panorama: its file name, or its path if names repeat."""
+    stems = [os.path.splitext(os.path.basename(p))[0] for p in paths]
+    if len(set(stems)) == len(stems):
+        return stems
+    root = os.path.commonpath([os.path.abspath(p) for p in paths])
+    return [
+        os.path.splitext(os.path.relpath(os.path.abspath(p), root))[0].replace(os.sep, "_")
+        for p in paths
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Camera model
+# ---------------------------------------------------------------------------
+
+# Our camera frame is x right, y up, z forward; COLMAP's is x right, y down.
+_FLIP_Y = np.diag([1.0, -1.0, 1.0])
+
+
+def intrinsics(perspective) -> tuple:
+    """COLMAP ``PINHOLE`` parameters ``(fx, fy, cx, cy)`` of a view.
+
+    Matches ``projection.sample_sphere_grid``: the image spans the full FOV
+    edge to edge, with pixel centers at half-integers.
+    """
+    width, height = perspective.pixel_width, perspective.pixel_height
+    fx = width / (2 * math.tan(math.radians(perspective.horizontal_fov) / 2))
+    fy = height / (2 * math.tan(math.radians(perspective.vertical_fov) / 2))
+    return fx, fy, width / 2, height / 2
+
+
+def world_from_camera(perspective) -> np.ndarray:
+    """3×3 rotation from COLMAP camera axes to panorama axes (x east, y down, z north)."""
+    pitch = math.radians(perspective.pitch_offset)
+    yaw = math.radians(perspective.yaw_offset)
+    # The same rotations as projection.sample_sphere_grid: pitch about x, then yaw about y.
+    rotate_pitch = np.array(
+        [[1, 0, 0], [0, math.cos(pitch), math.sin(pitch)], [0, -math.sin(pitch), math.cos(pitch)]]
+    )
+    rotate_yaw = np.array(
+        [[math.cos(yaw), 0, math.sin(yaw)], [0, 1, 0], [-math.sin(yaw), 0, math.cos(yaw)]]
+    )
+    return _FLIP_Y @ rotate_yaw @ rotate_pitch @ _FLIP_Y
+
+
+def _quaternion(rotation: np.ndarray) -> List[float]:
+    """``[qw, qx, qy, qz]`` of a rotation matrix (COLMAP order, qw >= 0)."""
+    from scipy.spatial.transform import Rotation
+
+    x, y, z, w = Rotation.from_matrix(rotation).as_quat()
+    q = np.array([w, x, y, z]) * (1 if w >= 0 else -1)
+    return [float(v) for v in q]
+
+
+def write_colmap_rig(output_dir: str, perspectives: Sequence) -> Dict[str, str]:
+    """Describe the views as one COLMAP camera rig.
+
+    Writes ``rig_config.json`` for ``colmap rig_configurator`` (the first
+    view is the reference sensor; every other view gets its exact
+    ``cam_from_rig`` rotation and zero translation, since all views share
+    the panorama's center) and ``cameras.txt`` in COLMAP's text format with
+    one ``PINHOLE`` camera per view, in view order.
+
+    Returns:
+        Paths of the written files, by name.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rig_from_world = world_from_camera(perspectives[0]).T
+    cameras = []
+    for i, perspective in enumerate(perspectives):
+        camera = {
+            "image_prefix": f"{view_name(perspective)}/",
+            "camera_model_name": "PINHOLE",
+            "camera_params": list(intrinsics(perspective)),
+        }
+        if i == 0:
+            camera["ref_sensor"] = True
+        else:
+            cam_from_rig = world_from_camera(perspective).T @ rig_from_world.T
+            camera["cam_from_rig_rotation"] = _quaternion(cam_from_rig)
+            camera["cam_from_rig_translation"] = [0.0, 0.0, 0.0]
+        cameras.append(camera)
+
+    rig_path = os.path.join(output_dir, "rig_config.json")
+    with open(rig_path, "w") as f:
+        json.dump([{"cameras": cameras}], f, indent=2)
+
+    cameras_path = os.path.join(output_dir, "cameras.txt")
+    with open(cameras_path, "w") as f:
+        f.write("# Camera list with one line of data per camera:\n")
+        f.write("#   CAMERA_ID, MODEL, WIDTH, HEIGHT, PARAMS[]\n")
+        f.write(f"# Number of cameras: {len(perspectives)}\n")
+        for i, perspective in enumerate(perspectives, 1):
+            params = " ".join(f"{v:.10g}" for v in intrinsics(perspective))
+            f.write(f"{i} PINHOLE {perspective.pixel_width} {perspective.pixel_height} {params}\n")
+    return {"rig_config": rig_path, "cameras": cameras_path}
+
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+
+def _export_one(
+    image_path: str, name: str, output_dir: str, perspectives: Sequence, cache: RemapCache, quality: int
+) -> dict:
+    start = time.perf_counter()
+    panorama = Panorama(image_path)
+    rows, top = panorama.band(perspectives, cache)
+    written = 0
+    for perspective in perspectives:
+        view = project(rows, perspective, cache, row_offset=top, pano_height=panorama.height)
+        buffer = io.BytesIO()
+        Image.fromarray(view).save(buffer, "JPEG", quality=quality)
+        write_atomic(os.path.join(output_dir, view_name(perspective), f"{name}.jpg"), buffer.getvalue())
+        written += buffer.tell()
+    return {"image": image_path, "views": len(perspectives), "bytes": written, "elapsed": time.perf_counter() - start}
+
+
+def export_views(
+    source,
+    output_dir: str,
+    perspectives: Optional[Sequence] = None,
+    *,
+    workers: Optional[int] = None,
+    quality: int = 90,
+    cache: Optional[RemapCache] = None,
+    resume: bool = True,
+    colmap: bool = True,
+    on_panorama: Optional[Callable[[dict], None]] = None,
+) -> dict:
+    """Split every panorama of a session into perspective JPEGs.
+
+    Args:
+        source: Directory or manifest (see ``batch.find_panoramas``), or a
+            list of panorama paths.
+        output_dir: Root of the ``<view>/<panorama>.jpg`` tree.
+        perspectives: Views to cut. Defaults to ``rig_perspectives()``
+            (18 views: 6 yaws × 3 pitches at 90°, 1000 px).
+        workers: Panoramas split at once. Defaults to the CPU count.
+        quality: JPEG quality.
+        cache: Remap tables to share. Defaults to a new in-memory cache
+            large enough for every view.
+        resume: Skip panoramas whose views all exist already.
+        colmap: Also write ``rig_config.json`` and ``cameras.txt``.
+        on_panorama: Called with a record dict after each panorama.
+
+    Returns:
+        Counters: ``panoramas``, ``skipped``, ``images``, ``bytes``, ``seconds``.
+    """
+    paths = find_panoramas(source) if isinstance(source, str) else list(source)
+    perspectives = list(perspectives) if perspectives is not None else rig_perspectives()
+    names = [view_name(p) for p in perspectives]
+    if len(set(names)) != len(names):
+        raise ValueError("two views share a yaw/pitch; their images would overwrite each other")
+    if cache is None:
+        cache = RemapCache(maxsize=max(64, len(perspectives)))
+    workers = workers or os.cpu_count() or 1
+
+    for name in names:
+        os.makedirs(os.path.join(output_dir, name), exist_ok=True)
+    if colmap:
+        write_colmap_rig(output_dir, perspectives)
+
+    stats = {"panoramas": 0, "skipped": 0, "images": 0, "bytes": 0, "seconds": 0.0}
+    start = time.perf_counter()
+    todo = []
+    for path, frame in zip(paths, frame_names(paths)):
+        done = resume and all(
+            os.path.exists(os.path.join(output_dir, name, f"{frame}.jpg")) for name in names
+        )
+        if done:
+            stats["skipped"] += 1
+        else:
+            todo.append((path, frame))
+
+    def finished(record: dict) -> None:
+        stats["panoramas"] += 1
+        stats["images"] += record["views"]
+        stats["bytes"] += record["bytes"]
+        if on_panorama is not None:
+            on_panorama(record)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export") as pool:
+        # Keep only a few panoramas in flight, so memory does not grow with the session.
+        pending = set()
+        for path, frame in todo:
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finished(future.result())
+            pending.add(pool.submit(_export_one, path, frame, output_dir, perspectives, cache, quality))
+        for future in pending:
+            finished(future.result())
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
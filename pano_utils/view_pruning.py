@@ -0,0 +1,175 @@
+"""Skip empty views before running OCR or segmentation on them.
+
+Every preset processes every view, including ones that only see sky, a
+blank wall, the car roof or the tripod at the nadir. Whether a view has
+*anything* in it can be judged from a tiny version of it, so a pre-pass:
+
+  - downsamples the panorama once (1024 px wide by default)
+  - projects each view at that density (a few hundred pixels across)
+  - scores it by edge density or intensity spread in its busiest cell, or
+    by a text-like-blob heuristic
+
+Views scoring under the threshold are skipped before full-resolution
+projection and inference. ``ViewPruner`` keeps the per-view scores of its
+last run, so the threshold can be tuned against recall on your own imagery.
+
+Example:
+    >>> from pano_utils.pipeline import recognize_panorama
+    >>> from pano_utils.view_pruning import ViewPruner
+    >>>
+    >>> pruner = ViewPruner(method="edges", threshold=0.01)
+    >>> result = recognize_panorama(pano_ocr, "pano.jpg", pruner=pruner)
+    >>> print(f"skipped {pruner.skipped} views", pruner.scores.round(3))
+"""
+
+from __future__ import annotations
+
+from typing import List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from .projection import RemapCache, project, scale_perspectives
+
+# Thresholds that drop clear sky, blank walls and flat ground while keeping
+# anything with visible structure. Lower them if views with faint, small
+# text get skipped.
+DEFAULT_THRESHOLDS = {
+    "edges": 0.02,
+    "variance": 0.03,
+    "text": 0.001,
+}
+
+# Edge and variance scores are taken over a GRID x GRID split of the view and
+# the busiest cell wins, so one small object in an otherwise empty view still
+# keeps it.
+GRID = 4
+
+
+def _gray(view: np.ndarray) -> np.ndarray:
+    return cv2.cvtColor(view, cv2.COLOR_RGB2GRAY) if view.ndim == 3 else view
+
+
+def _cell_means(values: np.ndarray) -> np.ndarray:
+    """Mean of ``values`` over each cell of a GRID x GRID split."""
+    return cv2.resize(values.astype(np.float32), (GRID, GRID), interpolation=cv2.INTER_AREA)
+
+
+def edge_density(view: np.ndarray) -> float:
+    """Fraction of pixels on a Canny edge (in any channel), in the busiest cell."""
+    channels = cv2.split(view) if view.ndim == 3 else [view]
+    edges = np.zeros(view.shape[:2], dtype=bool)
+    for channel in channels:
+        edges |= cv2.Canny(channel, 50, 150) > 0
+    return float(_cell_means(edges).max())
+
+
+def intensity_spread(view: np.ndarray) -> float:
+    """Standard deviation (0-1) of the most varied channel, in the busiest cell."""
+    view = view.astype(np.float32) / 255.0
+    if view.ndim == 2:
+        view = view[..., None]
+    spreads = [
+        np.sqrt(np.maximum(_cell_means(c * c) - _cell_means(c) ** 2, 0))
+        for c in np.moveaxis(view, -1, 0)
+    ]
+    return float(np.max(spreads))
+
+
+def text_likeness(view: np.ndarray) -> float:
+    """Fraction of the view covered by text-like blobs.
+
+    Classic morphology heuristic: strong local gradients, closed along rows
+    into word-shaped components that are wider than tall and densely filled.
+    """
+    gray = _gray(view)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+    gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, kernel)
+    if gradient.max() < 32:
+        # Otsu splits any image in two; a flat one has no text at all.
+        return 0.0
+    _, binary = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    words = cv2.morphologyEx(
+        binary, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (9, 1))
+    )
+    count, _, stats, _ = cv2.connectedComponentsWithStats(words, connectivity=8)
+    height = view.shape[0]
+    area = 0
+    for x, y, w, h, pixels in stats[1:count]:
+        if 3 <= h <= height * 0.3 and w >= 1.5 * h and pixels >= 0.4 * w * h:
+            area += pixels
+    return area / view.shape[0] / view.shape[1]
+
+
+SCORERS = {
+    "edges": edge_density,
+    "variance": intensity_spread,
+    "text": text_likeness,
+}
+
+
+class ViewPruner:
+    """Score views on a downsampled panorama and keep those above a threshold.
+
+    Args:
+        method: ``"edges"``, ``"variance"`` or ``"text"``, or a callable
+            taking an RGB view array and returning a score.
+        threshold: Minimum score to keep a view. Defaults to the method's
+            entry in ``DEFAULT_THRESHOLDS`` (0 for a custom callable).
+        width: Width the panorama is downsampled to before scoring.
+        cache: RemapCache for the low-resolution projections.
+
+    Attributes:
+        scores: Per-view scores of the last ``select`` call, in view order.
+        kept: Indices of the views kept by the last ``select`` call.
+        skipped: Number of views skipped by the last ``select`` call.
+    """
+
+    def __init__(
+        self,
+        method="edges",
+        threshold: Optional[float] = None,
+        width: int = 1024,
+        cache: Optional[RemapCache] = None,
+    ):
+        if callable(method):
+            self.scorer = method
+        elif method in SCORERS:
+            self.scorer = SCORERS[method]
+        else:
+            raise ValueError(f"Unknown method {method!r}; expected one of {sorted(SCORERS)}")
+        if threshold is None:
+            threshold = DEFAULT_THRESHOLDS.get(method, 0.0) if isinstance(method, str) else 0.0
+        self.method = method
+        self.threshold = threshold
+        self.width = width
+        self.cache = cache
+        self.scores = np.zeros(0)
+        self.kept: List[int] = []
+        self.skipped = 0
+
+    def score(self, pano_array: np.ndarray, perspectives: Sequence) -> np.ndarray:
+        """Score every view from a downsampled copy of the panorama."""
+        pano_height, pano_width = pano_array.shape[:2]
+        if pano_width > self.width:
+            small = cv2.resize(
+                pano_array,
+                (self.width, max(1, round(self.width * pano_height / pano_width))),
+                interpolation=cv2.INTER_AREA,
+            )
+        else:
+            small = pano_array
+        return np.array(
+            [
+                self.scorer(project(small, view, cache=self.cache))
+                for view in scale_perspectives(perspectives, small.shape[1])
+            ],
+            dtype=np.float64,
+        )
+
+    def select(self, pano_array: np.ndarray, perspectives: Sequence) -> List[int]:
+        """Indices of the views worth processing; also updates the attributes."""
+        self.scores = self.score(pano_array, perspectives)
+        self.kept = np.flatnonzero(self.scores >= self.threshold).tolist()
+        self.skipped = len(perspectives) - len(self.kept)
+        return self.kept